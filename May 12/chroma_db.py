@@ -1,37 +1,229 @@
+import argparse
+import atexit
 import chromadb
 import os
+import sys
 from chromadb.utils import embedding_functions
 
+# Modules shared by all day folders live in ../shared
+SHARED_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "shared")
+if SHARED_DIR not in sys.path:
+    sys.path.insert(0, SHARED_DIR)
+
+from collection_aliases import AliasTable, rebuild_with_alias_swap
+from embedding_warmup import format_warmup_report, warm_up_embedding_function
+from index_snapshot import (export_collection, iter_collection_pages, iter_collection_records,
+                            load_snapshot_into, read_manifest)
+from sharded_store import ShardedStore
+from store_access import (ACCESS_MODE_ENV, ACCESS_MODES, DEFAULT_SNAPSHOT_INTERVAL,
+                          SNAPSHOT_INTERVAL_ENV, SnapshotPublisher, SnapshotReader,
+                          WriterLock, release_chroma_clients, require_writable)
+from text_store import DOC_KEY, TextSideStore
+
 class ChromaDBManager:
     """
     A class to manage ChromaDB operations including initialization and document storage.
+    
+    Call close() (or use the manager as a context manager) when done, so a
+    writer publishes its last writes and releases the store.
     """
     
-    def __init__(self, collection_name="documents", persist_directory="chroma_db"):
+    def __init__(self, collection_name="documents", persist_directory="chroma_db",
+                 num_shards=1, shard_layout="directories", compress_text=False,
+                 model_dir=None, warmup=False, access_mode=None, snapshot_interval=None):
         """
         Initialize the ChromaDB client and collection.
         
         Args:
             collection_name (str): Name of the collection to create or use
             persist_directory (str): Directory to persist the ChromaDB data
+            num_shards (int): Number of shards to spread the collection over
+            shard_layout (str): 'directories' (one persist directory per shard) or
+                'collections' (one collection per shard)
+            compress_text (bool): Keep document texts in a compressed side store
+                instead of in ChromaDB (only embeddings and metadata are stored)
+            model_dir (str, optional): Local embedding model directory to load offline
+            warmup (bool): Load the embedding model and run a dummy inference now,
+                so the first query does not pay for it
+            access_mode (str, optional): How the store is shared with other processes
+                (default: $CHROMA_ACCESS_MODE or 'direct'): 'direct' opens the persist
+                directory, 'writer' owns it and publishes a snapshot after each write,
+                'reader' queries the latest published snapshot and never writes
+                (see store_access.py)
+            snapshot_interval (float, optional): Minimum seconds between two snapshot
+                publishes in writer mode (default: $CHROMA_SNAPSHOT_INTERVAL or 10);
+                writes made in between are published together
         """
+        access_mode = (access_mode or os.getenv(ACCESS_MODE_ENV, "direct")).lower()
+        if access_mode not in ACCESS_MODES:
+            raise ValueError(f"Unknown access mode '{access_mode}' (expected one of {ACCESS_MODES})")
+        self.access_mode = access_mode
+        self.num_shards = num_shards
+        self.shard_layout = shard_layout
+        
         # Create the persist directory if it doesn't exist
         if not os.path.exists(persist_directory):
             os.makedirs(persist_directory)
+        
+        # A writer holds the store's lock for its lifetime; a reader only opens snapshots
+        self.writer_lock = None
+        self.snapshot_publisher = None
+        self.store_reader = None
+        self._retired_snapshot = None
+        if access_mode == "writer":
+            self.writer_lock = WriterLock(persist_directory)
+            self.writer_lock.acquire()
+        try:
+            if access_mode == "writer":
+                if snapshot_interval is None:
+                    snapshot_interval = float(os.getenv(SNAPSHOT_INTERVAL_ENV,
+                                                        DEFAULT_SNAPSHOT_INTERVAL))
+                self.snapshot_publisher = SnapshotPublisher(persist_directory,
+                                                            min_interval=snapshot_interval)
+            elif access_mode == "reader":
+                self.store_reader = SnapshotReader(persist_directory)
+            
+            # Documents stored with compress_text are rebuilt from the side store
+            self.compress_text = compress_text
+            self._open_store(self.store_reader.path if self.store_reader else persist_directory)
+            
+            # Use the default embedding function (all-MiniLM-L6-v2)
+            self.embedding_function = embedding_functions.DefaultEmbeddingFunction()
             
-        # Initialize the ChromaDB client with persistence
-        self.client = chromadb.PersistentClient(path=persist_directory)
+            # Pay the model load and first inference up front instead of on the first query
+            self.warmup_report = None
+            if warmup or model_dir:
+                self.warmup_report = warm_up_embedding_function(self.embedding_function, model_dir)
+                print(format_warmup_report(self.warmup_report))
+            
+            # Create or get the collection (readers cannot create one)
+            self.collection_name = collection_name
+            self.physical_name = self.aliases.resolve(collection_name)
+            if self.store_reader:
+                self.collection = self.client.get_collection(
+                    name=self.physical_name,
+                    embedding_function=self.embedding_function
+                )
+            else:
+                self.collection = self.client.get_or_create_collection(
+                    name=self.physical_name,
+                    embedding_function=self.embedding_function
+                )
+            
+            if self.snapshot_publisher and self.snapshot_publisher.current() is None:
+                self.snapshot_publisher.publish()
+            
+            print(f"ChromaDB initialized with collection: {collection_name}")
+        except BaseException:
+            self.close()
+            raise
+        atexit.register(self.close)
+    
+    def _open_store(self, directory):
+        """
+        Open the ChromaDB client, alias table and text side store of a directory.
         
-        # Use the default embedding function (all-MiniLM-L6-v2)
-        self.embedding_function = embedding_functions.DefaultEmbeddingFunction()
+        Args:
+            directory (str): Persist directory or published snapshot
+        """
+        # Initialize the ChromaDB client with persistence; a sharded store has the
+        # same API and searches all shards in parallel
+        if self.num_shards > 1:
+            self.client = ShardedStore(directory, self.num_shards, layout=self.shard_layout)
+        else:
+            self.client = chromadb.PersistentClient(path=directory)
         
-        # Create or get the collection
-        self.collection = self.client.get_or_create_collection(
-            name=collection_name,
-            embedding_function=self.embedding_function
-        )
+        # Logical collection names are resolved through the alias table, so a
+        # rebuild can swap in a new collection without an empty window
+        self.aliases = AliasTable(directory)
+        self.text_store = TextSideStore(os.path.join(directory, "text_store"))
+    
+    def _publish(self):
+        """
+        Publish the store for reader processes after a write (writer mode only).
+        
+        Writes within the snapshot interval of the last publish are published
+        together when the interval ends.
+        """
+        if self.snapshot_publisher:
+            path = self.snapshot_publisher.request()
+            if path:
+                print(f"Published store snapshot for readers: {path}")
+    
+    def close(self):
+        """
+        Publish pending writes and release the store (safe to call more than once).
+        """
+        atexit.unregister(self.close)
+        try:
+            if self.snapshot_publisher:
+                self.snapshot_publisher.flush()
+        finally:
+            self.snapshot_publisher = None
+            if self.store_reader:
+                self.store_reader.close()
+                self.store_reader = None
+            if self.writer_lock:
+                self.writer_lock.release()
+                self.writer_lock = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    def _refresh_collection(self):
+        """
+        Re-open the collection if its alias now points to a different build, or
+        (in reader mode) if a newer snapshot was published.
+        """
+        if self.store_reader:
+            previous = (self.store_reader.path, self.text_store)
+            if self.store_reader.refresh():
+                # Close the snapshot before the previous one; queries still
+                # running on the previous one can finish
+                if self._retired_snapshot:
+                    release_chroma_clients(self._retired_snapshot[0])
+                    self._retired_snapshot[1].close()
+                self._retired_snapshot = previous
+                self._open_store(self.store_reader.path)
+                self.physical_name = None
         
-        print(f"ChromaDB initialized with collection: {collection_name}")
+        physical_name = self.aliases.resolve(self.collection_name)
+        if physical_name != self.physical_name:
+            self.collection = self.client.get_collection(
+                name=physical_name,
+                embedding_function=self.embedding_function
+            )
+            self.physical_name = physical_name
+    
+    def _records(self, documents, ids, metadatas):
+        """
+        Build the arguments for writing documents to a collection.
+        
+        With compress_text, the texts go to the side store and are replaced by
+        their embeddings plus metadata locating them in the side store.
+        
+        Args:
+            documents (list): List of document texts
+            ids (list): List of unique IDs for the documents
+            metadatas (list): List of metadata dictionaries, or None
+            
+        Returns:
+            dict: Keyword arguments for collection.add
+        """
+        if not self.compress_text:
+            return {"documents": documents, "ids": ids, "metadatas": metadatas}
+        
+        locations = self.text_store.put_documents(documents)
+        if metadatas is not None:
+            locations = [{**metadata, **location} for metadata, location in zip(metadatas, locations)]
+        return {
+            "embeddings": self.embedding_function(documents),
+            "ids": ids,
+            "metadatas": locations
+        }
     
     def add_documents(self, documents, ids=None, metadatas=None):
         """
@@ -46,6 +238,8 @@ class ChromaDBManager:
             bool: True if documents were added successfully, False otherwise
         """
         try:
+            require_writable(self.access_mode)
+            
             # Generate IDs if not provided
             if ids is None:
                 ids = [f"doc_{i}" for i in range(len(documents))]
@@ -55,19 +249,168 @@ class ChromaDBManager:
                 metadatas = [{} for _ in range(len(documents))]
             
             # Add documents to the collection
-            self.collection.add(
-                documents=documents,
-                ids=ids,
-                metadatas=metadatas
-            )
+            self.collection.add(**self._records(documents, ids, metadatas))
             
             print(f"Added {len(documents)} documents to the collection")
+            self._publish()
             return True
             
         except Exception as e:
             print(f"Error adding documents to ChromaDB: {e}")
             return False
     
+    def rebuild_collection(self, documents, ids=None, metadatas=None):
+        """
+        Replace the collection's contents without interrupting queries.
+        
+        The documents are added to a new staging collection; once it is complete
+        the alias is swapped to it and the previous collection is retired
+        (it is deleted by the next rebuild, once no query can still be using it).
+        
+        Args:
+            documents (list): List of document texts
+            ids (list, optional): List of unique IDs for the documents
+            metadatas (list, optional): List of metadata dictionaries for the documents
+            
+        Returns:
+            bool: True if the collection was rebuilt successfully, False otherwise
+        """
+        try:
+            require_writable(self.access_mode)
+            if ids is None:
+                ids = [f"doc_{i}" for i in range(len(documents))]
+            
+            records = self._records(documents, ids, metadatas)
+            
+            def build(collection):
+                collection.add(**records)
+            
+            self.physical_name = rebuild_with_alias_swap(
+                self.client,
+                self.aliases,
+                self.collection_name,
+                build,
+                self.embedding_function
+            )
+            self.collection = self.client.get_collection(
+                name=self.physical_name,
+                embedding_function=self.embedding_function
+            )
+            
+            print(f"Rebuilt collection with {len(documents)} documents")
+            self._publish()
+            return True
+            
+        except Exception as e:
+            print(f"Error rebuilding ChromaDB collection: {e}")
+            return False
+    
+    def iter_documents(self, batch_size=500, where=None, include=("documents", "metadatas")):
+        """
+        Iterate over the whole collection, one page of records in memory at a time.
+        
+        Records added or deleted while iterating may be skipped or returned twice.
+        
+        Args:
+            batch_size (int): Number of records read per page
+            where (dict, optional): Metadata filter, as in collection.get
+            include (tuple): Fields to return: 'documents', 'metadatas' and/or 'embeddings'
+            
+        Yields:
+            dict: Record with 'id' plus 'document', 'metadata' and 'embedding'
+                for the included fields
+        """
+        self._refresh_collection()
+        yield from iter_collection_records(
+            self.collection,
+            batch_size,
+            include=list(include),
+            where=where,
+            resolve=self.text_store.resolve
+        )
+    
+    def export_snapshot(self, path, batch_size=1000):
+        """
+        Export the collection, including its embeddings, to a portable snapshot.
+        
+        Args:
+            path (str): Snapshot directory to create
+            batch_size (int): Number of records read per page
+            
+        Returns:
+            dict: The snapshot manifest, or None if the export failed
+        """
+        try:
+            self._refresh_collection()
+            manifest = export_collection(
+                self.collection,
+                path,
+                batch_size=batch_size,
+                collection_name=self.collection_name,
+                embedding_model=getattr(self.embedding_function, "MODEL_NAME", None)
+            )
+            
+            # Texts kept in the side store travel with the snapshot
+            doc_ids = {
+                metadata[DOC_KEY]
+                for page in iter_collection_pages(self.collection, batch_size, include=["metadatas"])
+                for metadata in page["metadatas"] if metadata and DOC_KEY in metadata
+            }
+            if doc_ids:
+                self.text_store.copy_documents(doc_ids, os.path.join(path, "text_store"))
+            
+            print(f"Exported {manifest['count']} documents to snapshot: {path}")
+            return manifest
+            
+        except Exception as e:
+            print(f"Error exporting ChromaDB snapshot: {e}")
+            return None
+    
+    def import_snapshot(self, path, batch_size=1000):
+        """
+        Replace the collection's contents with a snapshot, without re-embedding.
+        
+        The stored embeddings are bulk-loaded into a staging collection and the
+        alias is swapped to it once complete, as in rebuild_collection.
+        
+        Args:
+            path (str): Snapshot directory
+            batch_size (int): Number of records written per batch
+            
+        Returns:
+            bool: True if the snapshot was imported successfully, False otherwise
+        """
+        try:
+            require_writable(self.access_mode)
+            manifest = read_manifest(path)
+            
+            snapshot_texts = os.path.join(path, "text_store")
+            if os.path.isdir(snapshot_texts):
+                doc_ids = [name[:-len(".blocks")] for name in os.listdir(snapshot_texts)
+                           if name.endswith(".blocks")]
+                TextSideStore(snapshot_texts).copy_documents(doc_ids, self.text_store.directory)
+            
+            self.physical_name = rebuild_with_alias_swap(
+                self.client,
+                self.aliases,
+                self.collection_name,
+                lambda collection: load_snapshot_into(collection, path, batch_size, manifest),
+                self.embedding_function,
+                metadata=manifest.get("collection_metadata")
+            )
+            self.collection = self.client.get_collection(
+                name=self.physical_name,
+                embedding_function=self.embedding_function
+            )
+            
+            print(f"Imported {manifest['count']} documents from snapshot: {path}")
+            self._publish()
+            return True
+            
+        except Exception as e:
+            print(f"Error importing ChromaDB snapshot: {e}")
+            return False
+    
     def query_collection(self, query_text, n_results=5):
         """
         Query the collection for similar documents.
@@ -80,19 +423,28 @@ class ChromaDBManager:
             dict: Query results
         """
         try:
+            self._refresh_collection()
             results = self.collection.query(
                 query_texts=[query_text],
                 n_results=n_results
             )
             
+            # Rebuild texts kept in the compressed side store
+            results['documents'] = [
+                self.text_store.resolve(documents, metadatas)
+                for documents, metadatas in zip(results['documents'], results['metadatas'])
+            ]
+            
             return results
         
         except Exception as e:
             print(f"Error querying ChromaDB: {e}")
             return None
 
-# Example usage
-if __name__ == "__main__":
+def run_example():
+    """
+    Add a few sample documents and query them.
+    """
     # Initialize ChromaDB
     db_manager = ChromaDBManager()
     
@@ -138,3 +490,35 @@ if __name__ == "__main__":
             print(f"Document: {doc}")
             print(f"Metadata: {metadata}")
             print(f"Distance: {distance}")
+    
+    db_manager.close()
+
+# Example usage
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ChromaDB collection manager")
+    parser.add_argument("--collection", default="documents", help="Name of the collection")
+    parser.add_argument("--persist-directory", default="chroma_db",
+                        help="Directory holding the ChromaDB data")
+    parser.add_argument("--shards", type=int, default=1,
+                        help="Number of shards the collection is spread over")
+    parser.add_argument("--access-mode", choices=ACCESS_MODES,
+                        help=f"Share the store with other processes as writer or reader "
+                             f"(default: ${ACCESS_MODE_ENV} or direct)")
+    subparsers = parser.add_subparsers(dest="command")
+    export_parser = subparsers.add_parser("export", help="Export the collection to a snapshot")
+    export_parser.add_argument("path", help="Snapshot directory to create")
+    import_parser = subparsers.add_parser("import", help="Load a snapshot into the collection")
+    import_parser.add_argument("path", help="Snapshot directory to load")
+    
+    args = parser.parse_args()
+    
+    if args.command == "export":
+        with ChromaDBManager(args.collection, args.persist_directory, args.shards,
+                             access_mode=args.access_mode) as db_manager:
+            db_manager.export_snapshot(args.path)
+    elif args.command == "import":
+        with ChromaDBManager(args.collection, args.persist_directory, args.shards,
+                             access_mode=args.access_mode) as db_manager:
+            db_manager.import_snapshot(args.path)
+    else:
+        run_example()
@@ -1,11 +1,23 @@
+import argparse
 import os
+import sys
+
+# Modules shared by all day folders live in ../shared
+SHARED_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "shared")
+if SHARED_DIR not in sys.path:
+    sys.path.insert(0, SHARED_DIR)
+
 from pdf_extractor import extract_pdf_text
 from chroma_db import ChromaDBManager
 from create_sample_pdf import create_sample_pdf
+from profiling import profile_session, profile_stage
 
-def main():
+def main(warmup=False):
     """
     Main function to demonstrate PDF text extraction and ChromaDB functionality.
+    
+    Args:
+        warmup (bool): Load the embedding model at startup (see embedding_warmup.py)
     """
     print("=" * 50)
     print("Week 2 Assignment - PDF Text Extraction and ChromaDB")
@@ -14,11 +26,13 @@ def main():
     # Step 1: Create a sample PDF
     print("\nStep 1: Creating a sample PDF...")
     sample_pdf_path = "sample.pdf"
-    create_sample_pdf(sample_pdf_path)
+    with profile_stage("create_pdf"):
+        create_sample_pdf(sample_pdf_path)
     
     # Step 2: Extract text from the PDF
     print("\nStep 2: Extracting text from the PDF...")
-    extracted_text = extract_pdf_text(sample_pdf_path)
+    with profile_stage("extract"):
+        extracted_text = extract_pdf_text(sample_pdf_path)
     
     # Save the extracted text to a file
     with open("extracted_text.txt", "w", encoding="utf-8") as f:
@@ -35,20 +49,22 @@ def main():
     # Split the text into chunks (simple paragraph-based splitting for demonstration)
     chunks = [chunk.strip() for chunk in extracted_text.split("\n\n") if chunk.strip()]
     
-    # Initialize ChromaDB
-    db_manager = ChromaDBManager(collection_name="pdf_documents")
-    
-    # Add the chunks to ChromaDB
-    db_manager.add_documents(
-        documents=chunks,
-        ids=[f"pdf_chunk_{i}" for i in range(len(chunks))],
-        metadatas=[{"source": "sample.pdf", "chunk_id": i} for i in range(len(chunks))]
-    )
+    with profile_stage("store"):
+        # Initialize ChromaDB
+        db_manager = ChromaDBManager(collection_name="pdf_documents", warmup=warmup)
+        
+        # Replace the collection's contents (queries keep working during the rebuild)
+        db_manager.rebuild_collection(
+            documents=chunks,
+            ids=[f"pdf_chunk_{i}" for i in range(len(chunks))],
+            metadatas=[{"source": "sample.pdf", "chunk_id": i} for i in range(len(chunks))]
+        )
     
     # Step 4: Query the ChromaDB collection
     print("\nStep 4: Querying the ChromaDB collection...")
     query = "What is Agentic RAG?"
-    results = db_manager.query_collection(query, n_results=2)
+    with profile_stage("query"):
+        results = db_manager.query_collection(query, n_results=2)
     
     print(f"Query: {query}")
     if results:
@@ -62,7 +78,20 @@ def main():
             print(f"Metadata: {metadata}")
             print(f"Distance: {distance}")
     
+    # Publish pending writes (writer mode) and release the store
+    db_manager.close()
+    
     print("\nAssignment completed successfully!")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="PDF text extraction and ChromaDB demo")
+    parser.add_argument("--profile", nargs="?", const="profile_report", metavar="DIR",
+                        help="Write CPU profiles, flamegraph stacks and per-stage peak memory "
+                             "to DIR (default: profile_report)")
+    parser.add_argument("--warmup", action="store_true",
+                        help="Load the embedding model offline at startup and report the "
+                             "first-query latency saved")
+    args = parser.parse_args()
+    
+    with profile_session(args.profile):
+        main(warmup=args.warmup)
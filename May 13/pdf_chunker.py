@@ -6,16 +6,28 @@ into smaller, manageable segments for further processing.
 """
 
 import os
+import sys
 import PyPDF2
 from typing import List, Dict, Union, Optional
 
+# Modules shared by all day folders live in ../shared
+SHARED_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "shared")
+if SHARED_DIR not in sys.path:
+    sys.path.insert(0, SHARED_DIR)
 
-def extract_text_from_pdf(pdf_path: str) -> str:
+from extraction_cache import get_cached_pages
+from profiling import profile_session, profile_stage
+
+
+def extract_text_from_pdf(pdf_path: str, use_cache: bool = True,
+                          pages: Optional[List[int]] = None) -> str:
     """
     Extract text content from a PDF file.
     
     Args:
         pdf_path: Path to the PDF file
+        use_cache: Reuse (or populate) the on-disk extraction cache
+        pages: Optional zero-based page numbers to extract; all pages if omitted
         
     Returns:
         Extracted text as a string
@@ -25,9 +37,14 @@ def extract_text_from_pdf(pdf_path: str) -> str:
     
     text = ""
     try:
+        if use_cache:
+            with get_cached_pages(pdf_path, backend="pypdf2") as cached_pages:
+                return cached_pages.text(pages)
+        
         with open(pdf_path, 'rb') as file:
             pdf_reader = PyPDF2.PdfReader(file)
-            for page_num in range(len(pdf_reader.pages)):
+            page_numbers = range(len(pdf_reader.pages)) if pages is None else pages
+            for page_num in page_numbers:
                 page = pdf_reader.pages[page_num]
                 text += page.extract_text() + "\n\n"
     except Exception as e:
@@ -72,7 +89,12 @@ def chunk_text_by_size(text: str, chunk_size: int = 1000, overlap: int = 100) ->
         
         # Add this chunk to our list
         chunks.append(text[start:end])
-        
+
+        # Stop once the end of the text has been reached; stepping back by the
+        # overlap here would emit the final chunk forever
+        if end >= text_length:
+            break
+
         # Calculate the start of the next chunk, considering overlap
         start = end - overlap
     
@@ -124,28 +146,33 @@ def chunk_text_by_sentences(text: str, max_sentences: int = 5,
     return chunks
 
 
-def chunk_pdf(pdf_path: str, method: str = 'size', **kwargs) -> Dict[str, Union[List[str], str]]:
+def chunk_pdf(pdf_path: str, method: str = 'size', use_cache: bool = True,
+              **kwargs) -> Dict[str, Union[List[str], str]]:
     """
     Extract text from a PDF and chunk it using the specified method.
     
     Args:
         pdf_path: Path to the PDF file
         method: Chunking method ('size' or 'sentences')
+        use_cache: Reuse previously extracted page text for this PDF if available
         **kwargs: Additional parameters for the chunking method
         
     Returns:
         Dictionary containing the original text and the chunks
     """
-    text = extract_text_from_pdf(pdf_path)
+    with profile_stage("extract"):
+        text = extract_text_from_pdf(pdf_path, use_cache=use_cache)
     
     if method == 'size':
         chunk_size = kwargs.get('chunk_size', 1000)
         overlap = kwargs.get('overlap', 100)
-        chunks = chunk_text_by_size(text, chunk_size, overlap)
+        with profile_stage("chunk"):
+            chunks = chunk_text_by_size(text, chunk_size, overlap)
     elif method == 'sentences':
         max_sentences = kwargs.get('max_sentences', 5)
         max_chunk_size = kwargs.get('max_chunk_size', None)
-        chunks = chunk_text_by_sentences(text, max_sentences, max_chunk_size)
+        with profile_stage("chunk"):
+            chunks = chunk_text_by_sentences(text, max_sentences, max_chunk_size)
     else:
         raise ValueError(f"Unknown chunking method: {method}")
     
@@ -172,17 +199,24 @@ if __name__ == "__main__":
     parser.add_argument('--max-sentences', type=int, default=5,
                         help='Maximum number of sentences per chunk (for sentences method)')
     parser.add_argument('--output', help='Output file to save chunks (optional)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Re-parse the PDF instead of using the extraction cache')
+    parser.add_argument('--profile', nargs='?', const='profile_report', metavar='DIR',
+                        help='Write CPU profiles, flamegraph stacks and per-stage peak memory '
+                             'to DIR (default: profile_report)')
     
     args = parser.parse_args()
     
     try:
-        result = chunk_pdf(
-            args.pdf_path,
-            method=args.method,
-            chunk_size=args.chunk_size,
-            overlap=args.overlap,
-            max_sentences=args.max_sentences
-        )
+        with profile_session(args.profile):
+            result = chunk_pdf(
+                args.pdf_path,
+                method=args.method,
+                use_cache=not args.no_cache,
+                chunk_size=args.chunk_size,
+                overlap=args.overlap,
+                max_sentences=args.max_sentences
+            )
         
         print(f"Successfully extracted and chunked text from {args.pdf_path}")
         print(f"Chunking method: {args.method}")
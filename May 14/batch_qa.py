@@ -0,0 +1,296 @@
+"""
+Batch Question Answering
+
+Runs large question sets through the RAG pipeline:
+
+- Retrieval is batched: the questions of a batch are embedded and searched with
+  one ChromaDB query.
+- Answers are generated concurrently by a thread pool. A token bucket keeps the
+  request rate within the API quota, and failed calls are retried with
+  exponential backoff and jitter.
+- Results are appended to a JSONL file as they complete. Rerunning the same
+  command skips questions that already have a successful result, so a failed or
+  interrupted run resumes where it stopped.
+
+Questions are read from a JSONL file (objects with a "query" or "question"
+field and an optional "id") or from a text file with one question per line.
+"""
+
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Set
+
+
+class TokenBucket:
+    """
+    Thread-safe token-bucket rate limiter.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        """
+        Initialize the bucket (it starts full).
+
+        Args:
+            rate: Tokens added per second
+            capacity: Maximum number of tokens (the allowed burst)
+        """
+        if rate <= 0:
+            raise ValueError("Rate must be positive")
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """
+        Block until tokens are available and take them.
+
+        Args:
+            tokens: Number of tokens to take
+
+        Returns:
+            Seconds spent waiting
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+                delay = (tokens - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+def call_with_retries(func: Callable[[], Any], max_retries: int = 5, base_delay: float = 1.0,
+                      max_delay: float = 60.0,
+                      on_retry: Optional[Callable[[int, Exception, float], None]] = None):
+    """
+    Call a function, retrying failures with exponential backoff and full jitter.
+
+    Args:
+        func: Function to call
+        max_retries: Retries after the first attempt
+        base_delay: Backoff before the first retry, doubled on every further one
+        max_delay: Upper bound of a single backoff
+        on_retry: Optional callback (attempt, error, delay) before each retry
+
+    Returns:
+        Tuple of (result, attempts)
+    """
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            return func(), attempt
+        except Exception as e:
+            if attempt > max_retries:
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1)))
+            if on_retry:
+                on_retry(attempt, e, delay)
+            time.sleep(delay)
+
+
+def load_queries(path: str) -> List[Dict[str, str]]:
+    """
+    Read a question set.
+
+    Args:
+        path: JSONL file ({"id": ..., "query": ...}) or text file (one question per line)
+
+    Returns:
+        List of {"id", "query"} dictionaries; ids default to the line number
+    """
+    queries = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                item = json.loads(line)
+                query = item.get("query") or item.get("question")
+                query_id = str(item.get("id", line_number))
+            else:
+                query, query_id = line, str(line_number)
+            if query:
+                queries.append({"id": query_id, "query": query})
+
+    ids = [item["id"] for item in queries]
+    if len(set(ids)) != len(ids):
+        raise ValueError(f"Duplicate question ids in {path}")
+    return queries
+
+
+def completed_ids(output_path: str) -> Set[str]:
+    """
+    Find the questions already answered successfully in an output file.
+
+    A line torn by a crash at the end of the file is cut off, so new results are
+    appended after the last complete one.
+
+    Args:
+        output_path: JSONL results file
+
+    Returns:
+        Ids of questions with an 'ok' result
+    """
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+
+    with open(output_path, 'r+b') as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end != len(data):
+            f.truncate(end)
+    for line in data[:end].splitlines():
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if record.get("status") == "ok":
+            done.add(str(record["id"]))
+    return done
+
+
+def run_batch(queries: List[Dict[str, str]], output_path: str,
+              retrieve_batch: Callable[[List[str]], List[List[str]]],
+              generate: Callable[[str, List[str]], str],
+              concurrency: int = 4, requests_per_minute: float = 60.0, burst: int = 4,
+              batch_size: int = 32, max_retries: int = 5,
+              answer_directly: Optional[Callable[[str, List[str]], Optional[str]]] = None
+              ) -> Dict[str, Any]:
+    """
+    Answer a question set, streaming results to a JSONL file.
+
+    Args:
+        queries: Questions from load_queries
+        output_path: JSONL file results are appended to
+        retrieve_batch: Function mapping a list of questions to their context chunks;
+            raises on failure, which fails the whole batch
+        generate: Function (question, context) -> answer; raises on failure
+        concurrency: Number of answers generated in parallel
+        requests_per_minute: Sustained generation request rate
+        burst: Requests allowed back to back before the rate applies
+        batch_size: Questions retrieved per batch
+        max_retries: Retries per generation request
+        answer_directly: Optional function (question, context) -> answer that needs
+            no generation request (e.g. when nothing relevant was retrieved), or
+            None to generate; such answers do not wait for the rate limit
+
+    Returns:
+        Run statistics
+    """
+    done = completed_ids(output_path)
+    pending = [item for item in queries if item["id"] not in done]
+    print(f"{len(queries)} questions, {len(queries) - len(pending)} already answered, "
+          f"{len(pending)} to run")
+
+    bucket = TokenBucket(requests_per_minute / 60.0, burst)
+    stats = {"total": len(queries), "skipped": len(queries) - len(pending),
+             "ok": 0, "error": 0, "retries": 0, "rate_limited_s": 0.0}
+    stats_lock = threading.Lock()
+    started = time.perf_counter()
+
+    def on_retry(attempt: int, error: Exception, delay: float) -> None:
+        with stats_lock:
+            stats["retries"] += 1
+        print(f"Retrying after error ({error}); attempt {attempt + 1} in {delay:.1f}s")
+
+    def answer(item: Dict[str, str], context: List[str], retrieval_s: float) -> Dict[str, Any]:
+        record = {"id": item["id"], "query": item["query"], "num_chunks": len(context),
+                  "retrieval_s": round(retrieval_s, 4)}
+        start = time.perf_counter()
+
+        direct = answer_directly(item["query"], context) if answer_directly else None
+        if direct is not None:
+            record.update(status="ok", answer=direct, attempts=0,
+                          generation_s=round(time.perf_counter() - start, 4))
+            return record
+
+        def attempt():
+            waited = bucket.acquire()
+            with stats_lock:
+                stats["rate_limited_s"] += waited
+            return generate(item["query"], context)
+
+        try:
+            result, attempts = call_with_retries(attempt, max_retries=max_retries,
+                                                 on_retry=on_retry)
+            record.update(status="ok", answer=result, attempts=attempts)
+        except Exception as e:
+            record.update(status="error", error=str(e), attempts=max_retries + 1)
+        record["generation_s"] = round(time.perf_counter() - start, 4)
+        return record
+
+    with open(output_path, 'a', encoding='utf-8') as output, \
+            ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="answer") as executor:
+        in_flight = set()
+
+        def drain(until: int) -> None:
+            nonlocal in_flight
+            while len(in_flight) > until:
+                finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    record = future.result()
+                    output.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    output.flush()
+                    stats[record["status"]] += 1
+                    if record["status"] == "error":
+                        print(f"Question {record['id']} failed: {record['error']}")
+
+        for start in range(0, len(pending), batch_size):
+            batch = pending[start:start + batch_size]
+            retrieval_start = time.perf_counter()
+            try:
+                contexts = retrieve_batch([item["query"] for item in batch])
+            except Exception as e:
+                # Record the questions as failed, not unanswerable, so a rerun retries them
+                print(f"Retrieval failed for {len(batch)} questions: {e}")
+                for item in batch:
+                    record = {"id": item["id"], "query": item["query"], "status": "error",
+                              "error": f"Retrieval failed: {e}", "attempts": 0}
+                    output.write(json.dumps(record, ensure_ascii=False) + "\n")
+                output.flush()
+                stats["error"] += len(batch)
+                continue
+            retrieval_s = (time.perf_counter() - retrieval_start) / max(1, len(batch))
+
+            for item, context in zip(batch, contexts):
+                # Keep retrieval at most a couple of batches ahead of generation
+                drain(concurrency + batch_size)
+                in_flight.add(executor.submit(answer, item, context, retrieval_s))
+
+            print(f"Progress: {stats['ok'] + stats['error']}/{len(pending)} answered")
+
+        drain(0)
+
+    stats["elapsed_s"] = time.perf_counter() - started
+    stats["questions_per_s"] = (stats["ok"] + stats["error"]) / max(stats["elapsed_s"], 1e-9)
+    return stats
+
+
+def format_batch_stats(stats: Dict[str, Any]) -> str:
+    """
+    Format the statistics of a batch run for display.
+
+    Args:
+        stats: Statistics returned by run_batch
+
+    Returns:
+        Human-readable summary
+    """
+    return (f"Answered {stats['ok']} questions ({stats['error']} failed, {stats['skipped']} "
+            f"skipped as already answered) in {stats['elapsed_s']:.1f}s "
+            f"({stats['questions_per_s']:.2f}/s); {stats['retries']} retries, "
+            f"{stats['rate_limited_s']:.1f}s waiting on the rate limit")
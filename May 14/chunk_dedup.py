@@ -0,0 +1,234 @@
+"""
+Chunk De-duplication
+
+Headers, footers, disclaimers and other boilerplate repeat on every page of a
+PDF, so the chunker produces many identical or nearly identical chunks. This
+module collapses them before they are embedded:
+
+1. Exact duplicates are found by hashing the normalized chunk text.
+2. Near duplicates are found with MinHash signatures over character shingles,
+   bucketed with locality-sensitive hashing (LSH) so each chunk is only compared
+   against likely matches.
+
+Every kept chunk carries the list of original chunk positions it stands for.
+"""
+
+import hashlib
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalize chunk text for comparison (case and whitespace insensitive).
+
+    Args:
+        text: Chunk text
+
+    Returns:
+        Normalized text
+    """
+    return _WHITESPACE.sub(" ", text).strip().lower()
+
+
+def _shingle_hashes(text: str, shingle_size: int) -> np.ndarray:
+    """Hash every distinct character shingle of the text to a 64-bit integer."""
+    if len(text) <= shingle_size:
+        shingles = {text}
+    else:
+        shingles = {text[i:i + shingle_size] for i in range(len(text) - shingle_size + 1)}
+
+    digests = b"".join(
+        hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest()
+        for shingle in shingles
+    )
+    return np.frombuffer(digests, dtype=np.uint64)
+
+
+class MinHashDeduplicator:
+    """
+    Exact and near-duplicate detector for text chunks.
+    """
+
+    def __init__(self, threshold: float = 0.9, num_perm: int = 64, bands: int = 16,
+                 shingle_size: int = 5, seed: int = 1):
+        """
+        Initialize the deduplicator.
+
+        Args:
+            threshold: Minimum estimated Jaccard similarity for two chunks to be
+                treated as near duplicates
+            num_perm: Number of MinHash permutations (signature length)
+            bands: Number of LSH bands; must divide num_perm
+            shingle_size: Number of characters per shingle
+            seed: Seed for the permutation coefficients
+        """
+        if not 0 < threshold <= 1:
+            raise ValueError("Threshold must be in (0, 1]")
+        if num_perm % bands != 0:
+            raise ValueError("Number of bands must divide the number of permutations")
+
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+
+        # Multiply-shift hash family: h_i(x) = (a_i * x + b_i mod 2^64) >> 32,
+        # with odd multipliers derived deterministically from the seed
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, 1 << 63, size=num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self._b = rng.integers(0, 1 << 63, size=num_perm, dtype=np.uint64)
+
+    def signature(self, text: str) -> Tuple[int, ...]:
+        """
+        Compute the MinHash signature of a (normalized) text.
+
+        Args:
+            text: Normalized chunk text
+
+        Returns:
+            Tuple of num_perm minimum hash values
+        """
+        hashes = _shingle_hashes(text, self.shingle_size)
+        # uint64 arithmetic wraps around, which is exactly the mod 2^64 we want
+        with np.errstate(over='ignore'):
+            permuted = (np.outer(self._a, hashes) + self._b[:, None]) >> np.uint64(32)
+        return tuple(permuted.min(axis=1).tolist())
+
+    @staticmethod
+    def similarity(sig_a: Tuple[int, ...], sig_b: Tuple[int, ...]) -> float:
+        """
+        Estimate the Jaccard similarity of two signatures.
+
+        Args:
+            sig_a: First MinHash signature
+            sig_b: Second MinHash signature
+
+        Returns:
+            Fraction of matching signature positions
+        """
+        matches = sum(1 for x, y in zip(sig_a, sig_b) if x == y)
+        return matches / len(sig_a)
+
+    def deduplicate(self, chunks: List[str]) -> Dict[str, Any]:
+        """
+        Collapse exact and near-duplicate chunks.
+
+        The first occurrence of each group is kept, so chunk order is preserved.
+
+        Args:
+            chunks: List of text chunks
+
+        Returns:
+            Dictionary containing the kept chunks, the original positions each
+            kept chunk stands for, and de-duplication statistics
+        """
+        kept_chunks = []
+        sources = []
+        kept_signatures = []
+        exact_index = {}
+        lsh_buckets = {}
+        exact_duplicates = 0
+        near_duplicates = 0
+        removed_chars = 0
+
+        for position, chunk in enumerate(chunks):
+            normalized = normalize_text(chunk)
+            digest = hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+            # Exact duplicate of a chunk we already kept
+            if digest in exact_index:
+                sources[exact_index[digest]].append(position)
+                exact_duplicates += 1
+                removed_chars += len(chunk)
+                continue
+
+            signature = self.signature(normalized)
+            band_keys = [
+                (band, signature[band * self.rows:(band + 1) * self.rows])
+                for band in range(self.bands)
+            ]
+
+            # Compare only against chunks that share at least one LSH band
+            match = None
+            candidates = set()
+            for key in band_keys:
+                candidates.update(lsh_buckets.get(key, ()))
+            for candidate in sorted(candidates):
+                if self.similarity(signature, kept_signatures[candidate]) >= self.threshold:
+                    match = candidate
+                    break
+
+            if match is not None:
+                sources[match].append(position)
+                exact_index[digest] = match
+                near_duplicates += 1
+                removed_chars += len(chunk)
+                continue
+
+            kept = len(kept_chunks)
+            kept_chunks.append(chunk)
+            sources.append([position])
+            kept_signatures.append(signature)
+            exact_index[digest] = kept
+            for key in band_keys:
+                lsh_buckets.setdefault(key, []).append(kept)
+
+        total_chars = sum(len(chunk) for chunk in chunks)
+        removed = exact_duplicates + near_duplicates
+        stats = {
+            'total_chunks': len(chunks),
+            'unique_chunks': len(kept_chunks),
+            'exact_duplicates': exact_duplicates,
+            'near_duplicates': near_duplicates,
+            'removed_chunks': removed,
+            'removed_chars': removed_chars,
+            'removed_ratio': removed / len(chunks) if chunks else 0.0,
+            'removed_chars_ratio': removed_chars / total_chars if total_chars else 0.0,
+        }
+
+        return {
+            'chunks': kept_chunks,
+            'sources': sources,
+            'stats': stats
+        }
+
+
+def deduplicate_chunks(chunks: List[str], threshold: float = 0.9,
+                       deduplicator: Optional[MinHashDeduplicator] = None) -> Dict[str, Any]:
+    """
+    Collapse exact and near-duplicate chunks using a MinHash/LSH deduplicator.
+
+    Args:
+        chunks: List of text chunks
+        threshold: Minimum estimated Jaccard similarity for near duplicates
+        deduplicator: Optional preconfigured deduplicator
+
+    Returns:
+        Dictionary with 'chunks', 'sources' and 'stats' (see MinHashDeduplicator.deduplicate)
+    """
+    if deduplicator is None:
+        deduplicator = MinHashDeduplicator(threshold=threshold)
+    return deduplicator.deduplicate(chunks)
+
+
+def format_dedup_stats(stats: Dict[str, Any]) -> str:
+    """
+    Format de-duplication statistics as a one-line summary.
+
+    Args:
+        stats: Statistics returned by deduplicate_chunks
+
+    Returns:
+        Human-readable summary
+    """
+    return (
+        f"Kept {stats['unique_chunks']} of {stats['total_chunks']} chunks "
+        f"({stats['exact_duplicates']} exact and {stats['near_duplicates']} near duplicates removed, "
+        f"{stats['removed_ratio']:.1%} of chunks, {stats['removed_chars_ratio']:.1%} of text)"
+    )
@@ -0,0 +1,335 @@
+"""
+Collection Routing Index
+
+With one collection per PDF, a question whose source is unknown would have to
+be searched in every collection. The routing index keeps a small profile of each
+collection and picks the few collections worth searching:
+
+- centroid: the normalized mean of the collection's chunk embeddings
+- summary embedding: the embedding of a short summary (its top keywords and
+  opening text)
+- keyword sketch: the collection's most frequent terms with their relative
+  frequencies
+
+A query is scored against every profile. The score is a weighted sum of the
+cosine similarity to the centroid, the cosine similarity to the summary
+embedding, and the share of the query's terms found in the keyword sketch. Only
+the top-M collections are then searched, in parallel.
+
+Profiles are stored in ``collection_routes.json`` in the persist directory,
+keyed by logical collection name. The file holds only the scored fields and
+the chunk count, so its size does not grow with the collections' vocabularies.
+
+To update a profile when a document is added or removed, using that document's
+chunks alone (update_profile), the writer also keeps running sums per
+collection: the sum of the chunk embeddings, the count of every term and the
+opening text. They are stored in one file per collection under
+``collection_routes.state/``, which queries never read. Only a collection that
+is written as a whole (or ``--rebuild-routes``) is read back in full. The
+summary keeps the opening text of the first chunk it was built from, even after
+that chunk is removed.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+ROUTES_FILE_NAME = "collection_routes.json"
+STATE_DIR_NAME = "collection_routes.state"
+
+# Profile fields kept only in the per-collection state files
+_STATE_KEYS = ("embedding_sum", "term_counts", "opening")
+
+# Weights of the centroid, summary and keyword scores
+DEFAULT_WEIGHTS = (0.5, 0.3, 0.2)
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]{3,}")
+_STOPWORDS = frozenset("""
+the and for are but not you all any can had her was one our out has him his how
+its may new now see two who did get let put say she too use this that with have
+from they will would there their what about which when make like time just know
+take into year your some could them than then look only come over think also back
+after work first well even want because these give most does where why
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split text into lower-case terms, dropping short words and stopwords.
+
+    Args:
+        text: Text to split
+
+    Returns:
+        List of terms
+    """
+    return [token for token in _TOKEN_PATTERN.findall(text.lower()) if token not in _STOPWORDS]
+
+
+def _normalize(vector: np.ndarray) -> np.ndarray:
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+class CollectionRouter:
+    """
+    Routing profiles of the collections in a persist directory.
+    """
+
+    def __init__(self, persist_directory: str, sketch_size: int = 64,
+                 weights: Tuple[float, float, float] = DEFAULT_WEIGHTS):
+        """
+        Initialize the routing index stored in a ChromaDB persist directory.
+
+        Args:
+            persist_directory: Directory holding the ChromaDB data
+            sketch_size: Number of keywords kept per collection
+            weights: Weights of the centroid, summary and keyword scores
+        """
+        self.path = os.path.join(persist_directory, ROUTES_FILE_NAME)
+        self.state_dir = os.path.join(persist_directory, STATE_DIR_NAME)
+        self.sketch_size = sketch_size
+        self.weights = weights
+        self._lock = threading.Lock()
+        self._cache: Optional[Tuple[int, Dict[str, Any]]] = None
+
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Read the routing profiles (cached until the file changes).
+
+        Returns:
+            Dictionary of collection name -> profile
+        """
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return {}
+
+        cache = self._cache
+        if cache is not None and cache[0] == mtime:
+            return cache[1]
+
+        with open(self.path, 'r', encoding='utf-8') as f:
+            routes = json.load(f)
+        for profile in routes.values():
+            profile["_centroid"] = np.asarray(profile["centroid"], dtype=np.float32)
+            profile["_summary"] = np.asarray(profile["summary_embedding"], dtype=np.float32)
+        self._cache = (mtime, routes)
+        return routes
+
+    @staticmethod
+    def _write_json(path: str, data: Dict[str, Any]) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def _save(self, routes: Dict[str, Dict[str, Any]]) -> None:
+        stored = {name: {key: value for key, value in profile.items()
+                         if not key.startswith("_") and key not in _STATE_KEYS}
+                  for name, profile in routes.items()}
+        self._write_json(self.path, stored)
+
+    def _state_path(self, name: str) -> str:
+        return os.path.join(self.state_dir, hashlib.sha1(name.encode("utf-8")).hexdigest() + ".json")
+
+    def _load_state(self, name: str) -> Dict[str, Any]:
+        try:
+            with open(self._state_path(name), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _store(self, routes: Dict[str, Dict[str, Any]], name: str,
+               profile: Optional[Dict[str, Any]]) -> None:
+        """Write a profile's scored fields to the routing file and its sums to its state file."""
+        state = {key: profile[key] for key in _STATE_KEYS if key in profile} if profile else {}
+        if len(state) == len(_STATE_KEYS):
+            self._write_json(self._state_path(name), dict(state, name=name))
+        else:
+            try:
+                os.remove(self._state_path(name))
+            except FileNotFoundError:
+                pass
+
+        if profile is None:
+            routes.pop(name, None)
+        else:
+            routes[name] = profile
+        self._save(routes)
+
+    def build_profile(self, chunks: Iterable[Tuple[str, Any]],
+                      embedding_function) -> Optional[Dict[str, Any]]:
+        """
+        Build the routing profile of a collection in one pass over its chunks.
+
+        Args:
+            chunks: (text, embedding) pairs of the collection's chunks
+            embedding_function: Function used to embed the summary
+
+        Returns:
+            Profile dictionary, or None if the collection is empty
+        """
+        return self.update_profile(None, chunks, (), embedding_function)
+
+    def update_profile(self, profile: Optional[Dict[str, Any]],
+                       added: Iterable[Tuple[str, Any]], removed: Iterable[Tuple[str, Any]],
+                       embedding_function) -> Optional[Dict[str, Any]]:
+        """
+        Apply added and removed chunks to a profile without reading the rest
+        of the collection.
+
+        Args:
+            profile: Current profile, or None for an empty collection
+            added: (text, embedding) pairs of the chunks written
+            removed: (text, embedding) pairs of the chunks deleted or overwritten
+            embedding_function: Function used to embed the summary (only called
+                when the summary changed)
+
+        Returns:
+            Updated profile, or None if the collection is now empty
+
+        Raises:
+            ValueError: If the profile was stored without the running sums
+                (built before incremental updates); rebuild it instead
+        """
+        if profile is None:
+            count, total, terms, opening = 0, None, Counter(), ""
+        else:
+            if "embedding_sum" not in profile or "term_counts" not in profile:
+                raise ValueError("Profile has no running sums; rebuild it from the collection")
+            count = profile["count"]
+            total = np.asarray(profile["embedding_sum"], dtype=np.float64)
+            terms = Counter(profile["term_counts"])
+            opening = profile.get("opening", "")
+
+        for sign, chunks in ((1, added), (-1, removed)):
+            for document, embedding in chunks:
+                vector = np.asarray(embedding, dtype=np.float64)
+                total = sign * vector if total is None else total + sign * vector
+                count += sign
+                tokens = Counter(tokenize(document or ""))
+                if sign > 0:
+                    terms.update(tokens)
+                    if not opening and document:
+                        opening = document[:300]
+                else:
+                    terms.subtract(tokens)
+
+        if count <= 0:
+            return None
+
+        # Drop terms no chunk contains any more
+        terms = +terms
+        term_total = sum(terms.values()) or 1
+        keywords = {term: round(frequency / term_total, 6)
+                    for term, frequency in terms.most_common(self.sketch_size)}
+        summary = " ".join(list(keywords)[:20]) + "\n" + opening
+        if profile is not None and profile.get("summary") == summary:
+            summary_embedding = np.asarray(profile["summary_embedding"], dtype=np.float64)
+        else:
+            summary_embedding = np.asarray(embedding_function([summary])[0], dtype=np.float64)
+
+        return {
+            "count": count,
+            "centroid": _normalize(total / count).tolist(),
+            "summary": summary,
+            "summary_embedding": _normalize(summary_embedding).tolist(),
+            "keywords": keywords,
+            "opening": opening,
+            "embedding_sum": total.tolist(),
+            "term_counts": dict(terms),
+            "updated": time.time(),
+        }
+
+    def apply_changes(self, name: str, added: Iterable[Tuple[str, Any]],
+                      removed: Iterable[Tuple[str, Any]],
+                      embedding_function) -> Optional[Dict[str, Any]]:
+        """
+        Update a stored profile with the chunks a write added and removed.
+
+        Args:
+            name: Logical collection name
+            added: (text, embedding) pairs of the chunks written
+            removed: (text, embedding) pairs of the chunks deleted or overwritten
+            embedding_function: Function used to embed the summary
+
+        Returns:
+            The new profile, or None if the collection is now empty
+
+        Raises:
+            ValueError: If the stored profile cannot be updated incrementally
+        """
+        with self._lock:
+            routes = dict(self.load())
+            current = routes.get(name)
+            if current is not None:
+                current = dict(current, **self._load_state(name))
+            profile = self.update_profile(current, added, removed, embedding_function)
+            self._store(routes, name, profile)
+            return profile
+
+    def update(self, name: str, profile: Optional[Dict[str, Any]]) -> None:
+        """
+        Store (or, for an empty collection, remove) a collection's profile.
+
+        Args:
+            name: Logical collection name
+            profile: Profile from build_profile, or None
+        """
+        with self._lock:
+            self._store(dict(self.load()), name, profile)
+
+    def remove(self, name: str) -> None:
+        """
+        Remove a collection from the routing index.
+
+        Args:
+            name: Logical collection name
+        """
+        self.update(name, None)
+
+    def route(self, query_embedding, query: str, top_m: int = 3,
+              min_score: Optional[float] = None) -> List[Tuple[str, float]]:
+        """
+        Pick the collections most likely to answer a query.
+
+        Args:
+            query_embedding: Embedding of the query
+            query: Query text (for the keyword score)
+            top_m: Maximum number of collections to return
+            min_score: Optional minimum score; lower-scoring collections are dropped
+
+        Returns:
+            (collection name, score) pairs, best first
+        """
+        routes = self.load()
+        if not routes:
+            return []
+
+        query_vector = _normalize(np.asarray(query_embedding, dtype=np.float32))
+        query_terms = set(tokenize(query))
+        centroid_weight, summary_weight, keyword_weight = self.weights
+
+        scores = []
+        for name, profile in routes.items():
+            score = (centroid_weight * float(profile["_centroid"] @ query_vector)
+                     + summary_weight * float(profile["_summary"] @ query_vector))
+            if query_terms:
+                matched = sum(1 for term in query_terms if term in profile["keywords"])
+                score += keyword_weight * matched / len(query_terms)
+            if min_score is None or score >= min_score:
+                scores.append((name, score))
+
+        scores.sort(key=lambda item: item[1], reverse=True)
+        return scores[:top_m]
@@ -0,0 +1,235 @@
+"""
+Conversation Memory
+
+Keeps the state of a multi-turn chat with the RAG system without letting the
+prompt grow with the length of the conversation:
+
+- The most recent turns are kept verbatim.
+- Older turns are compacted into a short running summary.
+- The history block handed to generate_answer never exceeds a fixed token budget.
+- Follow-up questions ("what about the second one?") are rewritten with the
+  previous standalone query so retrieval has something meaningful to search for.
+"""
+
+import re
+from typing import Callable, List, Optional, Tuple
+
+# Rough characters-per-token ratio for English text
+CHARS_PER_TOKEN = 4
+
+# Openings that continue the previous question ("what about the second one?")
+_FOLLOW_UP_PREFIXES = ("what about ", "how about ", "and ", "also ", "...", "tell me more",
+                       "how so", "why?", "why not")
+
+# A question that opens with a pronoun, directly ("it ...", "they ...") or right
+# after a question word ("how does it ...", "what are its ..."), refers back
+_LEADING_PRONOUN = re.compile(r"^(?:it|its|they|their|them|that|those)\b")
+_PRONOUN_QUESTION = re.compile(
+    r"^(?:what|why|how|when|where|who|which|is|are|was|were|do|does|did|can|could|should|would|will|has|have)"
+    r"(?:\s+(?:is|are|was|were|do|does|did|can|could|should|would|will|has|have))?"
+    r"\s+(?:it|its|they|their|them)\b"
+)
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the number of tokens in a text.
+
+    Args:
+        text: Text to measure
+
+    Returns:
+        Approximate token count
+    """
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def truncate_to_tokens(text: str, max_tokens: int, keep: str = "start") -> str:
+    """
+    Truncate a text to roughly max_tokens tokens.
+
+    Args:
+        text: Text to truncate
+        max_tokens: Token budget
+        keep: Keep the 'start' or the 'end' of the text
+
+    Returns:
+        Truncated text (with an ellipsis where text was cut)
+    """
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    if max_chars <= 3:
+        return ""
+    if keep == "end":
+        return "..." + text[-(max_chars - 3):]
+    return text[:max_chars - 3] + "..."
+
+
+def first_sentence(text: str) -> str:
+    """
+    Get the first sentence of a text.
+
+    Args:
+        text: Text to shorten
+
+    Returns:
+        The first sentence, with whitespace collapsed
+    """
+    text = " ".join(text.split())
+    return _SENTENCE_END.split(text, maxsplit=1)[0]
+
+
+def extractive_summary(summary: str, question: str, answer: str) -> str:
+    """
+    Fold one turn into the running summary without calling an LLM.
+
+    Args:
+        summary: Current summary
+        question: Question of the turn being compacted
+        answer: Answer of the turn being compacted
+
+    Returns:
+        Updated summary
+    """
+    line = f"Q: {' '.join(question.split())} A: {first_sentence(answer)}"
+    return f"{summary}\n{line}" if summary else line
+
+
+class ConversationMemory:
+    """
+    Rolling conversation state with a bounded prompt footprint.
+    """
+
+    def __init__(self, max_history_tokens: int = 600, keep_recent_turns: int = 2,
+                 max_summary_tokens: int = 200,
+                 summarizer: Optional[Callable[[str, str, str], str]] = None):
+        """
+        Initialize the conversation memory.
+
+        Args:
+            max_history_tokens: Token budget for the whole history block
+            keep_recent_turns: Number of most recent turns kept verbatim
+            max_summary_tokens: Token budget for the summary of older turns
+            summarizer: Function (summary, question, answer) -> new summary used
+                to compact old turns; defaults to a cheap extractive summary
+        """
+        if max_summary_tokens >= max_history_tokens:
+            raise ValueError("Summary budget must be smaller than the history budget")
+
+        self.max_history_tokens = max_history_tokens
+        self.keep_recent_turns = keep_recent_turns
+        self.max_summary_tokens = max_summary_tokens
+        self.summarizer = summarizer or extractive_summary
+        self.summary = ""
+        self.turns: List[Tuple[str, str]] = []
+        self.total_turns = 0
+        self.last_query = ""
+
+    def reset(self) -> None:
+        """Forget the whole conversation."""
+        self.summary = ""
+        self.turns = []
+        self.total_turns = 0
+        self.last_query = ""
+
+    def add_turn(self, question: str, answer: str, retrieval_query: Optional[str] = None) -> None:
+        """
+        Record a completed turn and compact older turns if needed.
+
+        Args:
+            question: User question
+            answer: Generated answer
+            retrieval_query: Standalone query the question was retrieved with
+                (default: the question itself)
+        """
+        self.last_query = " ".join((retrieval_query or question).split())
+        self.turns.append((question, answer))
+        self.total_turns += 1
+        self._compact()
+
+    def _recent_tokens(self) -> int:
+        return sum(estimate_tokens(q) + estimate_tokens(a) for q, a in self.turns)
+
+    def _compact(self) -> None:
+        """Move the oldest verbatim turns into the summary until within budget."""
+        recent_budget = self.max_history_tokens - self.max_summary_tokens
+        while self.turns and (len(self.turns) > self.keep_recent_turns
+                              or self._recent_tokens() > recent_budget):
+            # Always keep the latest turn verbatim; it is trimmed in history_text
+            if len(self.turns) == 1:
+                break
+            question, answer = self.turns.pop(0)
+            self.summary = self.summarizer(self.summary, question, answer)
+
+        # Drop the oldest summary lines first when the summary outgrows its budget
+        self.summary = truncate_to_tokens(self.summary, self.max_summary_tokens, keep="end")
+
+    def history_text(self) -> str:
+        """
+        Build the history block for the prompt.
+
+        Returns:
+            Summary plus recent turns, within max_history_tokens (empty if no turns yet)
+        """
+        if not self.summary and not self.turns:
+            return ""
+
+        parts = []
+        if self.summary:
+            parts.append(f"Summary of earlier conversation:\n{self.summary}")
+
+        remaining = self.max_history_tokens - sum(estimate_tokens(p) for p in parts)
+        recent = []
+        # Newest turns get the budget first; each turn is trimmed to fit
+        for question, answer in reversed(self.turns):
+            if remaining <= 0:
+                break
+            per_turn = max(1, remaining // 2)
+            line = (f"User: {truncate_to_tokens(question, per_turn // 2)}\n"
+                    f"Assistant: {truncate_to_tokens(answer, per_turn - per_turn // 2)}")
+            recent.insert(0, line)
+            remaining -= estimate_tokens(line)
+
+        if recent:
+            parts.append("Recent conversation:\n" + "\n".join(recent))
+
+        return truncate_to_tokens("\n\n".join(parts), self.max_history_tokens)
+
+    def is_follow_up(self, query: str) -> bool:
+        """
+        Guess whether a question depends on the previous turn.
+
+        Only the opening of the question is looked at: a continuation ("what
+        about ...", "and ...") or a leading pronoun ("it ...", "how does it ...").
+        Pronouns later in a question usually refer to something it names itself.
+
+        Args:
+            query: User question
+
+        Returns:
+            True if the question looks like a follow-up
+        """
+        if not self.last_query:
+            return False
+        lowered = " ".join(query.lower().split())
+        return (lowered.startswith(_FOLLOW_UP_PREFIXES)
+                or bool(_LEADING_PRONOUN.match(lowered))
+                or bool(_PRONOUN_QUESTION.match(lowered)))
+
+    def rewrite_query(self, query: str, max_tokens: int = 100) -> str:
+        """
+        Rewrite a follow-up question into a standalone retrieval query.
+
+        Args:
+            query: User question
+            max_tokens: Token budget for the added context
+
+        Returns:
+            The query, extended with the previous standalone query if it is a
+            follow-up (so a chain of follow-ups keeps its original subject)
+        """
+        if not self.is_follow_up(query):
+            return query
+        return f"{query} (follow-up to: {truncate_to_tokens(self.last_query, max_tokens)})"
@@ -0,0 +1,159 @@
+"""
+Ingestion Checkpoints
+
+Records durable progress while a PDF is ingested so that a crashed or killed
+run can resume where it stopped instead of starting again from page 1:
+
+- pages_extracted:   pages durably written to the extraction cache
+- chunks_total:      chunks produced from the extracted text
+- chunks_embedded:   chunks embedded and written to the staging collection
+- batches_committed: batches whose write to the staging collection completed
+
+A checkpoint belongs to one (collection, PDF content, settings) combination and
+remembers the staging collection being filled. Batches are written with
+deterministic ids using upsert, so replaying a batch that was only partly
+written before a crash never duplicates chunks.
+"""
+
+import hashlib
+import json
+import os
+import time
+from typing import Any, Dict, Set
+
+# Directory where checkpoint files are stored
+DEFAULT_CHECKPOINT_DIR = os.getenv("INGEST_CHECKPOINT_DIR", ".ingest_checkpoints")
+
+
+def settings_fingerprint(settings: Dict[str, Any]) -> str:
+    """
+    Fingerprint the settings that determine the chunks of a document.
+
+    Args:
+        settings: Chunking/de-duplication settings
+
+    Returns:
+        Short hex digest of the settings
+    """
+    encoded = json.dumps(settings, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()[:16]
+
+
+class IngestCheckpoint:
+    """
+    Durable progress record for one ingestion run.
+    """
+
+    def __init__(self, path: str, state: Dict[str, Any]):
+        """
+        Initialize a checkpoint (use IngestCheckpoint.open to create one).
+
+        Args:
+            path: Path to the checkpoint file
+            state: Checkpoint state
+        """
+        self.path = path
+        self.state = state
+
+    @classmethod
+    def open(cls, collection_name: str, pdf_hash: str, settings: Dict[str, Any],
+             checkpoint_dir: str = DEFAULT_CHECKPOINT_DIR) -> "IngestCheckpoint":
+        """
+        Load the checkpoint for an ingestion run, or start a new one.
+
+        A stored checkpoint for the same collection is only resumed if it was made
+        for the same PDF contents and settings; otherwise it is discarded and its
+        stale staging collection is reported in state['stale_staging_collection'].
+
+        Args:
+            collection_name: Logical collection being built
+            pdf_hash: SHA-256 of the PDF contents
+            settings: Settings that determine the chunks
+            checkpoint_dir: Directory holding checkpoint files
+
+        Returns:
+            IngestCheckpoint for this run
+        """
+        path = os.path.join(checkpoint_dir, f"{collection_name}.json")
+        fingerprint = settings_fingerprint(settings)
+        stale_staging = None
+
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            if state.get("pdf_hash") == pdf_hash and state.get("settings") == fingerprint:
+                return cls(path, state)
+            stale_staging = state.get("staging_collection")
+
+        state = {
+            "collection_name": collection_name,
+            "pdf_hash": pdf_hash,
+            "settings": fingerprint,
+            "staging_collection": None,
+            "pages_extracted": 0,
+            "chunks_total": None,
+            "chunks_embedded": 0,
+            "batches_committed": 0,
+            "stale_staging_collection": stale_staging,
+            "started_at": time.time(),
+        }
+        checkpoint = cls(path, state)
+        checkpoint.save()
+        return checkpoint
+
+    @property
+    def resuming(self) -> bool:
+        """True if an earlier run already made progress."""
+        return bool(self.state["pages_extracted"] or self.state["batches_committed"])
+
+    def save(self) -> None:
+        """Write the checkpoint durably (temporary file, fsync, atomic rename)."""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.state["updated_at"] = time.time()
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def update(self, **fields: Any) -> None:
+        """
+        Update checkpoint fields and save.
+
+        Args:
+            **fields: State fields to set
+        """
+        self.state.update(fields)
+        self.save()
+
+    def complete(self) -> None:
+        """Remove the checkpoint once the ingestion has been promoted."""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def staging_collections(checkpoint_dir: str = DEFAULT_CHECKPOINT_DIR) -> Set[str]:
+    """
+    List the staging collections of unfinished ingestions.
+
+    Args:
+        checkpoint_dir: Directory holding checkpoint files
+
+    Returns:
+        Physical names of the staging collections recorded in checkpoints
+    """
+    names = set()
+    if not os.path.isdir(checkpoint_dir):
+        return names
+    for file_name in os.listdir(checkpoint_dir):
+        if not file_name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(checkpoint_dir, file_name), 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            continue
+        names.update(name for name in (state.get("staging_collection"),
+                                       state.get("stale_staging_collection")) if name)
+    return names
@@ -0,0 +1,503 @@
+"""
+PDF Ingestion Daemon
+
+Keeps a collection in sync with one or more watched directories, so nobody has
+to rerun ``pdf_rag_chat.py --pdf`` by hand:
+
+1. Watching: the directories are scanned periodically (no extra dependencies).
+   A new, changed or deleted PDF is only reported once its size and modification
+   time have stayed the same for the debounce interval, so files that are still
+   being copied are not ingested half-written.
+2. Queueing: each change is written to a persistent SQLite queue. Jobs survive
+   restarts, a newer change to a file replaces its queued job, and jobs that
+   were running when the daemon died are picked up again.
+3. Processing: a bounded pool of worker threads updates the live collection in
+   place, one document at a time (pdf_rag_chat.upsert_document and
+   delete_document). New content is searchable as soon as its job finishes; the
+   other documents are never re-ingested. Failed jobs are retried with backoff.
+
+Usage:
+    python ingest_daemon.py --watch path/to/pdfs --collection_name library
+    python ingest_daemon.py --watch inbox --watch archive --collection_name library --workers 4
+    python ingest_daemon.py --watch path/to/pdfs --collection_name library --once
+"""
+
+import argparse
+import os
+import signal
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+# Default location of the persistent queue and watcher state
+DEFAULT_QUEUE_PATH = os.getenv("INGEST_QUEUE_PATH", ".ingest_queue.sqlite3")
+
+UPSERT = "upsert"
+DELETE = "delete"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    path TEXT NOT NULL,
+    action TEXT NOT NULL,
+    fingerprint TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    not_before REAL NOT NULL DEFAULT 0,
+    enqueued_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, not_before);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    fingerprint TEXT NOT NULL
+);
+"""
+
+
+class IngestQueue:
+    """
+    Persistent, crash-safe job queue and watcher state in a SQLite file.
+    """
+
+    def __init__(self, path: str = DEFAULT_QUEUE_PATH, max_attempts: int = 3,
+                 retry_delay: float = 5.0):
+        """
+        Open (or create) the queue.
+
+        Args:
+            path: Path of the SQLite file
+            max_attempts: Attempts before a job is marked as failed
+            retry_delay: Delay before the first retry, doubled on each further attempt
+        """
+        self.path = path
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+
+    def recover(self) -> int:
+        """
+        Requeue jobs that were running when the previous daemon stopped.
+
+        Returns:
+            Number of requeued jobs
+        """
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE jobs SET status = 'pending', updated_at = ? WHERE status = 'running'",
+                (time.time(),)
+            )
+            return cursor.rowcount
+
+    def enqueue(self, path: str, action: str, fingerprint: Optional[str] = None) -> None:
+        """
+        Queue a change to a file, replacing a still-pending job for the same file.
+
+        Args:
+            path: Path of the PDF
+            action: UPSERT or DELETE
+            fingerprint: Size/mtime fingerprint of the file version to ingest
+        """
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT id FROM jobs WHERE path = ? AND status = 'pending'", (path,)
+                ).fetchone()
+                if row:
+                    self._db.execute(
+                        "UPDATE jobs SET action = ?, fingerprint = ?, attempts = 0, not_before = 0, "
+                        "updated_at = ?, error = NULL WHERE id = ?",
+                        (action, fingerprint, now, row[0])
+                    )
+                else:
+                    self._db.execute(
+                        "INSERT INTO jobs (path, action, fingerprint, enqueued_at, updated_at) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (path, action, fingerprint, now, now)
+                    )
+
+                if action == DELETE:
+                    self._db.execute("DELETE FROM files WHERE path = ?", (path,))
+                else:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO files (path, fingerprint) VALUES (?, ?)",
+                        (path, fingerprint)
+                    )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        """
+        Take the oldest runnable job.
+
+        A file with a job already running is skipped, so two versions of the same
+        PDF are never processed concurrently.
+
+        Returns:
+            Job dictionary (id, path, action, fingerprint, attempts), or None
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, path, action, fingerprint, attempts FROM jobs "
+                "WHERE status = 'pending' AND not_before <= ? "
+                "AND path NOT IN (SELECT path FROM jobs WHERE status = 'running') "
+                "ORDER BY id LIMIT 1",
+                (time.time(),)
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute(
+                "UPDATE jobs SET status = 'running', updated_at = ? WHERE id = ?",
+                (time.time(), row[0])
+            )
+        return dict(zip(("id", "path", "action", "fingerprint", "attempts"), row))
+
+    def complete(self, job_id: int) -> None:
+        """Remove a finished job."""
+        with self._lock:
+            self._db.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def fail(self, job_id: int, error: str) -> bool:
+        """
+        Record a failed attempt and schedule a retry with exponential backoff.
+
+        Args:
+            job_id: Job id
+            error: Error message
+
+        Returns:
+            True if the job will be retried, False if it has given up
+        """
+        with self._lock:
+            (attempts,) = self._db.execute(
+                "SELECT attempts FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            attempts += 1
+            retry = attempts < self.max_attempts
+            self._db.execute(
+                "UPDATE jobs SET status = ?, attempts = ?, not_before = ?, updated_at = ?, "
+                "error = ? WHERE id = ?",
+                ("pending" if retry else "failed", attempts,
+                 time.time() + self.retry_delay * 2 ** (attempts - 1), time.time(), error, job_id)
+            )
+        return retry
+
+    def known_files(self) -> Dict[str, str]:
+        """
+        Get the last queued fingerprint of every known file.
+
+        Returns:
+            Dictionary of path -> fingerprint
+        """
+        with self._lock:
+            return dict(self._db.execute("SELECT path, fingerprint FROM files").fetchall())
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Count jobs by status.
+
+        Returns:
+            Dictionary of status -> number of jobs
+        """
+        with self._lock:
+            return dict(self._db.execute(
+                "SELECT status, COUNT(*) FROM jobs GROUP BY status"
+            ).fetchall())
+
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            self._db.close()
+
+
+def scan_pdfs(directories: List[str], recursive: bool = True) -> Dict[str, str]:
+    """
+    List the PDFs in the watched directories.
+
+    Args:
+        directories: Directories to scan
+        recursive: Also scan subdirectories
+
+    Returns:
+        Dictionary of absolute path -> 'size:mtime_ns' fingerprint
+    """
+    found = {}
+    pending = [os.path.abspath(directory) for directory in directories]
+    while pending:
+        directory = pending.pop()
+        try:
+            entries = list(os.scandir(directory))
+        except FileNotFoundError:
+            continue
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if recursive:
+                        pending.append(entry.path)
+                elif entry.is_file() and entry.name.lower().endswith(".pdf"):
+                    stat = entry.stat()
+                    found[entry.path] = f"{stat.st_size}:{stat.st_mtime_ns}"
+            except FileNotFoundError:
+                # Removed between listing and stat
+                continue
+    return found
+
+
+class DirectoryWatcher:
+    """
+    Polling watcher that reports PDF changes once they have settled.
+    """
+
+    def __init__(self, directories: List[str], queue: IngestQueue, debounce: float = 2.0,
+                 recursive: bool = True):
+        """
+        Initialize the watcher.
+
+        Args:
+            directories: Directories to watch
+            queue: Queue receiving the changes (and holding the known file state)
+            debounce: Seconds a change must stay unchanged before it is queued
+            recursive: Also watch subdirectories
+        """
+        self.directories = directories
+        self.queue = queue
+        self.debounce = debounce
+        self.recursive = recursive
+        # path -> (observed fingerprint or None for deleted, time first observed)
+        self._unsettled: Dict[str, Tuple[Optional[str], float]] = {}
+
+    def poll(self) -> List[Tuple[str, str]]:
+        """
+        Scan once and queue every change that has settled.
+
+        Returns:
+            List of (path, action) queued by this poll
+        """
+        now = time.monotonic()
+        current = scan_pdfs(self.directories, self.recursive)
+        known = self.queue.known_files()
+
+        changes = {path: fingerprint for path, fingerprint in current.items()
+                   if known.get(path) != fingerprint}
+        changes.update({path: None for path in known if path not in current})
+
+        # Forget files whose pending change was reverted
+        for path in list(self._unsettled):
+            if path not in changes:
+                del self._unsettled[path]
+
+        queued = []
+        for path, fingerprint in changes.items():
+            observed, since = self._unsettled.get(path, (fingerprint, now))
+            if observed != fingerprint:
+                # Still being written or replaced: restart the debounce window
+                observed, since = fingerprint, now
+            self._unsettled[path] = (observed, since)
+
+            if now - since >= self.debounce:
+                action = DELETE if fingerprint is None else UPSERT
+                self.queue.enqueue(path, action, fingerprint)
+                del self._unsettled[path]
+                queued.append((path, action))
+        return queued
+
+
+def load_pipeline():
+    """
+    Import the ingestion pipeline (pdf_rag_chat).
+
+    It is imported lazily so the queue and watcher can be used without ChromaDB.
+    pdf_rag_chat exits at import time when its configuration is invalid; that
+    is turned into an error the daemon can report.
+
+    Returns:
+        The pdf_rag_chat module
+    """
+    try:
+        import pdf_rag_chat
+    except SystemExit as e:
+        raise RuntimeError(f"Could not load the ingestion pipeline (exit status {e.code})") from None
+    return pdf_rag_chat
+
+
+class IngestDaemon:
+    """
+    Watches directories and applies queued changes with a bounded worker pool.
+    """
+
+    def __init__(self, directories: List[str], collection_name: str, workers: int = 2,
+                 poll_interval: float = 1.0, debounce: float = 2.0,
+                 queue_path: str = DEFAULT_QUEUE_PATH, compress_text: bool = False):
+        """
+        Initialize the daemon.
+
+        Args:
+            directories: Directories to watch
+            collection_name: Collection kept in sync with the directories
+            workers: Maximum number of documents ingested concurrently
+            poll_interval: Seconds between directory scans
+            debounce: Seconds a change must settle before it is queued
+            queue_path: Path of the persistent queue
+            compress_text: Keep chunk texts in the compressed text side store
+        """
+        self.collection_name = collection_name
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.compress_text = compress_text
+        self.queue = IngestQueue(queue_path)
+        self.watcher = DirectoryWatcher(directories, self.queue, debounce)
+        self._stop = threading.Event()
+        self._in_flight = 0
+        self._in_flight_lock = threading.Lock()
+        self.pipeline = None
+        self.processed = 0
+        self.failed = 0
+
+    def stop(self, *_) -> None:
+        """Ask the daemon to stop after the running jobs finish."""
+        self._stop.set()
+
+    def process_job(self, job: Dict[str, Any]) -> None:
+        """
+        Apply one queued change to the collection.
+
+        Args:
+            job: Job claimed from the queue
+        """
+        try:
+            pipeline = self.pipeline or load_pipeline()
+            if job["action"] == DELETE or not os.path.exists(job["path"]):
+                pipeline.delete_document(job["path"], self.collection_name)
+            else:
+                pipeline.upsert_document(
+                    job["path"],
+                    self.collection_name,
+                    compress_text=self.compress_text
+                )
+            self.queue.complete(job["id"])
+            with self._in_flight_lock:
+                self.processed += 1
+        except (Exception, SystemExit) as e:
+            # A worker must never leave its job 'running', whatever it raised
+            retry = self.queue.fail(job["id"], str(e) or type(e).__name__)
+            with self._in_flight_lock:
+                self.failed += 1
+            print(f"Error processing {job['path']}: {e} ({'will retry' if retry else 'giving up'})")
+        finally:
+            with self._in_flight_lock:
+                self._in_flight -= 1
+
+    def _dispatch(self, executor: ThreadPoolExecutor) -> int:
+        """Hand runnable jobs to idle workers; returns the number dispatched."""
+        dispatched = 0
+        while True:
+            with self._in_flight_lock:
+                if self._in_flight >= self.workers:
+                    break
+                job = self.queue.claim()
+                if job is None:
+                    break
+                self._in_flight += 1
+            print(f"Processing {job['action']}: {job['path']}")
+            executor.submit(self.process_job, job)
+            dispatched += 1
+        return dispatched
+
+    def run(self, once: bool = False) -> None:
+        """
+        Run until stopped (or, with once, until the current changes are applied).
+
+        Args:
+            once: Queue the PDFs as they are now, process the queue and return
+
+        Raises:
+            RuntimeError: If the ingestion pipeline cannot be loaded; no job is
+                claimed in that case
+        """
+        try:
+            self.pipeline = load_pipeline()
+        except RuntimeError:
+            self.queue.close()
+            raise
+
+        recovered = self.queue.recover()
+        if recovered:
+            print(f"Requeued {recovered} interrupted jobs")
+        if once:
+            self.watcher.debounce = 0
+
+        print(f"Watching {', '.join(self.watcher.directories)} for PDFs "
+              f"(collection '{self.collection_name}', {self.workers} workers)")
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ingest") as executor:
+            while not self._stop.is_set():
+                for path, action in self.watcher.poll():
+                    print(f"Queued {action}: {path}")
+                self._dispatch(executor)
+
+                if once:
+                    with self._in_flight_lock:
+                        idle = self._in_flight == 0
+                    if idle and not self.queue.stats().get("pending"):
+                        break
+                    self._stop.wait(0.1)
+                else:
+                    self._stop.wait(self.poll_interval)
+
+        print(f"Ingestion daemon stopped: {self.processed} jobs processed, "
+              f"{self.failed} failed attempts, queue: {self.queue.stats()}")
+        self.queue.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Watch directories and keep a collection in sync")
+    parser.add_argument("--watch", action="append", required=True, metavar="DIR",
+                        help="Directory to watch for PDFs (can be repeated)")
+    parser.add_argument("--collection_name", required=True,
+                        help="Name of the ChromaDB collection to keep in sync")
+    parser.add_argument("--workers", type=int, default=2,
+                        help="Maximum number of PDFs ingested concurrently")
+    parser.add_argument("--poll-interval", type=float, default=1.0,
+                        help="Seconds between directory scans")
+    parser.add_argument("--debounce", type=float, default=2.0,
+                        help="Seconds a file must stay unchanged before it is ingested")
+    parser.add_argument("--queue", default=DEFAULT_QUEUE_PATH,
+                        help="Path of the persistent job queue")
+    parser.add_argument("--compress-text", action="store_true",
+                        help="Keep chunk texts in a compressed side store instead of in ChromaDB")
+    parser.add_argument("--once", action="store_true",
+                        help="Apply the current changes and exit instead of watching")
+
+    args = parser.parse_args()
+
+    daemon = IngestDaemon(
+        args.watch,
+        args.collection_name,
+        workers=args.workers,
+        poll_interval=args.poll_interval,
+        debounce=args.debounce,
+        queue_path=args.queue,
+        compress_text=args.compress_text
+    )
+    signal.signal(signal.SIGINT, daemon.stop)
+    signal.signal(signal.SIGTERM, daemon.stop)
+    try:
+        daemon.run(once=args.once)
+    except RuntimeError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
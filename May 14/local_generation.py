@@ -0,0 +1,87 @@
+"""
+Local Stand-in Generation Backend
+
+Offline replacement for the Gemini model, for load tests, replays and
+development without an API key. Select it with GENERATION_BACKEND=local.
+
+It answers extractively: the context sentences sharing the most words with the
+question are returned. Before answering it sleeps for a configurable, jittered
+latency that mimics an API round trip, so generation latency still looks
+realistic when timed:
+
+    LOCAL_GENERATION_LATENCY_MS   mean simulated latency (default 300)
+    LOCAL_GENERATION_JITTER_MS    uniform jitter added or subtracted (default 100)
+"""
+
+import os
+import random
+import re
+import time
+from typing import Optional
+
+# Environment variable selecting the generation backend ('gemini' or 'local')
+BACKEND_ENV = "GENERATION_BACKEND"
+
+_WORD_PATTERN = re.compile(r"\w+")
+_SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+|\n+")
+
+
+class LocalResponse:
+    """Generation result with the same 'text' attribute as a Gemini response."""
+
+    def __init__(self, text: str):
+        self.text = text
+
+
+class LocalGenerativeModel:
+    """
+    Drop-in stand-in for genai.GenerativeModel that never leaves the machine.
+    """
+
+    def __init__(self, latency_ms: Optional[float] = None, jitter_ms: Optional[float] = None,
+                 max_sentences: int = 3):
+        """
+        Initialize the model.
+
+        Args:
+            latency_ms: Mean simulated latency (default: $LOCAL_GENERATION_LATENCY_MS or 300)
+            jitter_ms: Uniform jitter around the mean (default: $LOCAL_GENERATION_JITTER_MS or 100)
+            max_sentences: Number of context sentences in an answer
+        """
+        if latency_ms is None:
+            latency_ms = float(os.getenv("LOCAL_GENERATION_LATENCY_MS", "300"))
+        if jitter_ms is None:
+            jitter_ms = float(os.getenv("LOCAL_GENERATION_JITTER_MS", "100"))
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.max_sentences = max_sentences
+
+    def generate_content(self, prompt: str) -> LocalResponse:
+        """
+        Answer a RAG prompt from its own CONTEXT section.
+
+        Args:
+            prompt: Prompt with CONTEXT: and QUESTION: sections
+
+        Returns:
+            Response whose text is the best-matching context sentences
+        """
+        delay_ms = self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)
+        if delay_ms > 0:
+            time.sleep(delay_ms / 1000)
+
+        context, _, question = prompt.partition("QUESTION:")
+        context = context.partition("CONTEXT:")[2]
+        question = question.partition("ANSWER:")[0]
+
+        question_words = set(_WORD_PATTERN.findall(question.lower()))
+        sentences = [sentence.strip() for sentence in _SENTENCE_PATTERN.split(context)
+                     if sentence.strip()]
+        scored = [(len(question_words & set(_WORD_PATTERN.findall(sentence.lower()))), i)
+                  for i, sentence in enumerate(sentences)]
+        best = sorted(i for score, i in sorted(scored, reverse=True)[:self.max_sentences]
+                      if score > 0)
+
+        if not best:
+            return LocalResponse("I don't have enough information to answer this question.")
+        return LocalResponse(" ".join(sentences[i] for i in best))
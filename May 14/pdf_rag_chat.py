@@ -11,12 +11,24 @@ This script implements a Retrieval-Augmented Generation (RAG) system that:
 Usage:
     python pdf_rag_chat.py --pdf path/to/document.pdf
     python pdf_rag_chat.py --query "Your question about the document" --collection_name "collection_name"
+    python pdf_rag_chat.py --collection_name "collection_name" --export-snapshot path/to/snapshot
+    python pdf_rag_chat.py --import-snapshot path/to/snapshot
+    python pdf_rag_chat.py --route --query "Your question about any ingested document"
+    python pdf_rag_chat.py --collection_name "collection_name" --dump-jsonl collection.jsonl
+    python pdf_rag_chat.py --collection_name "collection_name" --queries-file questions.jsonl --output answers.jsonl
+    python pdf_rag_chat.py --collection_name "collection_name" --calibrate-relevance sample_questions.txt
 """
 
 import os
 import sys
 import argparse
-from typing import List, Dict, Any, Optional
+import atexit
+import contextlib
+import hashlib
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Iterable, Optional, TextIO
 import PyPDF2
 import chromadb
 from chromadb.utils import embedding_functions
@@ -24,30 +36,251 @@ import google.generativeai as genai
 from dotenv import load_dotenv
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 
+# Modules shared by all day folders live in ../shared
+SHARED_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "shared")
+if SHARED_DIR not in sys.path:
+    sys.path.insert(0, SHARED_DIR)
+
+from batch_qa import format_batch_stats, load_queries, run_batch
+from chunk_dedup import deduplicate_chunks, format_dedup_stats
+from collection_aliases import (AliasTable, promote_staging_collection,
+                                rebuild_with_alias_swap, staging_collection_name)
+from collection_router import CollectionRouter
+from conversation_memory import ConversationMemory
+from embedding_warmup import MODEL_DIR_ENV, format_warmup_report, warm_up_embedding_function
+from extraction_cache import file_hash, get_cached_pages
+from index_snapshot import (export_collection, iter_collection_pages, iter_collection_records,
+                            load_snapshot_into, read_manifest)
+from ingest_checkpoint import IngestCheckpoint, staging_collections
+from local_generation import BACKEND_ENV, LocalGenerativeModel
+from profiling import profile_session, profile_stage
+from query_decomposition import PLANNERS, decompose, retrieve_for_subqueries
+from query_log import record_query, start_recording, stop_recording
+from relevance_gate import (DEFAULT_MARGIN, DEFAULT_QUANTILE, MAX_DISTANCE_ENV, RelevanceGate,
+                            RelevanceThresholds, calibrate_threshold, format_gate_stats)
+from sharded_store import ShardedStore
+from single_flight import CoalescingEmbeddingFunction, SingleFlight, format_flight_stats
+from stage_files import CHUNKS, EMBEDDINGS, StageFile
+from store_access import (ACCESS_MODE_ENV, ACCESS_MODES, DEFAULT_SNAPSHOT_INTERVAL,
+                          SNAPSHOT_INTERVAL_ENV, SnapshotPublisher, SnapshotReader,
+                          StoreLockedError, WriterLock, release_chroma_clients, require_writable)
+from text_store import DOC_KEY, TextSideStore
+
 # Load environment variables
 load_dotenv()
 
+# Answers come from Gemini, or from the offline stand-in model with
+# GENERATION_BACKEND=local (for load tests and development without an API key)
+GENERATION_BACKEND = os.getenv(BACKEND_ENV, "gemini").lower()
+if GENERATION_BACKEND not in ("gemini", "local"):
+    print(f"Error: unknown {BACKEND_ENV} '{GENERATION_BACKEND}' (expected 'gemini' or 'local')")
+    sys.exit(1)
+
 # Get API key from environment
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if not GEMINI_API_KEY:
-    print("Error: GEMINI_API_KEY not found in environment variables")
+if GENERATION_BACKEND == "gemini":
+    if not GEMINI_API_KEY:
+        print("Error: GEMINI_API_KEY not found in environment variables")
+        sys.exit(1)
+    
+    # Configure Gemini API
+    genai.configure(api_key=GEMINI_API_KEY)
+
+# Number of shards the collections are spread over (1 = a single ChromaDB directory)
+NUM_SHARDS = int(os.getenv("CHROMA_NUM_SHARDS", "1"))
+SHARD_LAYOUT = os.getenv("CHROMA_SHARD_LAYOUT", "directories")
+
+PERSIST_DIRECTORY = "./chroma_db"
+
+# How this process shares the store with others (see store_access.py):
+#   direct  open the persist directory (one process at a time)
+#   writer  own the persist directory and publish snapshots of its writes
+#   reader  query the latest published snapshot; never write
+ACCESS_MODE = os.getenv(ACCESS_MODE_ENV, "direct").lower()
+if ACCESS_MODE not in ACCESS_MODES:
+    print(f"Error: unknown {ACCESS_MODE_ENV} '{ACCESS_MODE}' (expected one of {', '.join(ACCESS_MODES)})")
     sys.exit(1)
 
-# Configure Gemini API
-genai.configure(api_key=GEMINI_API_KEY)
+# Minimum seconds between two snapshot publishes in writer mode; writes made in
+# between are published together when the interval ends
+SNAPSHOT_INTERVAL = float(os.getenv(SNAPSHOT_INTERVAL_ENV, DEFAULT_SNAPSHOT_INTERVAL))
+
+# Side-store files written or reused this many seconds ago are never removed,
+# since an ingest still in progress may be about to reference them
+TEXT_STORE_MIN_AGE = float(os.getenv("TEXT_STORE_MIN_AGE", "60"))
+
+def open_store(directory: str):
+    """
+    Open the ChromaDB client, alias table, text side store, routing index and
+    relevance thresholds of a directory.
+    
+    Args:
+        directory: Persist directory or published snapshot
+        
+    Returns:
+        Tuple of (client, aliases, text_store, router, thresholds)
+    """
+    # A sharded store offers the same API and searches all shards in parallel
+    if NUM_SHARDS > 1:
+        store_client = ShardedStore(directory, NUM_SHARDS, layout=SHARD_LAYOUT)
+    else:
+        store_client = chromadb.PersistentClient(directory)
+    
+    # Logical collection names -> physical collections (swapped atomically on rebuild)
+    store_aliases = AliasTable(directory)
+    
+    # Compressed source texts of collections built with compress_text=True
+    store_texts = TextSideStore(os.path.join(directory, "text_store"))
+    
+    # Per-collection profiles used to pick which collections to search
+    store_router = CollectionRouter(directory)
+    
+    # Per-collection distance thresholds calibrated with --calibrate-relevance
+    store_thresholds = RelevanceThresholds(directory)
+    return store_client, store_aliases, store_texts, store_router, store_thresholds
+
+snapshot_publisher = None
+store_reader = None
+if ACCESS_MODE == "writer":
+    # Held until the process exits; a second writer fails here
+    writer_lock = WriterLock(PERSIST_DIRECTORY)
+    try:
+        writer_lock.acquire()
+    except StoreLockedError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    snapshot_publisher = SnapshotPublisher(PERSIST_DIRECTORY, min_interval=SNAPSHOT_INTERVAL)
+    # Publish writes still waiting for their interval before the process exits
+    atexit.register(snapshot_publisher.flush)
+elif ACCESS_MODE == "reader":
+    try:
+        store_reader = SnapshotReader(PERSIST_DIRECTORY)
+    except FileNotFoundError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+# Initialize ChromaDB
+client, aliases, text_store, router, thresholds = open_store(
+    store_reader.path if store_reader else PERSIST_DIRECTORY
+)
+if snapshot_publisher and snapshot_publisher.current() is None:
+    snapshot_publisher.publish()
 
-# Initialize ChromaDB client
-client = chromadb.PersistentClient("./chroma_db")
+# Snapshot (path, text store) the reader moved away from; closed on the next
+# move, after queries still running on it have finished
+_retired_snapshot: Optional[tuple] = None
+_snapshot_lock = threading.Lock()
 
 # Create embedding function for ChromaDB
 embedding_function = embedding_functions.DefaultEmbeddingFunction()
 
-def extract_text_from_pdf(pdf_path: str) -> str:
+# Recorded in exported snapshots so imports can check they embed queries the same way
+EMBEDDING_MODEL_NAME = getattr(embedding_function, "MODEL_NAME", type(embedding_function).__name__)
+
+# Identical concurrent requests (e.g. a burst of users asking the same question)
+# share one embedding call, one ChromaDB search and one Gemini call
+embedding_flight = SingleFlight("embedding")
+retrieval_flight = SingleFlight("retrieval")
+generation_flight = SingleFlight("generation")
+embedding_function = CoalescingEmbeddingFunction(embedding_function, embedding_flight)
+
+# Collection name that searches the collections picked by the routing index
+ALL_COLLECTIONS = "*"
+
+# Number of collections a routed query is sent to
+ROUTE_TOP_M = int(os.getenv("ROUTE_TOP_M", "3"))
+
+# Maximum distance of a question's closest chunk for it to be sent to the model
+# (None: any retrieved chunk will do); collections calibrated with
+# --calibrate-relevance use their own threshold instead
+MAX_DISTANCE = float(os.environ[MAX_DISTANCE_ENV]) if os.getenv(MAX_DISTANCE_ENV) else None
+
+# Counts the questions answered without a model call
+relevance_gate = RelevanceGate()
+
+NO_INFORMATION_ANSWER = "No relevant information found to answer your question."
+
+# Searches the routed collections in parallel
+route_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="route")
+
+# Searches the sub-queries of a decomposed question in parallel (kept apart from
+# route_executor, since a routed sub-query search waits on that pool)
+subquery_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="subquery")
+
+# Chunking settings used by chunk_text
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+
+# Number of chunks embedded and written to ChromaDB per committed batch
+INGEST_BATCH_SIZE = 100
+
+def refresh_snapshot() -> None:
+    """
+    Move a reader process to the latest published snapshot (no-op for other modes).
+    """
+    global client, aliases, text_store, router, thresholds, _retired_snapshot
+    
+    if store_reader is None:
+        return
+    with _snapshot_lock:
+        previous = (store_reader.path, text_store)
+        if not store_reader.refresh():
+            return
+        if _retired_snapshot:
+            release_chroma_clients(_retired_snapshot[0])
+            _retired_snapshot[1].close()
+        _retired_snapshot = previous
+        client, aliases, text_store, router, thresholds = open_store(store_reader.path)
+
+def publish_snapshot() -> None:
+    """
+    Publish the store for reader processes after a write (writer mode only).
+    
+    Publishes are at least SNAPSHOT_INTERVAL seconds apart, since each one
+    copies the whole store; a write made sooner is published with the next one.
+    """
+    if snapshot_publisher is not None:
+        path = snapshot_publisher.request()
+        if path:
+            print(f"Published store snapshot for readers: {path}")
+        else:
+            print(f"Store snapshot for readers will be published within {SNAPSHOT_INTERVAL:g}s")
+
+def warm_up_model(model_dir: Optional[str] = None, required: bool = False) -> Optional[Dict[str, Any]]:
+    """
+    Load the embedding model up front so the first query does not pay for it.
+    
+    The model is loaded from a local directory only; it is never downloaded here.
+    
+    Args:
+        model_dir: Local model directory (default: $EMBEDDING_MODEL_DIR or Chroma's cache)
+        required: Exit if the model cannot be loaded instead of skipping the warmup
+        
+    Returns:
+        Warmup report, or None if the warmup was skipped
+    """
+    try:
+        with profile_stage("warmup"):
+            report = warm_up_embedding_function(embedding_function, model_dir, offline=True)
+    except FileNotFoundError as e:
+        if required:
+            print(f"Error: {e}")
+            sys.exit(1)
+        print(f"Skipping embedding model warmup: {e}")
+        return None
+    
+    print(format_warmup_report(report))
+    return report
+
+def extract_text_from_pdf(pdf_path: str, use_cache: bool = True,
+                          pages: Optional[List[int]] = None) -> str:
     """
     Extract text content from a PDF file.
     
     Args:
         pdf_path: Path to the PDF file
+        use_cache: Reuse (or populate) the on-disk extraction cache
+        pages: Optional zero-based page numbers to extract; all pages if omitted
         
     Returns:
         Extracted text as a string
@@ -57,9 +290,14 @@ def extract_text_from_pdf(pdf_path: str) -> str:
     
     text = ""
     try:
+        if use_cache:
+            with get_cached_pages(pdf_path, backend="pypdf2") as cached_pages:
+                return cached_pages.text(pages)
+        
         with open(pdf_path, 'rb') as file:
             pdf_reader = PyPDF2.PdfReader(file)
-            for page_num in range(len(pdf_reader.pages)):
+            page_numbers = range(len(pdf_reader.pages)) if pages is None else pages
+            for page_num in page_numbers:
                 page = pdf_reader.pages[page_num]
                 text += page.extract_text() + "\n\n"
     except Exception as e:
@@ -78,77 +316,683 @@ def chunk_text(text: str) -> List[str]:
         List of text chunks
     """
     text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=200,
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP,
         length_function=len
     )
     
     chunks = text_splitter.split_text(text)
     return chunks
 
-def store_chunks_in_chroma(chunks: List[str], collection_name: str) -> None:
+def commit_batches(collection, documents: List[str], metadatas: List[Dict[str, Any]],
+                   ids: List[str], batch_size: int = INGEST_BATCH_SIZE, start_batch: int = 0,
+                   on_commit=None, store_text: bool = True) -> None:
+    """
+    Embed and write chunks to a collection in idempotent batches.
+    
+    Batches are written with upsert and deterministic ids, so replaying a batch
+    that was only partly written overwrites it instead of duplicating it.
+    
+    Args:
+        collection: ChromaDB collection to write to
+        documents: Chunk texts
+        metadatas: Chunk metadata
+        ids: Chunk ids
+        batch_size: Number of chunks per batch
+        start_batch: Index of the first batch to write (earlier ones are committed)
+        on_commit: Optional callback (batches_committed, chunks_written) after each batch
+        store_text: Store the chunk texts in ChromaDB; if False only their
+            embeddings and metadata are written
+    """
+    num_batches = (len(documents) + batch_size - 1) // batch_size
+    for batch in range(start_batch, num_batches):
+        start = batch * batch_size
+        end = min(start + batch_size, len(documents))
+        with profile_stage("embed_batch"):
+            if store_text:
+                collection.upsert(
+                    documents=documents[start:end],
+                    metadatas=metadatas[start:end],
+                    ids=ids[start:end]
+                )
+            else:
+                collection.upsert(
+                    embeddings=embedding_function(documents[start:end]),
+                    metadatas=metadatas[start:end],
+                    ids=ids[start:end]
+                )
+        if on_commit:
+            on_commit(batch + 1, end)
+
+def build_chunk_records(chunks: List[str], deduplicate: bool = True, dedup_threshold: float = 0.9,
+                        compress_text: bool = False, source_text: Optional[str] = None,
+                        id_prefix: str = "", extra_metadata: Optional[Dict[str, Any]] = None):
+    """
+    Turn chunks into the documents, metadata and ids written to ChromaDB.
+    
+    Args:
+        chunks: List of text chunks
+        deduplicate: Collapse exact and near-duplicate chunks
+        dedup_threshold: Minimum estimated similarity for two chunks to be near duplicates
+        compress_text: Store the source text in the text side store and record
+            each chunk's location in its metadata
+        source_text: Text the chunks were cut from (the chunks joined together if omitted)
+        id_prefix: Prefix for the chunk ids (e.g. to keep documents apart in one collection)
+        extra_metadata: Metadata added to every chunk
+        
+    Returns:
+        Tuple of (documents, metadatas, ids)
+    """
+    # Collapse repeated boilerplate (headers, footers, disclaimers) so it is
+    # embedded and stored only once
+    if deduplicate:
+        with profile_stage("dedup"):
+            dedup = deduplicate_chunks(chunks, threshold=dedup_threshold)
+        print(format_dedup_stats(dedup['stats']))
+        unique_chunks, sources = dedup['chunks'], dedup['sources']
+    else:
+        unique_chunks, sources = chunks, [[i] for i in range(len(chunks))]
+    
+    documents = []
+    metadatas = []
+    ids = []
+    
+    for chunk, chunk_sources in zip(unique_chunks, sources):
+        i = chunk_sources[0]
+        documents.append(chunk)
+        metadatas.append({
+            "source": "pdf",
+            "chunk_id": i,
+            "source_chunk_ids": ",".join(str(j) for j in chunk_sources),
+            "duplicate_count": len(chunk_sources),
+            **(extra_metadata or {})
+        })
+        ids.append(f"{id_prefix}chunk_{i}")
+    
+    # Record where each chunk lies in the compressed source text instead of
+    # storing (overlapping) chunk texts in ChromaDB
+    if compress_text:
+        spans = text_store.put_chunks(source_text or "\n\n".join(documents), documents)
+        for metadata, span in zip(metadatas, spans):
+            metadata.update(span)
+    
+    return documents, metadatas, ids
+
+def open_staging_collection(collection_name: str, checkpoint: IngestCheckpoint, total: int):
+    """
+    Open the staging collection recorded in a checkpoint, or start a new one.
+    
+    Args:
+        collection_name: Logical collection being built
+        checkpoint: Ingestion checkpoint of the build
+        total: Number of records the build writes
+        
+    Returns:
+        Tuple of (staging collection, index of the first batch still to write)
+    """
+    staging_name = checkpoint.state["staging_collection"]
+    start_batch = checkpoint.state["batches_committed"]
+    if staging_name and checkpoint.state["chunks_total"] == total:
+        try:
+            collection = client.get_collection(
+                name=staging_name,
+                embedding_function=embedding_function
+            )
+            print(f"Resuming at batch {start_batch + 1} in staging collection '{staging_name}'")
+            return collection, start_batch
+        except ValueError:
+            pass
+    
+    staging_name = staging_collection_name(collection_name)
+    collection = client.create_collection(
+        name=staging_name,
+        embedding_function=embedding_function
+    )
+    checkpoint.update(
+        staging_collection=staging_name,
+        chunks_total=total,
+        chunks_embedded=0,
+        batches_committed=0
+    )
+    return collection, 0
+
+def store_chunks_in_chroma(chunks: List[str], collection_name: str,
+                           deduplicate: bool = True, dedup_threshold: float = 0.9,
+                           checkpoint: Optional[IngestCheckpoint] = None,
+                           batch_size: int = INGEST_BATCH_SIZE,
+                           compress_text: bool = False,
+                           source_text: Optional[str] = None) -> None:
     """
     Store text chunks in ChromaDB.
     
     Args:
         chunks: List of text chunks to store
         collection_name: Name of the collection to store chunks in
+        deduplicate: Collapse exact and near-duplicate chunks before storing them
+        dedup_threshold: Minimum estimated similarity for two chunks to be near duplicates
+        checkpoint: Optional ingestion checkpoint; committed batches are recorded in
+            it and skipped when an interrupted run is resumed
+        batch_size: Number of chunks embedded and committed per batch
+        compress_text: Keep only embeddings and metadata in ChromaDB and store the
+            source text once, compressed, in the text side store
+        source_text: Text the chunks were cut from (used with compress_text; the
+            chunks joined together if omitted)
     """
-    # Create or get the collection
+    require_writable(ACCESS_MODE)
     try:
-        # Delete collection if it exists
-        try:
-            client.delete_collection(collection_name)
-            print(f"Deleted existing collection: {collection_name}")
-        except:
-            pass
-            
-        collection = client.create_collection(
-            name=collection_name,
-            embedding_function=embedding_function
+        documents, metadatas, ids = build_chunk_records(
+            chunks,
+            deduplicate=deduplicate,
+            dedup_threshold=dedup_threshold,
+            compress_text=compress_text,
+            source_text=source_text
         )
         
-        # Add documents to the collection
-        documents = []
-        metadatas = []
-        ids = []
-        
-        for i, chunk in enumerate(chunks):
-            documents.append(chunk)
-            metadatas.append({"source": "pdf", "chunk_id": i})
-            ids.append(f"chunk_{i}")
-        
-        # Add documents in batches if there are many
-        collection.add(
-            documents=documents,
-            metadatas=metadatas,
-            ids=ids
-        )
+        if checkpoint is None:
+            def build(collection):
+                commit_batches(collection, documents, metadatas, ids, batch_size,
+                               store_text=not compress_text)
+            
+            # Build into a staging collection and swap the alias once it is complete,
+            # so queries keep being served by the old index during the rebuild
+            rebuild_with_alias_swap(client, aliases, collection_name, build, embedding_function)
+        else:
+            collection, start_batch = open_staging_collection(collection_name, checkpoint,
+                                                              len(documents))
+            commit_batches(
+                collection, documents, metadatas, ids, batch_size, start_batch,
+                on_commit=lambda batches, written: checkpoint.update(
+                    batches_committed=batches,
+                    chunks_embedded=written
+                ),
+                store_text=not compress_text
+            )
+            
+            promote_staging_collection(client, aliases, collection_name, collection.name)
+            checkpoint.complete()
         
-        print(f"Successfully stored {len(chunks)} chunks in ChromaDB collection '{collection_name}'")
+        print(f"Successfully stored {len(documents)} chunks in ChromaDB collection '{collection_name}'")
+        update_route(collection_name)
+        collect_text_garbage()
+        publish_snapshot()
     
     except Exception as e:
         print(f"Error storing chunks in ChromaDB: {str(e)}")
         raise
 
-def retrieve_relevant_chunks(query: str, collection_name: str, n_results: int = 5) -> List[str]:
+def collect_text_garbage(candidates: Optional[Iterable[str]] = None,
+                         min_age: float = TEXT_STORE_MIN_AGE) -> List[str]:
+    """
+    Delete the side-store files no collection refers to any more.
+    
+    Args:
+        candidates: Ids of the side-store documents to check (default: all of them)
+        min_age: Keep files written or reused less than this many seconds ago
+        
+    Returns:
+        Ids of the deleted documents
+    """
+    require_writable(ACCESS_MODE)
+    unreferenced = set(text_store.doc_ids() if candidates is None else candidates)
+    
+    # Every physical collection counts, including ones an alias no longer points to
+    for collection in client.list_collections():
+        if not unreferenced:
+            break
+        where = {DOC_KEY: {"$in": sorted(unreferenced)}}
+        for page in iter_collection_pages(collection, include=["metadatas"], where=where):
+            unreferenced.difference_update(metadata[DOC_KEY] for metadata in page["metadatas"])
+    
+    removed = text_store.remove(unreferenced, min_age=min_age)
+    if removed:
+        print(f"Removed {len(removed)} unreferenced text side-store files")
+    return removed
+
+def record_text_documents(records: List[Dict[str, Any]]) -> set:
+    """
+    Collect the side-store documents a list of records refers to.
+    
+    Args:
+        records: Records with 'metadata' (see document_records)
+        
+    Returns:
+        Set of side-store document ids
+    """
+    return {record["metadata"][DOC_KEY] for record in records
+            if record["metadata"] and DOC_KEY in record["metadata"]}
+
+def export_snapshot(collection_name: str, path: str, batch_size: int = 1000) -> Dict[str, Any]:
+    """
+    Export a collection, including its embeddings, to a portable snapshot.
+
+    Args:
+        collection_name: Name of the collection to export
+        path: Snapshot directory to create
+        batch_size: Number of records read per page
+
+    Returns:
+        The snapshot manifest
+    """
+    refresh_snapshot()
+    collection = client.get_collection(
+        name=aliases.resolve(collection_name),
+        embedding_function=embedding_function
+    )
+    manifest = export_collection(
+        collection,
+        path,
+        batch_size=batch_size,
+        collection_name=collection_name,
+        embedding_model=EMBEDDING_MODEL_NAME
+    )
+    
+    # Chunk texts kept in the side store travel with the snapshot
+    doc_ids = {
+        metadata[DOC_KEY]
+        for page in iter_collection_pages(collection, batch_size, include=["metadatas"])
+        for metadata in page["metadatas"] if metadata and DOC_KEY in metadata
+    }
+    if doc_ids:
+        text_store.copy_documents(doc_ids, os.path.join(path, "text_store"))
+    
+    print(f"Exported {manifest['count']} records ({manifest['dimension']}-dim embeddings) "
+          f"from '{collection_name}' to {path}")
+    return manifest
+
+def iter_documents(collection_name: str, batch_size: int = 500,
+                   where: Optional[Dict[str, Any]] = None,
+                   include: tuple = ("documents", "metadatas")):
+    """
+    Iterate over a whole collection, one page of records in memory at a time.
+
+    Args:
+        collection_name: Name of the collection to read
+        batch_size: Number of records read per page
+        where: Optional metadata filter, as in collection.get
+        include: Fields to return: 'documents', 'metadatas' and/or 'embeddings'
+
+    Yields:
+        Record dictionaries with 'id' plus 'document', 'metadata' and 'embedding'
+        for the included fields
+    """
+    refresh_snapshot()
+    collection = client.get_collection(
+        name=aliases.resolve(collection_name),
+        embedding_function=embedding_function
+    )
+    yield from iter_collection_records(
+        collection,
+        batch_size,
+        include=list(include),
+        where=where,
+        resolve=text_store.resolve
+    )
+
+def dump_jsonl(collection_name: str, path: str, batch_size: int = 500,
+               where: Optional[Dict[str, Any]] = None,
+               include_embeddings: bool = False,
+               output: Optional[TextIO] = None) -> int:
+    """
+    Stream a collection to a JSONL file, one record per line.
+
+    Args:
+        collection_name: Name of the collection to dump
+        path: Output file, or '-' for standard output
+        batch_size: Number of records read per page
+        where: Optional metadata filter
+        include_embeddings: Also write each record's embedding vector
+        output: Stream written to when path is '-' (default: standard output)
+
+    Returns:
+        Number of records written
+    """
+    include = ("documents", "metadatas") + (("embeddings",) if include_embeddings else ())
+    if path == "-":
+        output = output or sys.stdout
+    else:
+        output = open(path, 'w', encoding='utf-8')
+    count = 0
+    try:
+        for record in iter_documents(collection_name, batch_size, where, include):
+            if record.get("embedding") is not None:
+                record["embedding"] = [float(value) for value in record["embedding"]]
+            output.write(json.dumps(record, ensure_ascii=False) + "\n")
+            count += 1
+    finally:
+        if path != "-":
+            output.close()
+        else:
+            output.flush()
+    
+    if path != "-":
+        print(f"Dumped {count} records from '{collection_name}' to {path}")
+    return count
+
+def import_snapshot(path: str, collection_name: Optional[str] = None,
+                    batch_size: int = 1000) -> str:
+    """
+    Load a snapshot into ChromaDB without re-embedding the chunks.
+
+    The snapshot is loaded into a staging collection and the alias is swapped to
+    it once complete, so an existing collection keeps serving queries meanwhile.
+
+    Args:
+        path: Snapshot directory
+        collection_name: Collection to load into (default: the exported collection's name)
+        batch_size: Number of records written per batch
+
+    Returns:
+        Name of the collection that was loaded
+    """
+    require_writable(ACCESS_MODE)
+    manifest = read_manifest(path)
+    collection_name = collection_name or manifest["collection_name"]
+
+    if manifest.get("embedding_model") not in (None, EMBEDDING_MODEL_NAME):
+        print(f"Warning: snapshot embeddings were made with '{manifest['embedding_model']}', "
+              f"but queries will be embedded with '{EMBEDDING_MODEL_NAME}'")
+
+    snapshot_texts = os.path.join(path, "text_store")
+    if os.path.isdir(snapshot_texts):
+        doc_ids = [name[:-len(".blocks")] for name in os.listdir(snapshot_texts)
+                   if name.endswith(".blocks")]
+        TextSideStore(snapshot_texts).copy_documents(doc_ids, text_store.directory)
+    
+    rebuild_with_alias_swap(
+        client,
+        aliases,
+        collection_name,
+        lambda collection: load_snapshot_into(collection, path, batch_size, manifest),
+        embedding_function,
+        metadata=manifest.get("collection_metadata")
+    )
+    print(f"Imported {manifest['count']} records from {path} into '{collection_name}'")
+    update_route(collection_name)
+    collect_text_garbage()
+    publish_snapshot()
+    return collection_name
+
+def load_stage_files(chunks_path: str, embeddings_path: str, collection_name: str,
+                     batch_size: int = 1000, resume: bool = True) -> int:
+    """
+    Bulk-load the output of the chunk and embed pipeline stages into a collection.
+    
+    The records are written with their precomputed embeddings into a staging
+    collection, and the alias is swapped to it once complete. With resume, the
+    batches committed are checkpointed, so an interrupted load continues where
+    it stopped.
+    
+    Args:
+        chunks_path: Chunks file written by the chunk stage
+        embeddings_path: Embeddings file written by the embed stage
+        collection_name: Collection to load into
+        batch_size: Number of records written per batch
+        resume: Checkpoint the load and resume an interrupted one
+        
+    Returns:
+        Number of records loaded
+    """
+    require_writable(ACCESS_MODE)
+    with StageFile(chunks_path) as chunks, StageFile(embeddings_path) as embeddings:
+        if chunks.kind != CHUNKS or embeddings.kind != EMBEDDINGS:
+            raise ValueError(f"Expected a chunks file and an embeddings file, got "
+                             f"{chunks.kind} and {embeddings.kind}")
+        if len(embeddings) != len(chunks):
+            raise ValueError(f"{embeddings_path} has {len(embeddings)} of {len(chunks)} chunks; "
+                             f"finish the embed stage first")
+        if embeddings.meta.get("model") != EMBEDDING_MODEL_NAME:
+            print(f"Warning: the chunks were embedded with '{embeddings.meta.get('model')}', "
+                  f"but queries will be embedded with '{EMBEDDING_MODEL_NAME}'")
+        
+        total = len(chunks)
+        
+        def write_batches(collection, start_batch: int = 0, on_commit=None) -> None:
+            num_batches = (total + batch_size - 1) // batch_size
+            for batch in range(start_batch, num_batches):
+                start = batch * batch_size
+                end = min(start + batch_size, total)
+                ids = chunks.column("id", start, end)
+                if embeddings.column("id", start, end) != ids:
+                    raise ValueError(f"{embeddings_path} was made from a different chunks file")
+                collection.upsert(
+                    ids=ids,
+                    embeddings=embeddings.column("embedding", start, end).tolist(),
+                    documents=chunks.column("text", start, end),
+                    metadatas=[json.loads(metadata)
+                               for metadata in chunks.column("metadata", start, end)]
+                )
+                if on_commit:
+                    on_commit(batch + 1, end)
+        
+        if not resume:
+            rebuild_with_alias_swap(client, aliases, collection_name, write_batches,
+                                    embedding_function)
+        else:
+            checkpoint = IngestCheckpoint.open(
+                collection_name,
+                chunks.fingerprint(),
+                {"embeddings": embeddings.fingerprint(), "batch_size": batch_size}
+            )
+            stale_staging = checkpoint.state.pop("stale_staging_collection", None)
+            if stale_staging:
+                try:
+                    client.delete_collection(stale_staging)
+                except Exception:
+                    pass
+            
+            collection, start_batch = open_staging_collection(collection_name, checkpoint, total)
+            write_batches(
+                collection,
+                start_batch,
+                on_commit=lambda batches, written: checkpoint.update(
+                    batches_committed=batches,
+                    chunks_embedded=written
+                )
+            )
+            promote_staging_collection(client, aliases, collection_name, collection.name)
+            checkpoint.complete()
+    
+    print(f"Loaded {total} records from {chunks_path} and {embeddings_path} into '{collection_name}'")
+    update_route(collection_name)
+    collect_text_garbage()
+    publish_snapshot()
+    return total
+
+def update_route(collection_name: str, added: Optional[List[Dict[str, Any]]] = None,
+                 removed: Optional[List[Dict[str, Any]]] = None) -> None:
+    """
+    Update a collection's routing profile after it was written.
+    
+    Given the chunks a write added and removed, only those are applied to the
+    stored profile. Without them (a collection written as a whole), or when the
+    stored profile cannot be updated that way (no profile yet for a non-empty
+    collection, or one stored before profiles kept running sums), the profile
+    is rebuilt from the whole collection.
+    
+    Args:
+        collection_name: Logical collection name
+        added: Records (with 'document' and 'embedding') the write added
+        removed: Records the write deleted or overwrote
+    """
+    try:
+        try:
+            collection = client.get_collection(
+                name=aliases.resolve(collection_name),
+                embedding_function=embedding_function
+            )
+        except ValueError:
+            # The collection no longer exists
+            router.remove(collection_name)
+            return
+        
+        if added is not None or removed is not None:
+            added, removed = added or [], removed or []
+            if collection_name in router.load() or collection.count() <= len(added):
+                try:
+                    router.apply_changes(
+                        collection_name,
+                        [(record["document"], record["embedding"]) for record in added],
+                        [(record["document"], record["embedding"]) for record in removed],
+                        embedding_function
+                    )
+                    return
+                except ValueError:
+                    pass
+            print(f"Rebuilding the routing profile of '{collection_name}' from the whole collection")
+        
+        records = iter_collection_records(collection, include=["documents", "embeddings"],
+                                          resolve=text_store.resolve)
+        profile = router.build_profile(
+            ((record["document"], record["embedding"]) for record in records),
+            embedding_function
+        )
+        router.update(collection_name, profile)
+    except Exception as e:
+        print(f"Warning: could not update the routing index for '{collection_name}': {str(e)}")
+
+def logical_collection_names() -> List[str]:
+    """
+    List the logical names of the collections in the store.
+    
+    Returns:
+        Alias names, plus collections that are neither served through an alias
+        nor a retired build or the staging collection of an unfinished ingestion
+    """
+    alias_map = aliases.load()
+    physical = {collection.name for collection in client.list_collections()}
+    builds = set(alias_map.values()) | aliases.retired_names() | staging_collections()
+    names = {alias for alias, target in alias_map.items() if target in physical}
+    names.update(physical - builds)
+    return sorted(names)
+
+def rebuild_routes() -> int:
+    """
+    Rebuild the routing profile of every collection (e.g. for collections
+    created before the routing index existed).
+    
+    Returns:
+        Number of collections indexed
+    """
+    require_writable(ACCESS_MODE)
+    names = logical_collection_names()
+    for stale in set(router.load()) - set(names):
+        router.remove(stale)
+    for name in names:
+        update_route(name)
+        print(f"Indexed collection '{name}' for routing")
+    publish_snapshot()
+    return len(names)
+
+def retrieve_routed_chunks(query: str, n_results: int = 5, top_m: Optional[int] = None,
+                           query_embedding=None, with_distances: bool = False,
+                           raise_errors: bool = False) -> List[Any]:
+    """
+    Retrieve relevant chunks from the collections the routing index picks for a query.
+    
+    The query is embedded once, sent to the top-M collections in parallel, and
+    the results are merged by distance.
+    
+    Args:
+        query: User query
+        n_results: Number of results to retrieve
+        top_m: Number of collections to search (default: ROUTE_TOP_M)
+        query_embedding: Precomputed query embedding, if any
+        with_distances: Return (chunk, distance) pairs instead of chunks
+        raise_errors: Raise search errors instead of returning what was found
+        
+    Returns:
+        List of relevant text chunks (or pairs), closest first
+    """
+    refresh_snapshot()
+    try:
+        if query_embedding is None:
+            query_embedding = embedding_function([query])[0]
+        routes = router.route(query_embedding, query, top_m or ROUTE_TOP_M)
+        if not routes:
+            print("The routing index is empty; run --rebuild-routes or ingest a PDF first")
+            return []
+        print(f"Routed to collections: {', '.join(f'{name} ({score:.2f})' for name, score in routes)}")
+        
+        def search(name: str):
+            collection = client.get_collection(
+                name=aliases.resolve(name),
+                embedding_function=embedding_function
+            )
+            results = collection.query(
+                query_embeddings=[list(map(float, query_embedding))],
+                n_results=n_results
+            )
+            documents = text_store.resolve(results['documents'][0], results['metadatas'][0])
+            return list(zip(results['distances'][0], documents))
+        
+        hits = []
+        for name, future in [(name, route_executor.submit(search, name)) for name, _ in routes]:
+            try:
+                hits.extend(future.result())
+            except Exception as e:
+                if raise_errors:
+                    raise
+                print(f"Error searching collection '{name}': {str(e)}")
+        
+        hits.sort(key=lambda hit: hit[0])
+        if with_distances:
+            return [(document, distance) for distance, document in hits[:n_results]]
+        return [document for _, document in hits[:n_results]]
+    
+    except Exception as e:
+        if raise_errors:
+            raise
+        print(f"Error retrieving routed chunks: {str(e)}")
+        return []
+
+def retrieve_relevant_chunks(query: str, collection_name: str, n_results: int = 5,
+                             with_distances: bool = False,
+                             raise_errors: bool = False) -> List[Any]:
     """
     Retrieve relevant chunks from ChromaDB based on a query.
     
+    Identical concurrent retrievals share one search.
+    
     Args:
         query: User query
-        collection_name: Name of the collection to search in
+        collection_name: Name of the collection to search in, or ALL_COLLECTIONS
+            to search the collections picked by the routing index
         n_results: Number of results to retrieve
+        with_distances: Return (chunk, distance) pairs instead of chunks
+        raise_errors: Raise retrieval errors instead of returning no chunks
         
     Returns:
-        List of relevant text chunks
+        List of relevant text chunks (or pairs), closest first
     """
+    hits = retrieval_flight.do(
+        (query, collection_name, n_results, raise_errors),
+        lambda: _retrieve_relevant_chunks(query, collection_name, n_results, raise_errors)
+    )
+    if with_distances:
+        return list(hits)
+    return [chunk for chunk, _ in hits]
+
+def _retrieve_relevant_chunks(query: str, collection_name: str, n_results: int,
+                              raise_errors: bool = False) -> List[tuple]:
+    if collection_name == ALL_COLLECTIONS:
+        return retrieve_routed_chunks(query, n_results, with_distances=True,
+                                      raise_errors=raise_errors)
+    
+    refresh_snapshot()
     try:
-        # Get the collection
-        collection = client.get_collection(
-            name=collection_name,
-            embedding_function=embedding_function
-        )
+        # Get the collection currently serving this name
+        try:
+            collection = client.get_collection(
+                name=aliases.resolve(collection_name),
+                embedding_function=embedding_function
+            )
+        except ValueError:
+            # The alias may have been swapped and its old collection dropped
+            # between resolving and opening it; resolve once more
+            collection = client.get_collection(
+                name=aliases.resolve(collection_name),
+                embedding_function=embedding_function
+            )
         
         # Query the collection
         results = collection.query(
@@ -156,67 +1000,302 @@ def retrieve_relevant_chunks(query: str, collection_name: str, n_results: int =
             n_results=n_results
         )
         
-        # Extract and return the documents
+        # Extract and return the documents, rebuilding texts kept in the side store
         if results and 'documents' in results and results['documents']:
-            return results['documents'][0]
+            documents = text_store.resolve(results['documents'][0], results['metadatas'][0])
+            return list(zip(documents, results['distances'][0]))
         else:
             return []
     
     except Exception as e:
+        if raise_errors:
+            raise
         print(f"Error retrieving chunks from ChromaDB: {str(e)}")
         return []
 
-def generate_answer(query: str, context: List[str]) -> str:
+def retrieve_relevant_chunks_batch(queries: List[str], collection_name: str,
+                                   n_results: int = 5, with_distances: bool = False,
+                                   raise_errors: bool = False) -> List[List[Any]]:
     """
-    Generate an answer to a query using Gemini API with context from retrieved chunks.
+    Retrieve relevant chunks for several queries with a single ChromaDB query.
     
     Args:
-        query: User query
-        context: List of relevant text chunks to use as context
+        queries: User queries
+        collection_name: Name of the collection to search in
+        n_results: Number of results to retrieve per query
+        with_distances: Return (chunk, distance) pairs instead of chunks
+        raise_errors: Raise retrieval errors instead of returning no chunks, so
+            the caller can tell a failed search from an empty one
         
     Returns:
-        Generated answer as a string
+        One list of relevant text chunks (or pairs) per query
     """
+    if not queries:
+        return []
+    
+    refresh_snapshot()
     try:
-        # Create the model
-        model = genai.GenerativeModel("models/gemini-1.5-flash")
+        if collection_name == ALL_COLLECTIONS:
+            # One embedding call for the batch, then one routed search per query
+            embeddings = embedding_function(queries)
+            return [retrieve_routed_chunks(query, n_results, query_embedding=embedding,
+                                           with_distances=with_distances,
+                                           raise_errors=raise_errors)
+                    for query, embedding in zip(queries, embeddings)]
         
-        # Combine context chunks
-        context_text = "\n\n".join(context)
+        try:
+            collection = client.get_collection(
+                name=aliases.resolve(collection_name),
+                embedding_function=embedding_function
+            )
+        except ValueError:
+            collection = client.get_collection(
+                name=aliases.resolve(collection_name),
+                embedding_function=embedding_function
+            )
         
-        # Create a prompt with the context and query
-        prompt = f"""
-        Based on the following information, please answer the question.
-        If the answer is not contained in the provided information, say "I don't have enough information to answer this question."
+        # Embed and search all queries in one call
+        results = collection.query(
+            query_texts=queries,
+            n_results=n_results
+        )
         
-        CONTEXT:
-        {context_text}
+        documents = results.get('documents') or [[] for _ in queries]
+        metadatas = results.get('metadatas') or [None for _ in queries]
+        chunks = [text_store.resolve(docs, metas) for docs, metas in zip(documents, metadatas)]
+        if with_distances:
+            distances = results.get('distances') or [[] for _ in queries]
+            return [list(zip(texts, dists)) for texts, dists in zip(chunks, distances)]
+        return chunks
+    
+    except Exception as e:
+        if raise_errors:
+            raise
+        print(f"Error retrieving chunks from ChromaDB: {str(e)}")
+        return [[] for _ in queries]
+
+def generation_model():
+    """
+    Create the model that generates answers (Gemini, or the local stand-in).
+    
+    Returns:
+        Model with a generate_content(prompt) method
+    """
+    if GENERATION_BACKEND == "local":
+        return LocalGenerativeModel()
+    return genai.GenerativeModel("models/gemini-1.5-flash")
+
+def retrieve_decomposed_chunks(query: str, collection_name: str, n_results: int = 5,
+                               planner: str = "heuristic", max_chunks: int = 10,
+                               with_distances: bool = False) -> List[Any]:
+    """
+    Retrieve chunks for a complex question by splitting it into sub-queries.
+    
+    All sub-queries are embedded in one call and searched concurrently; their
+    results are merged and de-duplicated.
+    
+    Args:
+        query: User query
+        collection_name: Name of the collection to search in, or ALL_COLLECTIONS
+        n_results: Number of results retrieved per sub-query
+        planner: 'heuristic' or 'llm' (asks the generation model for sub-queries)
+        max_chunks: Maximum number of merged chunks
+        with_distances: Return (chunk, distance) pairs instead of chunks; a chunk
+            found by several sub-queries keeps its smallest distance
         
-        QUESTION:
-        {query}
+    Returns:
+        List of relevant text chunks (or pairs)
+    """
+    generate = None
+    if planner == "llm":
+        if GENERATION_BACKEND == "local":
+            print("The local generation backend cannot plan queries; splitting heuristically")
+        else:
+            generate = lambda prompt: generation_model().generate_content(prompt).text
+    sub_queries = decompose(query, planner, generate)
+    if len(sub_queries) == 1:
+        return retrieve_relevant_chunks(query, collection_name, n_results,
+                                        with_distances=with_distances)
+    print(f"Sub-queries: {' | '.join(sub_queries)}")
+    
+    refresh_snapshot()
+    if collection_name == ALL_COLLECTIONS:
+        def search(sub_query: str, embedding) -> List[tuple]:
+            return retrieve_routed_chunks(sub_query, n_results, query_embedding=embedding,
+                                          with_distances=True)
+    else:
+        try:
+            collection = client.get_collection(
+                name=aliases.resolve(collection_name),
+                embedding_function=embedding_function
+            )
+        except Exception as e:
+            print(f"Error retrieving chunks from ChromaDB: {str(e)}")
+            return []
         
-        ANSWER:
-        """
+        def search(sub_query: str, embedding) -> List[tuple]:
+            results = collection.query(
+                query_embeddings=[list(map(float, embedding))],
+                n_results=n_results
+            )
+            documents = text_store.resolve(results['documents'][0], results['metadatas'][0])
+            return list(zip(documents, results['distances'][0]))
+    
+    result = retrieve_for_subqueries(sub_queries, embedding_function, search,
+                                     subquery_executor, max_chunks, key=lambda hit: hit[0],
+                                     score=lambda hit: hit[1])
+    print(f"Retrieved {len(result['chunks'])} distinct chunks for {len(sub_queries)} sub-queries "
+          f"(embedding {result['embed_s'] * 1000:.0f} ms, search {result['search_s'] * 1000:.0f} ms)")
+    if with_distances:
+        return result['chunks']
+    return [chunk for chunk, _ in result['chunks']]
+
+def generate_answer(query: str, context: List[str], history: Optional[str] = None,
+                    raise_errors: bool = False) -> str:
+    """
+    Generate an answer to a query using Gemini API with context from retrieved chunks.
+    
+    Identical concurrent requests (same query, context and history) share one
+    model call, and all of them receive its answer or its error.
+    
+    Args:
+        query: User query
+        context: List of relevant text chunks to use as context
+        history: Optional (already budgeted) summary of the conversation so far
+        raise_errors: Raise API errors instead of returning an apology, so the
+            caller can retry
         
-        # Generate the response
-        response = model.generate_content(prompt)
-        return response.text
+    Returns:
+        Generated answer as a string
+    """
+    try:
+        return generation_flight.do(
+            (query, tuple(context), history),
+            lambda: _generate(query, context, history)
+        )
     
     except Exception as e:
+        if raise_errors:
+            raise
         print(f"Error generating answer with Gemini API: {str(e)}")
         return f"Sorry, I encountered an error: {str(e)}"
 
-def process_pdf(pdf_path: str, collection_name: Optional[str] = None) -> str:
+def _generate(query: str, context: List[str], history: Optional[str]) -> str:
+    # Create the model
+    model = generation_model()
+    
+    # Combine context chunks
+    context_text = "\n\n".join(context)
+    
+    # Include the conversation so far for follow-up questions
+    history_section = f"CONVERSATION SO FAR:\n{history}\n\n" if history else ""
+    
+    # Create a prompt with the context and query
+    prompt = f"""
+    Based on the following information, please answer the question.
+    If the answer is not contained in the provided information, say "I don't have enough information to answer this question."
+    
+    {history_section}CONTEXT:
+    {context_text}
+    
+    QUESTION:
+    {query}
+    
+    ANSWER:
+    """
+    
+    # Generate the response
+    response = model.generate_content(prompt)
+    return response.text
+
+def single_flight_report() -> str:
+    """
+    Report how many embedding, retrieval and generation calls were coalesced.
+    
+    Returns:
+        One line per stage
+    """
+    return "Request coalescing:\n" + format_flight_stats(
+        [embedding_flight, retrieval_flight, generation_flight])
+
+def relevance_threshold(collection_name: str) -> Optional[float]:
+    """
+    Get the maximum distance a question's closest chunk may have in a collection.
+    
+    Args:
+        collection_name: Logical collection name, or ALL_COLLECTIONS
+        
+    Returns:
+        The collection's calibrated threshold, else MAX_DISTANCE (None: no gate)
+    """
+    calibrated = thresholds.get(collection_name)
+    return calibrated if calibrated is not None else MAX_DISTANCE
+
+def calibrate_relevance(queries_file: str, collection_name: str,
+                        quantile: float = DEFAULT_QUANTILE,
+                        margin: float = DEFAULT_MARGIN) -> Optional[float]:
+    """
+    Calibrate a collection's relevance threshold from questions it should be able to answer.
+    
+    Args:
+        queries_file: JSONL or plain-text file of representative, on-topic questions
+        collection_name: Logical collection name, or ALL_COLLECTIONS for routed questions
+        quantile: Percentile of the closest-chunk distances the threshold starts from
+        margin: Fraction added on top of that percentile
+        
+    Returns:
+        The stored threshold, or None if no question retrieved anything
+    """
+    require_writable(ACCESS_MODE)
+    queries = [item["query"] for item in load_queries(queries_file)]
+    print(f"Calibrating the relevance threshold of '{collection_name}' with {len(queries)} questions")
+    
+    hits = retrieve_relevant_chunks_batch(queries, collection_name, n_results=1,
+                                          with_distances=True)
+    best_distances = [query_hits[0][1] for query_hits in hits if query_hits]
+    if not best_distances:
+        print("No question retrieved any chunks; the threshold was not changed")
+        return None
+    if len(best_distances) < 20:
+        print(f"Warning: only {len(best_distances)} questions retrieved chunks; "
+              f"the threshold may be unreliable")
+    
+    max_distance = calibrate_threshold(best_distances, quantile, margin)
+    thresholds.update(collection_name, {
+        "max_distance": max_distance,
+        "samples": len(best_distances),
+        "quantile": quantile,
+        "margin": margin,
+        "min_distance": min(best_distances),
+        "median_distance": sorted(best_distances)[len(best_distances) // 2],
+    })
+    publish_snapshot()
+    print(f"Closest-chunk distances: min {min(best_distances):.4f}, "
+          f"max {max(best_distances):.4f}; threshold set to {max_distance:.4f}")
+    return max_distance
+
+def process_pdf(pdf_path: str, collection_name: Optional[str] = None,
+                use_cache: bool = True, deduplicate: bool = True,
+                resume: bool = True, batch_size: int = INGEST_BATCH_SIZE,
+                compress_text: bool = False) -> str:
     """
     Process a PDF file: extract text, chunk it, and store in ChromaDB.
     
     Args:
         pdf_path: Path to the PDF file
         collection_name: Optional name for the ChromaDB collection
+        use_cache: Reuse previously extracted page text for this PDF if available
+        deduplicate: Collapse exact and near-duplicate chunks before storing them
+        resume: Record progress checkpoints and resume an interrupted ingestion
+        batch_size: Number of chunks embedded and committed per batch
+        compress_text: Keep chunk texts in the compressed text side store
+            instead of in ChromaDB
         
     Returns:
         Name of the collection where chunks are stored
     """
+    require_writable(ACCESS_MODE)
+    
     # Extract filename without extension to use as collection name if not provided
     if collection_name is None:
         collection_name = os.path.splitext(os.path.basename(pdf_path))[0]
@@ -224,98 +1303,519 @@ def process_pdf(pdf_path: str, collection_name: Optional[str] = None) -> str:
     print(f"Processing PDF: {pdf_path}")
     print(f"Using collection name: {collection_name}")
     
+    checkpoint = None
+    if resume:
+        if not os.path.exists(pdf_path):
+            raise FileNotFoundError(f"PDF file not found: {pdf_path}")
+        pdf_hash = file_hash(pdf_path)
+        checkpoint = IngestCheckpoint.open(
+            collection_name,
+            pdf_hash,
+            {
+                "chunk_size": CHUNK_SIZE,
+                "chunk_overlap": CHUNK_OVERLAP,
+                "deduplicate": deduplicate,
+                "batch_size": batch_size,
+                "compress_text": compress_text
+            }
+        )
+        
+        # Drop the staging collection of an abandoned run for different input
+        stale_staging = checkpoint.state.pop("stale_staging_collection", None)
+        if stale_staging:
+            try:
+                client.delete_collection(stale_staging)
+            except Exception:
+                pass
+        
+        if checkpoint.resuming:
+            print(f"Resuming interrupted ingestion: {checkpoint.state['pages_extracted']} pages extracted, "
+                  f"{checkpoint.state['batches_committed']} batches committed")
+    
     # Extract text from PDF
     print("Extracting text from PDF...")
-    text = extract_text_from_pdf(pdf_path)
+    with profile_stage("extract"):
+        if checkpoint is not None and use_cache:
+            # Page-level progress is made durable by the extraction cache
+            with get_cached_pages(
+                pdf_path,
+                backend="pypdf2",
+                pdf_hash=pdf_hash,
+                progress=lambda pages: checkpoint.update(pages_extracted=pages)
+            ) as cached_pages:
+                text = cached_pages.text()
+                checkpoint.update(pages_extracted=len(cached_pages))
+        else:
+            text = extract_text_from_pdf(pdf_path, use_cache=use_cache)
     print(f"Extracted {len(text)} characters of text")
     
     # Chunk the text
     print("Chunking text...")
-    chunks = chunk_text(text)
+    with profile_stage("chunk"):
+        chunks = chunk_text(text)
     print(f"Created {len(chunks)} chunks")
     
     # Store chunks in ChromaDB
     print("Storing chunks in ChromaDB...")
-    store_chunks_in_chroma(chunks, collection_name)
+    with profile_stage("store"):
+        store_chunks_in_chroma(
+            chunks,
+            collection_name,
+            deduplicate=deduplicate,
+            checkpoint=checkpoint,
+            batch_size=batch_size,
+            compress_text=compress_text,
+            source_text=text
+        )
     
     return collection_name
 
-def answer_query(query: str, collection_name: str) -> str:
+def document_key(pdf_path: str) -> str:
+    """
+    Build the stable key identifying a PDF's chunks in a shared collection.
+    
+    Args:
+        pdf_path: Path to the PDF file
+        
+    Returns:
+        Short hex key derived from the absolute path
+    """
+    return hashlib.sha1(os.path.abspath(pdf_path).encode("utf-8")).hexdigest()[:16]
+
+def open_live_collection(collection_name: str):
+    """
+    Open the collection currently serving a name, creating it if it does not exist.
+    
+    Args:
+        collection_name: Logical collection name
+        
+    Returns:
+        ChromaDB collection
+    """
+    return client.get_or_create_collection(
+        name=aliases.resolve(collection_name),
+        embedding_function=embedding_function
+    )
+
+def document_records(collection, key: str) -> List[Dict[str, Any]]:
+    """
+    Read the chunks one document has in a shared collection.
+    
+    Args:
+        collection: ChromaDB collection
+        key: Document key (see document_key)
+        
+    Returns:
+        Records with 'id', 'document', 'metadata' and 'embedding'
+    """
+    return list(iter_collection_records(collection,
+                                        include=["documents", "metadatas", "embeddings"],
+                                        where={"doc_key": key}, resolve=text_store.resolve))
+
+def upsert_document(pdf_path: str, collection_name: str, use_cache: bool = True,
+                    deduplicate: bool = True, batch_size: int = INGEST_BATCH_SIZE,
+                    compress_text: bool = False) -> int:
+    """
+    Add or refresh one PDF in a collection shared by many documents.
+    
+    Unlike process_pdf, the collection is updated in place: the document's new
+    chunks are upserted first and its chunks that no longer exist are deleted
+    afterwards, so queries see the new content immediately and never an empty
+    document.
+    
+    Args:
+        pdf_path: Path to the PDF file
+        collection_name: Collection to update
+        use_cache: Reuse previously extracted page text for this PDF if available
+        deduplicate: Collapse exact and near-duplicate chunks within the document
+        batch_size: Number of chunks embedded and committed per batch
+        compress_text: Keep chunk texts in the compressed text side store
+        
+    Returns:
+        Number of chunks stored for the document
+    """
+    require_writable(ACCESS_MODE)
+    key = document_key(pdf_path)
+    with profile_stage("extract"):
+        text = extract_text_from_pdf(pdf_path, use_cache=use_cache)
+    with profile_stage("chunk"):
+        chunks = chunk_text(text)
+    
+    documents, metadatas, ids = build_chunk_records(
+        chunks,
+        deduplicate=deduplicate,
+        compress_text=compress_text,
+        source_text=text,
+        id_prefix=f"{key}:",
+        extra_metadata={"doc_key": key, "source_path": os.path.abspath(pdf_path)}
+    )
+    
+    collection = open_live_collection(collection_name)
+    # The document's previous chunks, taken out of its routing profile below
+    previous = document_records(collection, key)
+    commit_batches(collection, documents, metadatas, ids, batch_size,
+                   store_text=not compress_text)
+    
+    # Drop chunks left over from an older, longer version of the document
+    stale_ids = {record["id"] for record in previous} - set(ids)
+    if stale_ids:
+        collection.delete(ids=sorted(stale_ids))
+    
+    print(f"Stored {len(ids)} chunks of {pdf_path} in '{collection_name}' "
+          f"({len(stale_ids)} stale chunks removed)")
+    update_route(collection_name, added=document_records(collection, key), removed=previous)
+    # The side file of the document's previous text is shared until nothing uses it
+    collect_text_garbage(record_text_documents(previous))
+    publish_snapshot()
+    return len(ids)
+
+def delete_document(pdf_path: str, collection_name: str) -> int:
+    """
+    Remove one PDF's chunks from a collection shared by many documents.
+    
+    Args:
+        pdf_path: Path of the (deleted) PDF file
+        collection_name: Collection to update
+        
+    Returns:
+        Number of chunks removed
+    """
+    require_writable(ACCESS_MODE)
+    key = document_key(pdf_path)
+    collection = open_live_collection(collection_name)
+    removed = document_records(collection, key)
+    ids = [record["id"] for record in removed]
+    if ids:
+        collection.delete(ids=ids)
+        update_route(collection_name, removed=removed)
+        collect_text_garbage(record_text_documents(removed))
+        publish_snapshot()
+    print(f"Removed {len(ids)} chunks of {pdf_path} from '{collection_name}'")
+    return len(ids)
+
+def answer_query(query: str, collection_name: str,
+                 memory: Optional[ConversationMemory] = None,
+                 decompose_with: Optional[str] = None) -> str:
     """
     Answer a query using the RAG system.
     
     Args:
         query: User query
         collection_name: Name of the ChromaDB collection to search in
+        memory: Optional conversation memory for multi-turn sessions; the turn
+            is recorded in it
+        decompose_with: Split the question into sub-queries with this planner
+            ('heuristic' or 'llm') and retrieve for all of them; None for one search
         
     Returns:
         Generated answer as a string
     """
     print(f"Query: {query}")
     print(f"Searching in collection: {collection_name}")
+    record_query(query, collection_name)
+    
+    # Make follow-up questions searchable on their own
+    retrieval_query = memory.rewrite_query(query) if memory else query
+    if retrieval_query != query:
+        print(f"Rewritten retrieval query: {retrieval_query}")
     
     # Retrieve relevant chunks
     print("Retrieving relevant chunks...")
-    chunks = retrieve_relevant_chunks(query, collection_name)
+    with profile_stage("retrieve"):
+        if decompose_with:
+            hits = retrieve_decomposed_chunks(retrieval_query, collection_name,
+                                              planner=decompose_with, with_distances=True)
+        else:
+            hits = retrieve_relevant_chunks(retrieval_query, collection_name, with_distances=True)
     
-    if not chunks:
-        return "No relevant information found to answer your question."
+    # Answer without a model call when nothing retrieved is close enough
+    distances = [distance for _, distance in hits]
+    max_distance = relevance_threshold(collection_name)
+    if not relevance_gate.check(distances, max_distance):
+        if hits:
+            print(f"Closest chunk is at distance {min(distances):.4f}, beyond the relevance "
+                  f"threshold {max_distance:.4f}; skipping generation")
+        answer = NO_INFORMATION_ANSWER
+        if memory:
+            memory.add_turn(query, answer, retrieval_query)
+        return answer
     
+    chunks = [chunk for chunk, _ in hits]
     print(f"Retrieved {len(chunks)} relevant chunks")
     
     # Generate answer
     print("Generating answer...")
-    answer = generate_answer(query, chunks)
+    history = memory.history_text() if memory else None
+    with profile_stage("generate"):
+        answer = generate_answer(query, chunks, history=history)
+    
+    if memory:
+        memory.add_turn(query, answer, retrieval_query)
     
     return answer
 
-def interactive_mode(collection_name: str) -> None:
+def interactive_mode(collection_name: str, decompose_with: Optional[str] = None) -> None:
     """
     Run the RAG system in interactive mode, allowing the user to ask multiple questions.
     
     Args:
         collection_name: Name of the ChromaDB collection to search in
+        decompose_with: Optional query planner for complex questions (see answer_query)
     """
     print(f"Interactive mode started. Using collection: {collection_name}")
-    print("Type 'exit', 'quit', or 'q' to exit.")
+    print("Type 'exit', 'quit', or 'q' to exit. Type 'reset' to start a new conversation.")
+    
+    # Follow-up questions see a bounded summary of the earlier turns
+    memory = ConversationMemory()
     
     while True:
         query = input("\nEnter your question: ")
         
         if query.lower() in ["exit", "quit", "q"]:
+            print(format_gate_stats(relevance_gate.stats()))
             print("Exiting interactive mode.")
             break
         
-        answer = answer_query(query, collection_name)
+        if query.lower() == "reset":
+            memory.reset()
+            print("Conversation history cleared.")
+            continue
+        
+        answer = answer_query(query, collection_name, memory=memory,
+                              decompose_with=decompose_with)
         print("\nAnswer:")
         print("-" * 50)
         print(answer)
         print("-" * 50)
 
+def answer_queries_file(queries_file: str, collection_name: str, output_path: str,
+                        concurrency: int = 4, requests_per_minute: float = 60.0,
+                        burst: int = 4, max_retries: int = 5) -> Dict[str, Any]:
+    """
+    Answer every question in a file, streaming the results to a JSONL file.
+    
+    Questions already answered in the output file are skipped, so rerunning the
+    same command resumes a failed run.
+    
+    Args:
+        queries_file: JSONL or plain-text question file
+        collection_name: Name of the ChromaDB collection to search in
+        output_path: JSONL file the results are appended to
+        concurrency: Number of answers generated in parallel
+        requests_per_minute: Sustained Gemini request rate
+        burst: Requests allowed back to back before the rate applies
+        max_retries: Retries per Gemini request
+        
+    Returns:
+        Run statistics
+    """
+    queries = load_queries(queries_file)
+    print(f"Answering {len(queries)} questions from {queries_file} using collection: "
+          f"{collection_name}")
+    
+    max_distance = relevance_threshold(collection_name)
+    
+    def retrieve(batch: List[str]) -> List[List[tuple]]:
+        with profile_stage("retrieve"):
+            return retrieve_relevant_chunks_batch(batch, collection_name, with_distances=True,
+                                                  raise_errors=True)
+    
+    # Decided before the rate limiter, so a question the gate skips costs no request slot
+    def answer_directly(query: str, hits: List[tuple]) -> Optional[str]:
+        # Answer without a model call when nothing retrieved is close enough
+        if not relevance_gate.check([distance for _, distance in hits], max_distance):
+            return NO_INFORMATION_ANSWER
+        return None
+    
+    def generate(query: str, hits: List[tuple]) -> str:
+        with profile_stage("generate"):
+            return generate_answer(query, [chunk for chunk, _ in hits], raise_errors=True)
+    
+    stats = run_batch(
+        queries,
+        output_path,
+        retrieve,
+        generate,
+        concurrency=concurrency,
+        requests_per_minute=requests_per_minute,
+        burst=burst,
+        max_retries=max_retries,
+        answer_directly=answer_directly
+    )
+    print(format_batch_stats(stats))
+    print(format_gate_stats(relevance_gate.stats()))
+    print(single_flight_report())
+    print(f"Results written to {output_path}")
+    return stats
+
 def main():
     parser = argparse.ArgumentParser(description="PDF RAG Chat System")
     parser.add_argument("--pdf", help="Path to the PDF file to process")
     parser.add_argument("--query", help="Query to answer")
     parser.add_argument("--collection_name", help="Name of the ChromaDB collection to use")
     parser.add_argument("--interactive", action="store_true", help="Run in interactive mode")
+    parser.add_argument("--route", action="store_true",
+                        help="Search the collections the routing index picks for each question "
+                             "instead of one collection")
+    parser.add_argument("--route-top", type=int, default=ROUTE_TOP_M,
+                        help="Number of collections a routed question is sent to")
+    parser.add_argument("--decompose", nargs="?", const="heuristic", choices=PLANNERS,
+                        help="Split complex questions into sub-queries that are retrieved "
+                             "concurrently (planner: heuristic, the default, or llm)")
+    parser.add_argument("--max-distance", type=float, default=MAX_DISTANCE,
+                        help="Answer without calling the model when no retrieved chunk is "
+                             f"within this distance (default: ${MAX_DISTANCE_ENV}; "
+                             "calibrated collections use their own threshold)")
+    parser.add_argument("--calibrate-relevance", metavar="FILE",
+                        help="Calibrate the collection's relevance threshold from a file of "
+                             "questions it should be able to answer")
+    parser.add_argument("--rebuild-routes", action="store_true",
+                        help="Rebuild the routing index from all existing collections")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Re-parse the PDF instead of using the extraction cache")
+    parser.add_argument("--no-dedup", action="store_true",
+                        help="Store every chunk, even exact or near duplicates")
+    parser.add_argument("--no-resume", action="store_true",
+                        help="Do not checkpoint or resume an interrupted ingestion")
+    parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE,
+                        help="Number of chunks embedded and committed per batch")
+    parser.add_argument("--compress-text", action="store_true",
+                        help="Keep chunk texts in a compressed side store instead of in ChromaDB")
+    parser.add_argument("--gc-text-store", action="store_true",
+                        help="Delete text side-store files no collection refers to any more")
+    parser.add_argument("--queries-file", metavar="FILE",
+                        help="Answer every question in a JSONL or text file (one per line)")
+    parser.add_argument("--output", default="answers.jsonl",
+                        help="JSONL file --queries-file results are appended to; rerunning "
+                             "skips questions already answered there")
+    parser.add_argument("--concurrency", type=int, default=4,
+                        help="Number of answers generated in parallel in batch mode")
+    parser.add_argument("--requests-per-minute", type=float, default=60.0,
+                        help="Maximum sustained Gemini request rate in batch mode")
+    parser.add_argument("--burst", type=int, default=4,
+                        help="Gemini requests allowed back to back in batch mode")
+    parser.add_argument("--max-retries", type=int, default=5,
+                        help="Retries per failed Gemini request in batch mode")
+    parser.add_argument("--export-snapshot", metavar="DIR",
+                        help="Export the collection with its embeddings to a snapshot directory")
+    parser.add_argument("--dump-jsonl", metavar="FILE",
+                        help="Stream the collection to a JSONL file ('-' for standard output)")
+    parser.add_argument("--dump-where", type=json.loads, metavar="JSON",
+                        help="Metadata filter for --dump-jsonl, e.g. '{\"chunk_id\": 3}'")
+    parser.add_argument("--dump-embeddings", action="store_true",
+                        help="Include embedding vectors in --dump-jsonl output")
+    parser.add_argument("--import-snapshot", metavar="DIR",
+                        help="Load a snapshot directory into ChromaDB without re-embedding")
+    parser.add_argument("--model-dir", default=os.getenv(MODEL_DIR_ENV),
+                        help="Local embedding model directory to load offline "
+                             f"(default: ${MODEL_DIR_ENV} or Chroma's model cache)")
+    parser.add_argument("--no-warmup", action="store_true",
+                        help="Load the embedding model lazily on first use instead of at startup")
+    parser.add_argument("--record-queries", metavar="FILE",
+                        help="Append every answered query to a JSONL log for replay_load.py "
+                             "(default: $QUERY_LOG_PATH; off if neither is set)")
+    parser.add_argument("--profile", nargs="?", const="profile_report", metavar="DIR",
+                        help="Write CPU profiles, flamegraph stacks and per-stage peak memory "
+                             "to DIR (default: profile_report)")
     
     args = parser.parse_args()
     
+    # When records are dumped to standard output, it carries nothing else;
+    # status messages go to standard error instead
+    data_output = sys.stdout
+    messages = (contextlib.redirect_stdout(sys.stderr) if args.dump_jsonl == "-"
+                else contextlib.nullcontext())
+    with messages:
+        start_recording(args.record_queries)
+        try:
+            with profile_session(args.profile):
+                if not args.no_warmup:
+                    warm_up_model(args.model_dir, required=args.model_dir is not None)
+                run(args, parser, data_output)
+        finally:
+            stop_recording()
+
+def run(args: argparse.Namespace, parser: argparse.ArgumentParser,
+        data_output: Optional[TextIO] = None) -> None:
+    """
+    Run the command selected by the parsed command-line arguments.
+    
+    Args:
+        args: Parsed arguments
+        parser: Argument parser (used to print help on invalid input)
+        data_output: Stream '--dump-jsonl -' writes to (default: standard output)
+    """
+    global ROUTE_TOP_M, MAX_DISTANCE
+    ROUTE_TOP_M = args.route_top
+    MAX_DISTANCE = args.max_distance
+    
+    if args.rebuild_routes:
+        print(f"Indexed {rebuild_routes()} collections for routing")
+    
+    if args.gc_text_store:
+        collect_text_garbage()
+    
     # Process PDF if provided
-    if args.pdf:
-        collection_name = process_pdf(args.pdf, args.collection_name)
+    if args.import_snapshot:
+        collection_name = import_snapshot(args.import_snapshot, args.collection_name)
+    elif args.pdf:
+        collection_name = process_pdf(
+            args.pdf,
+            args.collection_name,
+            use_cache=not args.no_cache,
+            deduplicate=not args.no_dedup,
+            resume=not args.no_resume,
+            batch_size=args.batch_size,
+            compress_text=args.compress_text
+        )
     elif args.collection_name:
         collection_name = args.collection_name
+    elif args.route or args.rebuild_routes or args.gc_text_store:
+        collection_name = None
     else:
-        print("Error: Either --pdf or --collection_name must be provided")
+        print("Error: Either --pdf, --import-snapshot, --collection_name or --route must be provided")
         parser.print_help()
         sys.exit(1)
     
+    if (args.export_snapshot or args.dump_jsonl) and collection_name is None:
+        print("Error: --export-snapshot and --dump-jsonl need a collection (--collection_name)")
+        sys.exit(1)
+    
+    if args.export_snapshot:
+        export_snapshot(collection_name, args.export_snapshot)
+    
+    if args.dump_jsonl:
+        dump_jsonl(collection_name, args.dump_jsonl, where=args.dump_where,
+                   include_embeddings=args.dump_embeddings, output=data_output)
+    
+    # Questions go to the collections the routing index picks
+    if args.route:
+        collection_name = ALL_COLLECTIONS
+    
+    if args.calibrate_relevance:
+        if collection_name is None:
+            print("Error: --calibrate-relevance needs a collection (--collection_name or --route)")
+            sys.exit(1)
+        calibrate_relevance(args.calibrate_relevance, collection_name)
+    
     # Answer query or run in interactive mode
-    if args.interactive:
-        interactive_mode(collection_name)
+    if args.queries_file:
+        stats = answer_queries_file(
+            args.queries_file,
+            collection_name,
+            args.output,
+            concurrency=args.concurrency,
+            requests_per_minute=args.requests_per_minute,
+            burst=args.burst,
+            max_retries=args.max_retries
+        )
+        if stats["error"]:
+            print("Some questions failed; rerun the same command to retry them.")
+            sys.exit(1)
+    elif args.interactive:
+        interactive_mode(collection_name, decompose_with=args.decompose)
     elif args.query:
-        answer = answer_query(args.query, collection_name)
+        answer = answer_query(args.query, collection_name, decompose_with=args.decompose)
         print("\nAnswer:")
         print("-" * 50)
         print(answer)
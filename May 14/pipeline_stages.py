@@ -0,0 +1,400 @@
+"""
+Decoupled Ingestion Pipeline Stages
+
+Runs the steps of process_pdf as separate stages that exchange stage files
+(stage_files.py), so each can run in its own process or on its own machine:
+
+    extract   PDFs                          -> pages file (one row per page)
+    chunk     pages file                    -> chunks file (spans, texts, metadata)
+    embed     chunks file                   -> embeddings file (one vector per chunk)
+    load      chunks file + embeddings file -> ChromaDB collection
+
+Every stage appends to its output and picks up where it stopped when it is run
+again with the same arguments: extraction continues at the first missing page,
+chunking skips documents already chunked, embedding continues at the first
+chunk without a vector, and loading resumes at the first uncommitted batch of
+its staging collection. Only the load stage opens ChromaDB (and needs the
+pdf_rag_chat configuration); the other stages need neither ChromaDB nor a
+Gemini API key.
+
+Usage:
+    python pipeline_stages.py extract docs/*.pdf --out pages.stage
+    python pipeline_stages.py chunk pages.stage --out chunks.stage
+    python pipeline_stages.py embed chunks.stage --out embeddings.stage
+    python pipeline_stages.py load chunks.stage embeddings.stage --collection_name docs
+    python pipeline_stages.py info chunks.stage
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+# Modules shared by all day folders live in ../shared
+SHARED_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "shared")
+if SHARED_DIR not in sys.path:
+    sys.path.insert(0, SHARED_DIR)
+
+from chunk_dedup import deduplicate_chunks, format_dedup_stats
+from extraction_cache import BACKENDS, extract_pages, file_hash
+from stage_files import (CHUNK_COLUMNS, CHUNKS, EMBEDDING_COLUMNS, EMBEDDINGS, PAGE_COLUMNS,
+                         PAGES, StageFile, StageWriter, open_stage_file)
+from text_store import locate_chunks
+
+# Same chunking settings as pdf_rag_chat
+DEFAULT_CHUNK_SIZE = 1000
+DEFAULT_CHUNK_OVERLAP = 200
+
+# Text appended after every page when a document's text is rebuilt from its
+# pages (as the extraction cache does)
+PAGE_SEPARATOR = "\n\n"
+
+
+def run_extract(pdf_paths: List[str], pages_path: str, backend: str = "pypdf2",
+                sync_every: int = 25) -> Dict[str, int]:
+    """
+    Extract the pages of PDFs into a pages file.
+
+    Documents are identified by the SHA-256 of their contents; a document whose
+    last page is already in the file (or that was already given in this run,
+    e.g. as a copy under another path) is skipped, and a partly extracted one
+    continues at its first missing page.
+
+    Args:
+        pdf_paths: PDF files to extract
+        pages_path: Pages file to append to
+        backend: Extraction backend ('pypdf2' or 'pymupdf')
+        sync_every: Number of pages written (and synced) per block
+
+    Returns:
+        Counts of documents extracted and skipped, and pages written
+    """
+    stats = {"documents": 0, "skipped": 0, "pages": 0}
+    with StageWriter(pages_path, PAGES, PAGE_COLUMNS, meta={"backend": backend}) as writer:
+        extracted: Dict[str, int] = defaultdict(int)
+        complete = set()
+        existing = open_stage_file(pages_path, PAGES)
+        if existing is not None:
+            with existing:
+                for doc, page, last in zip(existing.column("doc"), existing.column("page"),
+                                           existing.column("last")):
+                    extracted[doc] = max(extracted[doc], int(page) + 1)
+                    if last:
+                        complete.add(doc)
+
+        for pdf_path in pdf_paths:
+            doc = file_hash(pdf_path)
+            if doc in complete:
+                print(f"Skipping {pdf_path}: already extracted")
+                stats["skipped"] += 1
+                continue
+
+            start_page = extracted[doc]
+            if start_page:
+                print(f"Resuming extraction of {pdf_path} at page {start_page + 1}")
+            else:
+                print(f"Extracting {pdf_path}")
+
+            # Pages are written one page behind extraction, so the last page
+            # can be flagged as such
+            batch = {name: [] for name, _ in PAGE_COLUMNS}
+            previous = None
+            page_num = start_page
+            for text in extract_pages(pdf_path, backend, start_page=start_page):
+                if previous is not None:
+                    _add_page(batch, doc, pdf_path, page_num - 1, previous, last=False)
+                    if len(batch["page"]) >= sync_every:
+                        writer.append(batch)
+                        batch = {name: [] for name, _ in PAGE_COLUMNS}
+                previous = text
+                page_num += 1
+            if previous is not None:
+                _add_page(batch, doc, pdf_path, page_num - 1, previous, last=True)
+            writer.append(batch)
+            extracted[doc] = page_num
+            complete.add(doc)
+
+            stats["documents"] += 1
+            stats["pages"] += page_num - start_page
+            print(f"Extracted {page_num} pages of {pdf_path}")
+    return stats
+
+
+def _add_page(batch: Dict[str, list], doc: str, pdf_path: str, page: int, text: str,
+              last: bool) -> None:
+    batch["doc"].append(doc)
+    batch["source"].append(os.path.abspath(pdf_path))
+    batch["page"].append(page)
+    batch["last"].append(int(last))
+    batch["text"].append(text)
+
+
+def _row_ranges(rows: List[int]) -> List[Tuple[int, int]]:
+    """Group row numbers into (start, end) ranges of consecutive rows."""
+    ranges = []
+    for row in sorted(rows):
+        if ranges and ranges[-1][1] == row:
+            ranges[-1] = (ranges[-1][0], row + 1)
+        else:
+            ranges.append((row, row + 1))
+    return ranges
+
+
+def run_chunk(pages_path: str, chunks_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE,
+              chunk_overlap: int = DEFAULT_CHUNK_OVERLAP, deduplicate: bool = True,
+              dedup_threshold: float = 0.9) -> Dict[str, int]:
+    """
+    Chunk every completely extracted document of a pages file into a chunks file.
+
+    Each document's chunks are appended as one block, so a document is either
+    fully in the chunks file or not at all; documents already there are skipped.
+
+    Args:
+        pages_path: Pages file to read
+        chunks_path: Chunks file to append to
+        chunk_size: Maximum chunk length in characters
+        chunk_overlap: Characters shared by consecutive chunks
+        deduplicate: Collapse exact and near-duplicate chunks within a document
+        dedup_threshold: Minimum estimated similarity for two chunks to be near duplicates
+
+    Returns:
+        Counts of documents chunked, skipped and still incomplete, and chunks written
+    """
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=len
+    )
+    settings = {"chunk_size": chunk_size, "chunk_overlap": chunk_overlap,
+                "deduplicate": deduplicate, "dedup_threshold": dedup_threshold}
+    stats = {"documents": 0, "skipped": 0, "incomplete": 0, "chunks": 0}
+
+    with StageFile(pages_path) as pages, \
+            StageWriter(chunks_path, CHUNKS, CHUNK_COLUMNS, meta=settings) as writer:
+        if pages.kind != PAGES:
+            raise ValueError(f"{pages_path} is a {pages.kind} file, expected {PAGES}")
+
+        chunked = set()
+        existing = open_stage_file(chunks_path, CHUNKS)
+        if existing is not None:
+            with existing:
+                chunked = set(existing.column("doc"))
+
+        # Rows of each document, which are not necessarily contiguous when an
+        # extraction was resumed after other documents
+        rows: Dict[str, List[int]] = defaultdict(list)
+        complete = set()
+        for row, (doc, last) in enumerate(zip(pages.column("doc"), pages.column("last"))):
+            rows[doc].append(row)
+            if last:
+                complete.add(doc)
+        page_numbers = pages.column("page")
+
+        for doc, doc_rows in rows.items():
+            if doc in chunked:
+                stats["skipped"] += 1
+                continue
+            if doc not in complete:
+                stats["incomplete"] += 1
+                continue
+
+            # A page written twice (e.g. by an older run that extracted a copy
+            # of the document again) is used once
+            first_rows = {}
+            for row in doc_rows:
+                first_rows.setdefault(int(page_numbers[row]), row)
+            doc_rows = [first_rows[page] for page in sorted(first_rows)]
+            source = pages.column("source", doc_rows[0], doc_rows[0] + 1)[0]
+            # A document's pages are usually one run of rows, read in one call
+            page_texts = {}
+            for start, end in _row_ranges(doc_rows):
+                page_texts.update(zip(range(start, end), pages.column("text", start, end)))
+            text = "".join(page_texts[row] + PAGE_SEPARATOR for row in doc_rows)
+            chunks = text_splitter.split_text(text)
+
+            if deduplicate:
+                dedup = deduplicate_chunks(chunks, threshold=dedup_threshold)
+                print(format_dedup_stats(dedup['stats']))
+                unique_chunks, sources = dedup['chunks'], dedup['sources']
+            else:
+                unique_chunks, sources = chunks, [[i] for i in range(len(chunks))]
+
+            spans = locate_chunks(text, unique_chunks)
+            key = doc[:16]
+            batch = {name: [] for name, _ in CHUNK_COLUMNS}
+            for chunk, chunk_sources, span in zip(unique_chunks, sources, spans):
+                i = chunk_sources[0]
+                # -1 marks a chunk the splitter did not cut verbatim from the text
+                start, end = span or (-1, -1)
+                batch["doc"].append(doc)
+                batch["id"].append(f"{key}:chunk_{i}")
+                batch["start"].append(start)
+                batch["end"].append(end)
+                batch["text"].append(chunk)
+                batch["metadata"].append(json.dumps({
+                    "source": "pdf",
+                    "chunk_id": i,
+                    "source_chunk_ids": ",".join(str(j) for j in chunk_sources),
+                    "duplicate_count": len(chunk_sources),
+                    "doc_key": key,
+                    "source_path": source,
+                }))
+            writer.append(batch)
+
+            stats["documents"] += 1
+            stats["chunks"] += len(unique_chunks)
+            print(f"Chunked {os.path.basename(source)} into {len(unique_chunks)} chunks")
+
+    if stats["incomplete"]:
+        print(f"{stats['incomplete']} documents are not fully extracted yet; "
+              f"run this stage again once extraction has finished")
+    return stats
+
+
+def run_embed(chunks_path: str, embeddings_path: str, batch_size: int = 64,
+              model_dir: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Embed the chunks of a chunks file into an embeddings file, row for row.
+
+    Args:
+        chunks_path: Chunks file to read
+        embeddings_path: Embeddings file to append to
+        batch_size: Number of chunks embedded (and written) per batch
+        model_dir: Optional local embedding model directory to load offline
+
+    Returns:
+        Counts of chunks embedded and already embedded, and the embedding rate
+    """
+    from chromadb.utils import embedding_functions
+    from embedding_warmup import format_warmup_report, warm_up_embedding_function
+
+    embedding_function = embedding_functions.DefaultEmbeddingFunction()
+    model_name = getattr(embedding_function, "MODEL_NAME", type(embedding_function).__name__)
+    if model_dir:
+        print(format_warmup_report(warm_up_embedding_function(embedding_function, model_dir,
+                                                              offline=True)))
+
+    with StageFile(chunks_path) as chunks, \
+            StageWriter(embeddings_path, EMBEDDINGS, EMBEDDING_COLUMNS,
+                        meta={"model": model_name}) as writer:
+        if chunks.kind != CHUNKS:
+            raise ValueError(f"{chunks_path} is a {chunks.kind} file, expected {CHUNKS}")
+
+        start = writer.num_rows
+        if start > len(chunks):
+            raise ValueError(f"{embeddings_path} has more rows than {chunks_path}; "
+                             f"it was made from a different chunks file")
+        if start:
+            with StageFile(embeddings_path) as existing:
+                if existing.column("id", start - 1, start) != chunks.column("id", start - 1, start):
+                    raise ValueError(f"{embeddings_path} was made from a different chunks file")
+            print(f"Resuming embedding at chunk {start + 1} of {len(chunks)}")
+
+        started = time.perf_counter()
+        for batch_start in range(start, len(chunks), batch_size):
+            batch_end = min(batch_start + batch_size, len(chunks))
+            texts = chunks.column("text", batch_start, batch_end)
+            writer.append({
+                "id": chunks.column("id", batch_start, batch_end),
+                "chunk_row": list(range(batch_start, batch_end)),
+                "embedding": embedding_function(texts),
+            })
+            print(f"Embedded {batch_end}/{len(chunks)} chunks")
+        elapsed = time.perf_counter() - started
+
+    embedded = len(chunks) - start
+    return {"embedded": embedded, "already_embedded": start,
+            "chunks_per_s": embedded / elapsed if elapsed > 0 else 0.0}
+
+
+def describe(path: str) -> str:
+    """
+    Summarize a stage file.
+
+    Args:
+        path: Path to the stage file
+
+    Returns:
+        Kind, row count, columns and settings of the file
+    """
+    with StageFile(path) as stage_file:
+        columns = ", ".join(f"{name} ({column_type}"
+                            + (f"[{stage_file.dims[name]}]" if name in stage_file.dims else "")
+                            + ")" for name, column_type in stage_file.columns)
+        lines = [f"{path}: {stage_file.kind} file with {len(stage_file)} rows",
+                 f"  columns: {columns}",
+                 f"  settings: {json.dumps(stage_file.meta)}"]
+        if "doc" in dict(stage_file.columns):
+            lines.append(f"  documents: {len(set(stage_file.column('doc')))}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run one stage of the ingestion pipeline")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    extract_parser = subparsers.add_parser("extract", help="Extract PDF pages into a pages file")
+    extract_parser.add_argument("pdfs", nargs="+", help="PDF files to extract")
+    extract_parser.add_argument("--out", required=True, help="Pages file to append to")
+    extract_parser.add_argument("--backend", choices=BACKENDS, default="pypdf2",
+                                help="PDF text extraction backend")
+
+    chunk_parser = subparsers.add_parser("chunk", help="Chunk a pages file into a chunks file")
+    chunk_parser.add_argument("pages", help="Pages file written by the extract stage")
+    chunk_parser.add_argument("--out", required=True, help="Chunks file to append to")
+    chunk_parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                              help="Maximum chunk length in characters")
+    chunk_parser.add_argument("--chunk-overlap", type=int, default=DEFAULT_CHUNK_OVERLAP,
+                              help="Characters shared by consecutive chunks")
+    chunk_parser.add_argument("--no-dedup", action="store_true",
+                              help="Keep exact and near-duplicate chunks")
+
+    embed_parser = subparsers.add_parser("embed", help="Embed a chunks file into an embeddings file")
+    embed_parser.add_argument("chunks", help="Chunks file written by the chunk stage")
+    embed_parser.add_argument("--out", required=True, help="Embeddings file to append to")
+    embed_parser.add_argument("--batch-size", type=int, default=64,
+                              help="Number of chunks embedded per batch")
+    embed_parser.add_argument("--model-dir", help="Local embedding model directory to load offline")
+
+    load_parser = subparsers.add_parser("load", help="Bulk-load chunks and embeddings into ChromaDB")
+    load_parser.add_argument("chunks", help="Chunks file written by the chunk stage")
+    load_parser.add_argument("embeddings", help="Embeddings file written by the embed stage")
+    load_parser.add_argument("--collection_name", required=True, help="Collection to load into")
+    load_parser.add_argument("--batch-size", type=int, default=1000,
+                             help="Number of records written per batch")
+
+    info_parser = subparsers.add_parser("info", help="Describe a stage file")
+    info_parser.add_argument("path", help="Stage file")
+
+    args = parser.parse_args()
+
+    if args.command == "extract":
+        stats = run_extract(args.pdfs, args.out, backend=args.backend)
+        print(f"Extracted {stats['pages']} pages from {stats['documents']} documents "
+              f"({stats['skipped']} already extracted) into {args.out}")
+    elif args.command == "chunk":
+        stats = run_chunk(args.pages, args.out, args.chunk_size, args.chunk_overlap,
+                          deduplicate=not args.no_dedup)
+        print(f"Wrote {stats['chunks']} chunks of {stats['documents']} documents "
+              f"({stats['skipped']} already chunked) to {args.out}")
+    elif args.command == "embed":
+        stats = run_embed(args.chunks, args.out, args.batch_size, args.model_dir)
+        print(f"Embedded {stats['embedded']} chunks ({stats['already_embedded']} already embedded, "
+              f"{stats['chunks_per_s']:.1f} chunks/s) into {args.out}")
+    elif args.command == "load":
+        # Imported here so only the load stage needs ChromaDB and the pipeline configuration
+        import pdf_rag_chat
+
+        pdf_rag_chat.load_stage_files(args.chunks, args.embeddings, args.collection_name,
+                                      batch_size=args.batch_size)
+    else:
+        print(describe(args.path))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+"""
+Query Decomposition
+
+Complex questions ("How is X configured, and what are its limits?") often need
+chunks from several parts of a document that a single similarity search does
+not all rank highly. Decomposition splits the question into self-contained
+sub-queries, retrieves for all of them at once and merges the results before
+a single answer is generated.
+
+Sub-queries come from one of two planners:
+
+- heuristic: splits on question marks, semicolons, clause-level "and"
+  ("... and how ...") and comparisons ("difference between A and B"); free.
+  Later clauses refer back to the first one's subject ("what are its
+  limits"), so that subject is carried into them, and each side of a
+  comparison keeps the rest of the question ("A for small documents")
+- llm: asks the generation model for search queries; better on questions
+  without clear connectives, at the cost of one extra (short) model call
+
+All sub-queries are embedded in one batched call and searched concurrently, so
+retrieval takes about as long as a single search. Merging takes the results
+round-robin by rank, so each sub-query contributes its best chunks, and drops
+duplicate chunks.
+"""
+
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+PLANNERS = ("heuristic", "llm")
+
+DEFAULT_MAX_SUBQUERIES = 4
+
+_QUESTION_WORDS = r"(?:what|how|why|when|where|who|which|whose|is|are|was|were|does|do|did|can|could|should|will)"
+_CLAUSE_SPLIT = re.compile(
+    rf"\s*(?:;|\band also\b|\bas well as\b|,?\s*\band\b(?=\s+{_QUESTION_WORDS}\b))\s*",
+    re.IGNORECASE
+)
+_COMPARISON = re.compile(
+    r"(?:compare|comparison of|difference between|differences between|contrast)\s+(.+?)\s+"
+    r"(?:and|with|to|vs\.?|versus)\s+(.+?)\s*(?:[?.]|$)",
+    re.IGNORECASE
+)
+_LIST_MARKER = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s*")
+
+# Words before a clause's subject, and words its subject ends before
+_LEADING_WORDS = re.compile(
+    rf"^(?:(?:{_QUESTION_WORDS}|the|a|an|you|we|i)\s+)+",
+    re.IGNORECASE
+)
+_SUBJECT_END = re.compile(
+    r"\s+(?:\w+(?:ed|ing)|work|works|mean|means|affect|affects|differ|differs|change|changes|"
+    r"handle|handles|use|uses|need|needs|have|has|in|on|for|of|with|to|from|by|when|if|at|"
+    r"under|during)\b.*$",
+    re.IGNORECASE
+)
+_PRONOUN = re.compile(r"\b(its|their|it|they|them|this|that)\b", re.IGNORECASE)
+# A definite noun at the end of a clause ("what are the limits") refers back to the subject
+_BARE_DEFINITE = re.compile(r"\bthe\s+\w+(?:\s+\w+)?$", re.IGNORECASE)
+# Qualifier after the second side of a comparison ("B for small documents")
+_COMPARISON_TAIL = re.compile(
+    r"\s+((?:in terms of|with respect to|for|in|on|when|regarding|under|during)\s+.+)$",
+    re.IGNORECASE
+)
+
+_PLANNER_PROMPT = """Break the question below into at most {max_subqueries} short, self-contained search queries
+that together cover everything needed to answer it. Write one query per line, with no
+numbering and no other text. If the question is already simple, repeat it unchanged.
+
+QUESTION:
+{question}
+"""
+
+
+def _unique(queries: Sequence[str], max_subqueries: int) -> List[str]:
+    seen = set()
+    unique = []
+    for query in queries:
+        query = query.strip(" ,.;:")
+        key = query.lower()
+        if len(query) >= 3 and key not in seen:
+            seen.add(key)
+            unique.append(query)
+    return unique[:max_subqueries]
+
+
+def _subject(clause: str) -> str:
+    """Guess the subject of a clause: the words between its question words and its verb."""
+    subject = _LEADING_WORDS.sub("", clause.strip(" ,.;:?"))
+    return _SUBJECT_END.sub("", subject).strip()
+
+
+def _with_subject(clause: str, subject: str) -> str:
+    """Make a later clause self-contained by putting the question's subject into it."""
+    if not subject or subject.lower() in clause.lower():
+        return clause
+
+    def replace(match):
+        possessive = match.group(1).lower() in ("its", "their")
+        return f"{subject}'s" if possessive else subject
+
+    with_subject, count = _PRONOUN.subn(replace, clause, count=1)
+    if count:
+        return with_subject
+    clause = clause.strip(" ,.;:?")
+    if _BARE_DEFINITE.search(clause):
+        return f"{clause} of {subject}"
+    return clause
+
+
+def heuristic_subqueries(question: str, max_subqueries: int = DEFAULT_MAX_SUBQUERIES) -> List[str]:
+    """
+    Split a question into sub-queries with simple rules.
+
+    Later clauses get the subject of the first one in place of a pronoun ("its
+    limits") or after a bare definite noun ("the limits"); each side of a
+    comparison keeps the qualifier that follows it ("for small documents").
+
+    Args:
+        question: User question
+        max_subqueries: Maximum number of sub-queries
+
+    Returns:
+        Sub-queries (just the question itself if it cannot be split)
+    """
+    parts = []
+    subject = None
+    for sentence in re.split(r"(?<=\?)\s+", question.strip()):
+        comparison = _COMPARISON.search(sentence)
+        if comparison:
+            first, second = comparison.groups()
+            tail = _COMPARISON_TAIL.search(second)
+            rest = ""
+            if tail:
+                second, rest = second[:tail.start()], " " + tail.group(1)
+            parts.extend([first + rest, second + rest])
+            continue
+        for clause in _CLAUSE_SPLIT.split(sentence):
+            if subject is None:
+                subject = _subject(clause)
+                parts.append(clause)
+            else:
+                parts.append(_with_subject(clause, subject))
+
+    sub_queries = _unique(parts, len(parts))
+    if len(sub_queries) > max_subqueries:
+        print(f"Question has {len(sub_queries)} parts; searching the first {max_subqueries} "
+              f"separately (dropped: {' | '.join(sub_queries[max_subqueries:])})")
+        sub_queries = sub_queries[:max_subqueries]
+    return sub_queries if len(sub_queries) > 1 else [question.strip()]
+
+
+def llm_subqueries(question: str, generate: Callable[[str], str],
+                   max_subqueries: int = DEFAULT_MAX_SUBQUERIES) -> List[str]:
+    """
+    Ask a language model to split a question into search queries.
+
+    Falls back to the heuristic planner if the model call fails or returns nothing usable.
+
+    Args:
+        question: User question
+        generate: Function sending a prompt to the model and returning its text
+        max_subqueries: Maximum number of sub-queries
+
+    Returns:
+        Sub-queries
+    """
+    try:
+        text = generate(_PLANNER_PROMPT.format(question=question, max_subqueries=max_subqueries))
+    except Exception as e:
+        print(f"Query planner failed ({str(e)}); splitting the question heuristically")
+        return heuristic_subqueries(question, max_subqueries)
+
+    sub_queries = _unique([_LIST_MARKER.sub("", line) for line in text.splitlines()], max_subqueries)
+    return sub_queries or heuristic_subqueries(question, max_subqueries)
+
+
+def decompose(question: str, planner: str = "heuristic",
+              generate: Optional[Callable[[str], str]] = None,
+              max_subqueries: int = DEFAULT_MAX_SUBQUERIES) -> List[str]:
+    """
+    Split a question into sub-queries.
+
+    When the question is split, the question itself is searched as well, so
+    chunks that match it as a whole are not lost.
+
+    Args:
+        question: User question
+        planner: 'heuristic' or 'llm'
+        generate: Prompt -> text function (required for the 'llm' planner)
+        max_subqueries: Maximum number of sub-queries, not counting the question itself
+
+    Returns:
+        Queries to retrieve for, the question first
+    """
+    if planner not in PLANNERS:
+        raise ValueError(f"Unknown query planner: {planner}")
+    if planner == "llm" and generate is not None:
+        sub_queries = llm_subqueries(question, generate, max_subqueries)
+    else:
+        sub_queries = heuristic_subqueries(question, max_subqueries)
+
+    if len(sub_queries) == 1:
+        return [question.strip()]
+    return _unique([question] + sub_queries, max_subqueries + 1)
+
+
+def merge_results(results: List[List[Any]], max_chunks: int,
+                  key: Optional[Callable[[Any], Any]] = None,
+                  score: Optional[Callable[[Any], float]] = None) -> List[Any]:
+    """
+    Merge the ranked chunks of several sub-queries, dropping duplicates.
+
+    Args:
+        results: Ranked chunks of each sub-query
+        max_chunks: Maximum number of merged chunks
+        key: Function giving the identity of a result (default: the result
+            itself), e.g. the text of (chunk, distance) pairs
+        score: Function giving a result's distance; of duplicates, the one with
+            the smallest distance is kept (default: the first one seen)
+
+    Returns:
+        Chunks taken round-robin by rank
+    """
+    merged = []
+    positions = {}
+    for rank in range(max((len(chunks) for chunks in results), default=0)):
+        for chunks in results:
+            if rank >= len(chunks):
+                continue
+            identity = key(chunks[rank]) if key else chunks[rank]
+            position = positions.get(identity)
+            if position is None:
+                positions[identity] = len(merged)
+                merged.append(chunks[rank])
+            elif score is not None and score(chunks[rank]) < score(merged[position]):
+                merged[position] = chunks[rank]
+    return merged[:max_chunks]
+
+
+def retrieve_for_subqueries(sub_queries: List[str], embed: Callable[[List[str]], List[Any]],
+                            search: Callable[[str, Any], List[Any]],
+                            executor: ThreadPoolExecutor, max_chunks: int,
+                            key: Optional[Callable[[Any], Any]] = None,
+                            score: Optional[Callable[[Any], float]] = None) -> Dict[str, Any]:
+    """
+    Retrieve for all sub-queries concurrently and merge the results.
+
+    Args:
+        sub_queries: Queries from decompose
+        embed: Batched embedding function (called once for all sub-queries)
+        search: Function (sub-query, embedding) -> ranked chunks
+        executor: Thread pool the searches run on
+        max_chunks: Maximum number of merged chunks
+        key: Identity of a search result, for de-duplication (see merge_results)
+        score: Distance of a search result, for de-duplication (see merge_results)
+
+    Returns:
+        Dictionary with 'chunks' (merged), 'per_query' (chunks per sub-query)
+        and 'embed_s' / 'search_s' timings
+    """
+    start = time.perf_counter()
+    embeddings = embed(sub_queries)
+    embed_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    futures = [executor.submit(search, query, embedding)
+               for query, embedding in zip(sub_queries, embeddings)]
+    per_query = []
+    for query, future in zip(sub_queries, futures):
+        try:
+            per_query.append(future.result())
+        except Exception as e:
+            print(f"Error retrieving for sub-query {query!r}: {str(e)}")
+            per_query.append([])
+    search_s = time.perf_counter() - start
+
+    return {
+        "chunks": merge_results(per_query, max_chunks, key, score),
+        "per_query": per_query,
+        "embed_s": embed_s,
+        "search_s": search_s,
+    }
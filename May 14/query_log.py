@@ -0,0 +1,131 @@
+"""
+Query Log Recorder
+
+Opt-in recorder of the questions a running system answers, so production
+traffic can be replayed against a changed build (see replay_load.py). Each
+question is appended as one JSON line:
+
+    {"ts": 1715700000.123, "collection": "report", "query": "..."}
+
+Recording is enabled with --record-queries FILE or the QUERY_LOG_PATH
+environment variable; while it is off, record_query costs nothing.
+"""
+
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+# Environment variable naming the query log file
+QUERY_LOG_ENV = "QUERY_LOG_PATH"
+
+_active_recorder: Optional["QueryLogRecorder"] = None
+
+
+class QueryLogRecorder:
+    """
+    Thread-safe, append-only JSONL log of answered queries.
+    """
+
+    def __init__(self, path: str):
+        """
+        Open the log for appending.
+
+        Args:
+            path: JSONL log file
+        """
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+        self.recorded = 0
+
+    def record(self, query: str, collection_name: str) -> None:
+        """
+        Append a query to the log.
+
+        Args:
+            query: Query text
+            collection_name: Collection the query was answered from
+        """
+        line = json.dumps({"ts": time.time(), "collection": collection_name,
+                           "query": query}, ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+            self.recorded += 1
+
+    def close(self) -> None:
+        """Close the log file."""
+        with self._lock:
+            self._file.close()
+
+
+def start_recording(path: Optional[str] = None) -> Optional[QueryLogRecorder]:
+    """
+    Start recording queries.
+
+    Args:
+        path: Log file (default: $QUERY_LOG_PATH); recording stays off if neither is set
+
+    Returns:
+        The active recorder, or None
+    """
+    global _active_recorder
+
+    path = path or os.getenv(QUERY_LOG_ENV)
+    if not path:
+        return None
+    stop_recording()
+    _active_recorder = QueryLogRecorder(path)
+    print(f"Recording queries to {path}")
+    return _active_recorder
+
+
+def stop_recording() -> None:
+    """Stop recording queries and close the log."""
+    global _active_recorder
+
+    if _active_recorder is not None:
+        _active_recorder.close()
+        _active_recorder = None
+
+
+def record_query(query: str, collection_name: str) -> None:
+    """
+    Record a query if recording is on; a no-op otherwise.
+
+    Args:
+        query: Query text
+        collection_name: Collection the query was answered from
+    """
+    recorder = _active_recorder
+    if recorder is not None:
+        recorder.record(query, collection_name)
+
+
+def read_query_log(path: str) -> List[Dict[str, Any]]:
+    """
+    Read a query log, oldest entry first.
+
+    Args:
+        path: JSONL log file
+
+    Returns:
+        Log entries sorted by timestamp (a torn last line is ignored)
+    """
+    return sorted(_iter_entries(path), key=lambda entry: entry["ts"])
+
+
+def _iter_entries(path: str) -> Iterator[Dict[str, Any]]:
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if entry.get("query"):
+                yield entry
@@ -0,0 +1,224 @@
+"""
+Relevance-Gated Generation
+
+ChromaDB always returns the top-k chunks, however far they are from the
+question, so an off-topic question still gets a context and a full Gemini call
+that only ends in "I don't have enough information". The gate looks at the
+distance of the closest retrieved chunk first. If no chunk is within the
+maximum distance, the answer is a fixed "no relevant information" response and
+the model is not called.
+
+The maximum distance is set globally (RELEVANCE_MAX_DISTANCE or --max-distance)
+or calibrated per collection from a sample of questions the collection should be
+able to answer. Calibration takes a high percentile of the sample's closest-chunk
+distances and adds a margin, so nearly all on-topic questions still pass.
+Calibrated thresholds are stored in ``relevance_thresholds.json`` in the persist
+directory, keyed by logical collection name, and take precedence over the global
+value.
+
+Distances are in the collection's own metric (squared L2 by default), so a
+global threshold only makes sense for collections built the same way.
+"""
+
+import json
+import math
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+THRESHOLDS_FILE_NAME = "relevance_thresholds.json"
+
+# Environment variable with the global maximum distance (unset: no gate)
+MAX_DISTANCE_ENV = "RELEVANCE_MAX_DISTANCE"
+
+DEFAULT_QUANTILE = 95.0
+DEFAULT_MARGIN = 0.1
+
+
+def percentile(values: List[float], p: float) -> float:
+    """
+    Compute a percentile with linear interpolation between the closest ranks.
+
+    Args:
+        values: Samples
+        p: Percentile between 0 and 100
+
+    Returns:
+        The percentile, or NaN if there are no samples
+    """
+    if not values:
+        return math.nan
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * p / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def calibrate_threshold(best_distances: Sequence[float], quantile: float = DEFAULT_QUANTILE,
+                        margin: float = DEFAULT_MARGIN) -> float:
+    """
+    Derive a maximum distance from the closest-chunk distances of on-topic questions.
+
+    Args:
+        best_distances: Distance of the closest chunk for each sample question
+        quantile: Percentile of the distances the threshold starts from
+        margin: Fraction added on top of that percentile
+
+    Returns:
+        Maximum distance a question's closest chunk may have
+    """
+    if not best_distances:
+        raise ValueError("Calibration needs at least one question with retrieved chunks")
+    return percentile(list(best_distances), quantile) * (1 + margin)
+
+
+class RelevanceThresholds:
+    """
+    Calibrated maximum distances of the collections in a persist directory.
+    """
+
+    def __init__(self, persist_directory: str):
+        """
+        Initialize the thresholds stored in a ChromaDB persist directory.
+
+        Args:
+            persist_directory: Directory holding the ChromaDB data
+        """
+        self.path = os.path.join(persist_directory, THRESHOLDS_FILE_NAME)
+        self._lock = threading.Lock()
+        self._cache = None
+
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Read the calibrations (cached until the file changes).
+
+        Returns:
+            Dictionary of collection name -> calibration
+        """
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return {}
+
+        cache = self._cache
+        if cache is not None and cache[0] == mtime:
+            return cache[1]
+
+        with open(self.path, 'r', encoding='utf-8') as f:
+            thresholds = json.load(f)
+        self._cache = (mtime, thresholds)
+        return thresholds
+
+    def get(self, name: str) -> Optional[float]:
+        """
+        Get a collection's calibrated maximum distance.
+
+        Args:
+            name: Logical collection name
+
+        Returns:
+            Maximum distance, or None if the collection was not calibrated
+        """
+        calibration = self.load().get(name)
+        return calibration["max_distance"] if calibration else None
+
+    def update(self, name: str, calibration: Optional[Dict[str, Any]]) -> None:
+        """
+        Store (or, with None, remove) a collection's calibration.
+
+        Args:
+            name: Logical collection name
+            calibration: Dictionary with at least 'max_distance', or None
+        """
+        with self._lock:
+            thresholds = dict(self.load())
+            if calibration is None:
+                thresholds.pop(name, None)
+            else:
+                thresholds[name] = dict(calibration, updated=time.time())
+
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(thresholds, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+
+
+class RelevanceGate:
+    """
+    Decides whether retrieved chunks are worth a model call, and counts the decisions.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.ungated = 0
+        self.passed = 0
+        self.skipped_empty = 0
+        self.skipped_distant = 0
+
+    def check(self, distances: List[float], max_distance: Optional[float]) -> bool:
+        """
+        Check whether any retrieved chunk is close enough to answer from.
+
+        Args:
+            distances: Distances of the retrieved chunks
+            max_distance: Maximum distance of the closest chunk, or None to pass
+                any non-empty retrieval
+
+        Returns:
+            True if an answer should be generated
+        """
+        with self._lock:
+            self.checked += 1
+            if not distances:
+                self.skipped_empty += 1
+                return False
+            if max_distance is None:
+                self.ungated += 1
+                return True
+            if min(distances) > max_distance:
+                self.skipped_distant += 1
+                return False
+            self.passed += 1
+            return True
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the gate's counters.
+
+        Returns:
+            Dictionary with the number of checked retrievals, how many went to the
+            model with and without a threshold, and how many were skipped
+        """
+        with self._lock:
+            skipped = self.skipped_empty + self.skipped_distant
+            return {
+                "checked": self.checked,
+                "passed": self.passed,
+                "ungated": self.ungated,
+                "skipped_empty": self.skipped_empty,
+                "skipped_distant": self.skipped_distant,
+                "skipped": skipped,
+                "skipped_ratio": skipped / self.checked if self.checked else 0.0,
+            }
+
+
+def format_gate_stats(stats: Dict[str, Any]) -> str:
+    """
+    Format the gate's counters for display.
+
+    Args:
+        stats: Counters returned by RelevanceGate.stats
+
+    Returns:
+        One-line summary
+    """
+    return (f"Relevance gate: {stats['checked']} questions, {stats['skipped']} model calls skipped "
+            f"({stats['skipped_ratio']:.0%}; {stats['skipped_distant']} beyond the distance "
+            f"threshold, {stats['skipped_empty']} with no chunks), "
+            f"{stats['passed'] + stats['ungated']} answered ({stats['ungated']} without a threshold)")
@@ -0,0 +1,234 @@
+"""
+Query Replay Load Generator
+
+Plays a query log recorded with --record-queries (query_log.py) back against
+the RAG pipeline and reports throughput and latency percentiles, with retrieval
+and generation timed separately.
+
+Pacing modes:
+
+    realtime   keep the recorded gaps between queries
+    scaled     recorded gaps divided by --speed (e.g. --speed 5 replays 5x faster)
+    qps        ignore the timestamps and send queries at a fixed --qps rate
+
+Queries are sent on schedule even when the previous ones have not finished;
+up to --concurrency are processed at once and the rest wait in line. The
+"total" latency is measured from a query's scheduled send time, so it includes
+that wait, as a user would see it.
+
+Set GENERATION_BACKEND=local to replay against the offline stand-in model
+(local_generation.py) instead of Gemini.
+
+Usage:
+    python replay_load.py queries.jsonl --mode scaled --speed 10 --concurrency 8
+    python replay_load.py queries.jsonl --mode qps --qps 20 --retrieval-only
+"""
+
+import argparse
+import json
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from query_log import read_query_log
+from relevance_gate import percentile
+
+MODES = ("realtime", "scaled", "qps")
+
+
+def schedule_offsets(entries: List[Dict[str, Any]], mode: str = "realtime",
+                     speed: float = 1.0, qps: Optional[float] = None) -> List[float]:
+    """
+    Compute when each logged query is sent, relative to the start of the replay.
+
+    Args:
+        entries: Log entries sorted by timestamp
+        mode: 'realtime', 'scaled' or 'qps'
+        speed: Replay speed-up for 'scaled'
+        qps: Queries per second for 'qps'
+
+    Returns:
+        Send offset of each entry, in seconds
+    """
+    if mode == "qps":
+        if not qps or qps <= 0:
+            raise ValueError("The 'qps' mode needs a positive --qps")
+        return [i / qps for i in range(len(entries))]
+    if mode not in ("realtime", "scaled"):
+        raise ValueError(f"Unknown replay mode: {mode}")
+
+    scale = 1.0 if mode == "realtime" else speed
+    if scale <= 0:
+        raise ValueError("--speed must be positive")
+    first = entries[0]["ts"] if entries else 0.0
+    return [(entry["ts"] - first) / scale for entry in entries]
+
+
+def replay(entries: List[Dict[str, Any]], retrieve: Callable[[str, str], List[str]],
+           generate: Optional[Callable[[str, List[str]], str]],
+           mode: str = "realtime", speed: float = 1.0, qps: Optional[float] = None,
+           concurrency: int = 4, collection_name: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Replay logged queries on schedule and time each stage.
+
+    Args:
+        entries: Log entries sorted by timestamp
+        retrieve: Function (query, collection_name) -> context chunks
+        generate: Function (query, context) -> answer (raising on failure), or
+            None to replay retrieval only
+        mode: 'realtime', 'scaled' or 'qps'
+        speed: Replay speed-up for 'scaled'
+        qps: Queries per second for 'qps'
+        concurrency: Number of queries processed at once
+        collection_name: Collection to query instead of the logged one
+
+    Returns:
+        Report with counts, throughput, schedule lag and per-stage latencies
+    """
+    offsets = schedule_offsets(entries, mode, speed, qps)
+    latencies: Dict[str, List[float]] = {"retrieval": [], "generation": [], "total": [],
+                                         "queue_wait": []}
+    counts = {"sent": 0, "ok": 0, "errors": 0, "no_context": 0}
+    lock = threading.Lock()
+
+    def run_one(entry: Dict[str, Any], scheduled: float) -> None:
+        started = time.perf_counter()
+        collection = collection_name or entry["collection"]
+        timings = {"queue_wait": started - scheduled}
+        status = "ok"
+        try:
+            context = retrieve(entry["query"], collection)
+            timings["retrieval"] = time.perf_counter() - started
+            if not context:
+                status = "no_context"
+            elif generate is not None:
+                generation_start = time.perf_counter()
+                generate(entry["query"], context)
+                timings["generation"] = time.perf_counter() - generation_start
+        except Exception as e:
+            status = "errors"
+            print(f"Query failed: {entry['query'][:60]!r}: {e}")
+        timings["total"] = time.perf_counter() - scheduled
+
+        with lock:
+            counts[status] += 1
+            for stage, value in timings.items():
+                latencies[stage].append(value)
+
+    lags = []
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="replay") as executor:
+        for entry, offset in zip(entries, offsets):
+            scheduled = start + offset
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            lags.append(max(0.0, time.perf_counter() - scheduled))
+            executor.submit(run_one, entry, scheduled)
+            counts["sent"] += 1
+    elapsed = time.perf_counter() - start
+
+    completed = counts["ok"] + counts["no_context"]
+    return {
+        "mode": mode,
+        "concurrency": concurrency,
+        "elapsed_s": elapsed,
+        "target_qps": len(entries) / offsets[-1] if len(entries) > 1 and offsets[-1] > 0 else None,
+        "throughput_qps": completed / elapsed if elapsed > 0 else 0.0,
+        "counts": counts,
+        "max_send_lag_s": max(lags) if lags else 0.0,
+        "latency_s": {
+            stage: {"count": len(values), "mean": sum(values) / len(values) if values else math.nan,
+                    "p50": percentile(values, 50), "p95": percentile(values, 95),
+                    "p99": percentile(values, 99), "max": max(values) if values else math.nan}
+            for stage, values in latencies.items()
+        },
+    }
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    """
+    Format a replay report for display.
+
+    Args:
+        report: Report returned by replay
+
+    Returns:
+        Human-readable summary with a latency table in milliseconds
+    """
+    counts = report["counts"]
+    target = (f", target {report['target_qps']:.2f} qps" if report["target_qps"] else "")
+    lines = [
+        f"Replayed {counts['sent']} queries in {report['elapsed_s']:.1f}s ({report['mode']} mode, "
+        f"concurrency {report['concurrency']}): {report['throughput_qps']:.2f} qps{target}",
+        f"  ok {counts['ok']}, no context {counts['no_context']}, errors {counts['errors']}; "
+        f"max send lag {report['max_send_lag_s'] * 1000:.0f} ms",
+        f"  {'Stage':<12} {'Count':>6} {'Mean':>9} {'p50':>9} {'p95':>9} {'p99':>9} {'Max':>9}",
+    ]
+    for stage, stats in report["latency_s"].items():
+        if not stats["count"]:
+            continue
+        lines.append(f"  {stage:<12} {stats['count']:>6}" + "".join(
+            f" {stats[key] * 1000:>9.1f}" for key in ("mean", "p50", "p95", "p99", "max")))
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded query log as load")
+    parser.add_argument("log", help="JSONL query log written by --record-queries")
+    parser.add_argument("--mode", choices=MODES, default="realtime",
+                        help="Keep the recorded timing, speed it up, or send at a fixed rate")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="Speed-up factor for --mode scaled")
+    parser.add_argument("--qps", type=float, help="Queries per second for --mode qps")
+    parser.add_argument("--concurrency", type=int, default=4,
+                        help="Number of queries processed at once")
+    parser.add_argument("--collection_name",
+                        help="Query this collection instead of the one logged with each query")
+    parser.add_argument("--limit", type=int, help="Replay only the first N queries")
+    parser.add_argument("--retrieval-only", action="store_true",
+                        help="Replay retrieval only, without generating answers")
+    parser.add_argument("--report", metavar="FILE", help="Also write the report as JSON")
+    args = parser.parse_args()
+
+    entries = read_query_log(args.log)[:args.limit]
+    if not entries:
+        print(f"No queries found in {args.log}")
+        return
+
+    # Imported here so the pipeline (and its backend configuration) is only
+    # loaded when a replay actually runs
+    import pdf_rag_chat
+
+    # Failures are counted as errors, not as queries without context
+    def retrieve(query: str, collection_name: str) -> List[str]:
+        return pdf_rag_chat.retrieve_relevant_chunks(query, collection_name, raise_errors=True)
+
+    def generate(query: str, context: List[str]) -> str:
+        return pdf_rag_chat.generate_answer(query, context, raise_errors=True)
+
+    print(f"Replaying {len(entries)} queries from {args.log} "
+          f"with the '{pdf_rag_chat.GENERATION_BACKEND}' generation backend")
+    report = replay(
+        entries,
+        retrieve,
+        None if args.retrieval_only else generate,
+        mode=args.mode,
+        speed=args.speed,
+        qps=args.qps,
+        concurrency=args.concurrency,
+        collection_name=args.collection_name
+    )
+    print(format_report(report))
+    print(pdf_rag_chat.single_flight_report())
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.report}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+Single-Flight Request Coalescing
+
+When many threads ask the same question at the same moment, each of them would
+embed the query, search ChromaDB and call Gemini on its own. A single-flight
+group runs one computation per key at a time: the first caller (the leader)
+computes, and callers that arrive with the same key while it is running wait
+for it and receive the same result, or the same exception. Nothing is cached;
+once the computation finishes, the next call with that key runs again.
+
+Every group counts its calls, how many of them ran the computation and how
+many were coalesced onto one already in flight.
+"""
+
+import threading
+from typing import Any, Callable, Dict, Hashable, List
+
+
+class _Call:
+    """A computation in flight and the callers waiting for it."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into one computation.
+    """
+
+    def __init__(self, name: str):
+        """
+        Initialize the group.
+
+        Args:
+            name: Label used in statistics
+        """
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self.calls = 0
+        self.executions = 0
+        self.coalesced = 0
+        self.max_waiters = 0
+
+    def do(self, key: Hashable, func: Callable[[], Any]) -> Any:
+        """
+        Run func, or wait for the identical call already running.
+
+        Args:
+            key: Identity of the request (equal keys are coalesced)
+            func: Computation to run if no call with this key is in flight
+
+        Returns:
+            The computation's result
+        """
+        with self._lock:
+            self.calls += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self.executions += 1
+            else:
+                call.waiters += 1
+                self.coalesced += 1
+                self.max_waiters = max(self.max_waiters, call.waiters)
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the group's counters.
+
+        Returns:
+            Dictionary with calls, executions, coalesced, max_waiters and the
+            share of calls that were coalesced
+        """
+        with self._lock:
+            return {
+                "name": self.name,
+                "calls": self.calls,
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+                "max_waiters": self.max_waiters,
+                "coalesced_ratio": self.coalesced / self.calls if self.calls else 0.0,
+            }
+
+
+class CoalescingEmbeddingFunction:
+    """
+    Wraps an embedding function so concurrent calls with the same texts are computed once.
+
+    Attributes other than the wrapper's own are read from and written to the
+    wrapped function, so code that configures it (e.g. model warmup) keeps working.
+    """
+
+    def __init__(self, embedding_function, flight: SingleFlight):
+        """
+        Initialize the wrapper.
+
+        Args:
+            embedding_function: Chroma embedding function to wrap
+            flight: Group the calls are coalesced in
+        """
+        object.__setattr__(self, "_embedding_function", embedding_function)
+        object.__setattr__(self, "_flight", flight)
+
+    def __call__(self, input: List[str]) -> List[Any]:
+        return self._flight.do(tuple(input), lambda: self._embedding_function(input))
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._embedding_function, name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        setattr(self._embedding_function, name, value)
+
+
+def format_flight_stats(flights: List[SingleFlight]) -> str:
+    """
+    Format the counters of several groups for display.
+
+    Args:
+        flights: Single-flight groups
+
+    Returns:
+        One line per group
+    """
+    lines = []
+    for flight in flights:
+        stats = flight.stats()
+        lines.append(f"{stats['name']}: {stats['calls']} calls, {stats['executions']} executed, "
+                     f"{stats['coalesced']} coalesced ({stats['coalesced_ratio']:.0%}), "
+                     f"up to {stats['max_waiters']} waiting on one call")
+    return "\n".join(lines)
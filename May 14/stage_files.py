@@ -0,0 +1,419 @@
+"""
+Pipeline Stage Files
+
+Extraction, chunking, embedding and loading into ChromaDB can run as separate
+stages, on different machines, when each stage writes its output to a stage
+file and the next stage reads it (see pipeline_stages.py). A stage file is a
+columnar table that is only ever appended to:
+
+    magic (8 bytes) | header length (uint32) | JSON header | padding
+    block*
+
+The header names the file's kind (pages, chunks or embeddings), its columns
+and the settings it was produced with. Each block holds a batch of rows,
+column by column:
+
+    'BLK1' | rows (uint32) | payload length (uint64) | CRC32 of payload (uint32) | padding
+    payload: for each column, 8-byte aligned
+        str      (rows + 1) x uint64 offsets, then the UTF-8 texts
+        int64    rows x int64
+        float32  rows x dim x float32 (dim is fixed per file, e.g. embeddings)
+
+Files are read through ``mmap``; opening one only walks the block headers, and
+a column range decodes just the rows asked for. A block is synced to disk
+before the next one is written, so after a crash only the last block can be
+incomplete. Writers cut such a torn block off when they reopen the file and
+continue after the last complete one, which makes every stage resumable.
+"""
+
+import bisect
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import zlib
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Modules shared by all day folders live in ../shared
+SHARED_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "shared")
+if SHARED_DIR not in sys.path:
+    sys.path.insert(0, SHARED_DIR)
+
+from store_access import WriterLock
+
+# File kinds and their columns (name, type)
+PAGES = "pages"
+CHUNKS = "chunks"
+EMBEDDINGS = "embeddings"
+
+PAGE_COLUMNS = [("doc", "str"), ("source", "str"), ("page", "int64"), ("last", "int64"),
+                ("text", "str")]
+CHUNK_COLUMNS = [("doc", "str"), ("id", "str"), ("start", "int64"), ("end", "int64"),
+                 ("text", "str"), ("metadata", "str")]
+EMBEDDING_COLUMNS = [("id", "str"), ("chunk_row", "int64"), ("embedding", "float32")]
+
+COLUMN_TYPES = ("str", "int64", "float32")
+
+_MAGIC = b"RAGSTAGE"
+_HEADER_LENGTH_FORMAT = "<I"
+_BLOCK_MAGIC = b"BLK1"
+_BLOCK_HEADER_FORMAT = "<4sIQI4x"
+_BLOCK_HEADER_SIZE = struct.calcsize(_BLOCK_HEADER_FORMAT)
+_OFFSET_SIZE = 8
+_ALIGN = 8
+
+
+def _aligned(position: int) -> int:
+    return (position + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+def _padding(size: int) -> bytes:
+    return b"\0" * (_aligned(size) - size)
+
+
+def _encode_header(kind: str, columns: List[Tuple[str, str]], dims: Dict[str, int],
+                   meta: Dict[str, Any]) -> bytes:
+    header = json.dumps({"kind": kind, "columns": [list(column) for column in columns],
+                         "dims": dims, "meta": meta}).encode("utf-8")
+    data = _MAGIC + struct.pack(_HEADER_LENGTH_FORMAT, len(header)) + header
+    return data + _padding(len(data))
+
+
+def _encode_column(column_type: str, values: Sequence[Any], rows: int, dim: Optional[int]) -> bytes:
+    if column_type == "str":
+        encoded = [value.encode("utf-8") for value in values]
+        offsets = np.zeros(rows + 1, dtype="<u8")
+        np.cumsum([len(data) for data in encoded], out=offsets[1:])
+        data = offsets.tobytes() + b"".join(encoded)
+    elif column_type == "int64":
+        data = np.asarray(values, dtype="<i8").reshape(rows).tobytes()
+    else:
+        data = np.asarray(values, dtype="<f4").reshape(rows, dim).tobytes()
+    return data + _padding(len(data))
+
+
+def _scan(buffer, size: int, path: str) -> Tuple[Dict[str, Any], int, List[Tuple[int, int, int]]]:
+    """
+    Read a stage file's header and find its complete blocks.
+
+    Returns:
+        Tuple of (header, end of the last complete block, blocks as
+        (payload offset, rows, payload length))
+    """
+    if size < len(_MAGIC) + 4 or bytes(buffer[:len(_MAGIC)]) != _MAGIC:
+        raise ValueError(f"Not a stage file: {path}")
+    (header_length,) = struct.unpack_from(_HEADER_LENGTH_FORMAT, buffer, len(_MAGIC))
+    header_start = len(_MAGIC) + 4
+    header = json.loads(bytes(buffer[header_start:header_start + header_length]).decode("utf-8"))
+
+    blocks = []
+    position = _aligned(header_start + header_length)
+    valid_end = position
+    while position + _BLOCK_HEADER_SIZE <= size:
+        magic, rows, length, checksum = struct.unpack_from(_BLOCK_HEADER_FORMAT, buffer, position)
+        payload = position + _BLOCK_HEADER_SIZE
+        if magic != _BLOCK_MAGIC or payload + length > size:
+            break
+        blocks.append((payload, rows, length, checksum))
+        position = payload + length
+        valid_end = position
+
+    # Blocks are synced one at a time, so only the last one can be torn
+    if blocks:
+        payload, rows, length, checksum = blocks[-1]
+        if zlib.crc32(buffer[payload:payload + length]) != checksum:
+            blocks.pop()
+            valid_end = payload - _BLOCK_HEADER_SIZE
+    return header, valid_end, [(payload, rows, length) for payload, rows, length, _ in blocks]
+
+
+class StageFile:
+    """
+    Read-only, memory-mapped view of a stage file.
+    """
+
+    def __init__(self, path: str):
+        """
+        Open a stage file.
+
+        Args:
+            path: Path to the stage file
+        """
+        self.path = path
+        self._file = open(path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        if size == 0:
+            self._file.close()
+            raise ValueError(f"Not a stage file: {path}")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        header, _, blocks = _scan(self._map, size, path)
+        self.kind: str = header["kind"]
+        self.columns: List[Tuple[str, str]] = [tuple(column) for column in header["columns"]]
+        self.dims: Dict[str, int] = header["dims"]
+        self.meta: Dict[str, Any] = header["meta"]
+        self._types = dict(self.columns)
+
+        # Where each block's columns start, and the first row of each block
+        self._blocks = []
+        self._block_starts = []
+        self.num_rows = 0
+        for payload, rows, _ in blocks:
+            layout = {}
+            position = payload
+            for name, column_type in self.columns:
+                layout[name] = position
+                if column_type == "str":
+                    offsets_size = (rows + 1) * _OFFSET_SIZE
+                    (data_size,) = struct.unpack_from("<Q", self._map, position + rows * _OFFSET_SIZE)
+                    position = _aligned(position + offsets_size + data_size)
+                elif column_type == "int64":
+                    position = _aligned(position + rows * 8)
+                else:
+                    position = _aligned(position + rows * self.dims[name] * 4)
+            self._blocks.append((rows, layout))
+            self._block_starts.append(self.num_rows)
+            self.num_rows += rows
+
+    def __len__(self) -> int:
+        return self.num_rows
+
+    def __enter__(self) -> "StageFile":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Release the memory map and the underlying file."""
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _block_values(self, block: int, name: str, start: int, end: int):
+        rows, layout = self._blocks[block]
+        position = layout[name]
+        column_type = self._types[name]
+        if column_type == "str":
+            offsets = struct.unpack_from(f"<{end - start + 1}Q", self._map,
+                                         position + start * _OFFSET_SIZE)
+            data_start = position + (rows + 1) * _OFFSET_SIZE
+            return [self._map[data_start + offsets[i]:data_start + offsets[i + 1]].decode("utf-8")
+                    for i in range(end - start)]
+        if column_type == "int64":
+            return np.frombuffer(self._map, dtype="<i8", count=end - start,
+                                 offset=position + start * 8).copy()
+        dim = self.dims[name]
+        return np.frombuffer(self._map, dtype="<f4", count=(end - start) * dim,
+                             offset=position + start * dim * 4).reshape(end - start, dim).copy()
+
+    def column(self, name: str, start: int = 0, end: Optional[int] = None):
+        """
+        Read a range of one column.
+
+        Args:
+            name: Column name
+            start: First row
+            end: Row after the last one (default: the end of the file)
+
+        Returns:
+            List of strings for text columns, otherwise a NumPy array copied out
+            of the map (one row per vector for float32 columns)
+        """
+        if name not in self._types:
+            raise KeyError(f"No column '{name}' in {self.kind} file {self.path}")
+        end = self.num_rows if end is None else min(end, self.num_rows)
+        start = max(0, min(start, end))
+
+        parts = []
+        block = max(0, bisect.bisect_right(self._block_starts, start) - 1)
+        while start < end and block < len(self._block_starts):
+            first_row = self._block_starts[block]
+            rows = self._blocks[block][0]
+            if first_row + rows > start:
+                parts.append(self._block_values(block, name, max(start, first_row) - first_row,
+                                                min(end, first_row + rows) - first_row))
+            if first_row + rows >= end:
+                break
+            block += 1
+
+        if self._types[name] == "str":
+            return [value for part in parts for value in part]
+        if not parts:
+            shape = (0, self.dims[name]) if self._types[name] == "float32" else (0,)
+            return np.zeros(shape, dtype="<f4" if self._types[name] == "float32" else "<i8")
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def rows(self, columns: Optional[List[str]] = None, start: int = 0,
+             batch_size: int = 1000) -> Iterator[Dict[str, Any]]:
+        """
+        Iterate over rows as dictionaries, reading a batch of rows at a time.
+
+        Args:
+            columns: Columns to read (default: all)
+            start: First row
+            batch_size: Number of rows decoded at a time
+
+        Yields:
+            One dictionary per row
+        """
+        names = columns or [name for name, _ in self.columns]
+        for batch_start in range(start, self.num_rows, batch_size):
+            batch_end = min(batch_start + batch_size, self.num_rows)
+            values = {name: self.column(name, batch_start, batch_end) for name in names}
+            for i in range(batch_end - batch_start):
+                yield {name: values[name][i] for name in names}
+
+    def fingerprint(self) -> str:
+        """
+        Identify the file's contents without reading all of it.
+
+        Returns:
+            Hex digest of the header, the row count and the block checksums
+        """
+        digest = hashlib.sha256(json.dumps([self.kind, self.columns, self.dims, self.meta]).encode("utf-8"))
+        digest.update(str(self.num_rows).encode("utf-8"))
+        for rows, layout in self._blocks:
+            position = min(layout.values()) - _BLOCK_HEADER_SIZE
+            digest.update(self._map[position:position + _BLOCK_HEADER_SIZE])
+        return digest.hexdigest()[:32]
+
+
+class StageWriter:
+    """
+    Appends blocks of rows to a stage file, continuing a file written earlier.
+
+    Only one process may write a stage file at a time; a second writer fails
+    with StoreLockedError.
+    """
+
+    def __init__(self, path: str, kind: str, columns: List[Tuple[str, str]],
+                 meta: Optional[Dict[str, Any]] = None):
+        """
+        Open a stage file for appending, creating it on the first append.
+
+        Args:
+            path: Path to the stage file
+            kind: File kind (PAGES, CHUNKS or EMBEDDINGS)
+            columns: (name, type) pairs, types from COLUMN_TYPES
+            meta: Settings the rows were produced with; an existing file
+                written with different settings is refused
+        """
+        for name, column_type in columns:
+            if column_type not in COLUMN_TYPES:
+                raise ValueError(f"Unknown column type for '{name}': {column_type}")
+        self.path = path
+        self.kind = kind
+        self.columns = [tuple(column) for column in columns]
+        self.meta = meta or {}
+        self.dims: Dict[str, int] = {}
+        self.num_rows = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = WriterLock(path)
+        self._lock.acquire()
+        self._file = None
+        try:
+            if os.path.exists(path) and os.path.getsize(path) > 0:
+                self._reopen()
+        except Exception:
+            self._lock.release()
+            raise
+
+    def _reopen(self) -> None:
+        with open(self.path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                header, valid_end, blocks = _scan(buffer, size, self.path)
+
+        if header["kind"] != self.kind or [tuple(c) for c in header["columns"]] != self.columns:
+            raise ValueError(f"{self.path} is a {header['kind']} file with different columns")
+        if header["meta"] != self.meta:
+            raise ValueError(f"{self.path} was written with different settings "
+                             f"({header['meta']}); write to a new file instead")
+
+        self.dims = header["dims"]
+        self.num_rows = sum(rows for _, rows, _ in blocks)
+        self._file = open(self.path, 'r+b')
+        if valid_end != size:
+            print(f"Discarding an incomplete block at the end of {self.path}")
+            self._file.truncate(valid_end)
+        self._file.seek(valid_end)
+
+    def append(self, rows: Dict[str, Sequence[Any]]) -> int:
+        """
+        Append a batch of rows as one block and sync it to disk.
+
+        Args:
+            rows: Column name -> values (all columns, equal lengths)
+
+        Returns:
+            Number of rows in the file after the append
+        """
+        counts = {len(rows[name]) for name, _ in self.columns}
+        if len(counts) != 1:
+            raise ValueError("All columns of a block must have the same number of rows")
+        count = counts.pop()
+        if count == 0:
+            return self.num_rows
+
+        for name, column_type in self.columns:
+            if column_type == "float32":
+                dim = int(np.asarray(rows[name][0]).size)
+                if self.dims.setdefault(name, dim) != dim:
+                    raise ValueError(f"Column '{name}' holds {self.dims[name]}-dimensional vectors, "
+                                     f"got {dim}")
+
+        if self._file is None:
+            self._file = open(self.path, 'wb')
+            self._file.write(_encode_header(self.kind, self.columns, self.dims, self.meta))
+
+        payload = b"".join(_encode_column(column_type, rows[name], count, self.dims.get(name))
+                           for name, column_type in self.columns)
+        self._file.write(struct.pack(_BLOCK_HEADER_FORMAT, _BLOCK_MAGIC, count, len(payload),
+                                     zlib.crc32(payload)))
+        self._file.write(payload)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.num_rows += count
+        return self.num_rows
+
+    def close(self) -> None:
+        """Close the file and release the writer lock."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._lock.release()
+
+    def __enter__(self) -> "StageWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def open_stage_file(path: str, kind: str) -> Optional[StageFile]:
+    """
+    Open a stage file of a given kind, if it exists.
+
+    Args:
+        path: Path to the stage file
+        kind: Expected file kind
+
+    Returns:
+        StageFile, or None if the file does not exist or is still empty
+    """
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return None
+    stage_file = StageFile(path)
+    if stage_file.kind != kind:
+        stage_file.close()
+        raise ValueError(f"{path} is a {stage_file.kind} file, expected {kind}")
+    return stage_file
@@ -0,0 +1,192 @@
+"""
+Async Conversation Runner - Load-tests the agent orchestration without an LLM
+
+autogen_simulation.py plays the CTO / user_proxy conversation one turn at a
+time with blocking sleeps. This runner models each agent turn as a coroutine
+with a configurable simulated latency, so many independent conversations can
+run concurrently on one event loop. It reports conversation and turn
+throughput plus per-turn latency percentiles for each agent.
+
+Usage:
+    python async_conversation_runner.py --conversations 500 --concurrency 100
+    python async_conversation_runner.py --cto-latency 1.0 --proxy-latency 0.2 --jitter 0.1
+"""
+
+import argparse
+import asyncio
+import math
+import random
+import time
+
+from autogen_simulation import cto_reply, user_proxy_reply
+
+TASKS = [
+    "Write python code to output numbers 1 to 100, and then store the code in a file",
+    "Change the code in the file you just created to instead output numbers 1 to 200",
+]
+
+
+class SimulatedAgent:
+    """An agent whose turns are coroutines with simulated latency"""
+
+    def __init__(self, name, reply_fn, latency=1.0, jitter=0.0, rng=None):
+        """
+        Args:
+            name (str): Agent name used in the report
+            reply_fn (callable): Maps the incoming message to the agent's reply
+            latency (float): Mean simulated latency per turn, in seconds
+            jitter (float): Maximum random deviation from the mean latency, in seconds
+            rng (random.Random, optional): Random source for the jitter
+        """
+        self.name = name
+        self.reply_fn = reply_fn
+        self.latency = latency
+        self.jitter = jitter
+        self.rng = rng or random.Random()
+
+    async def respond(self, message):
+        """Produce a reply after the simulated latency, without blocking the event loop"""
+        delay = self.latency
+        if self.jitter:
+            delay = max(0.0, delay + self.rng.uniform(-self.jitter, self.jitter))
+        await asyncio.sleep(delay)
+        return self.reply_fn(message)
+
+
+async def run_conversation(cto, user_proxy, tasks, latencies, max_turns=10):
+    """
+    Run one CTO / user_proxy conversation over a sequence of tasks.
+
+    Each task is answered by the CTO and judged by the user proxy until the
+    proxy replies CONTINUE (next task) or TERMINATE (conversation done).
+
+    Args:
+        cto (SimulatedAgent): Assistant agent
+        user_proxy (SimulatedAgent): User proxy agent
+        tasks (list): Task messages, in order
+        latencies (dict): Agent name -> list that per-turn latencies are appended to
+        max_turns (int): Maximum CTO turns per task
+
+    Returns:
+        int: Number of agent turns taken
+    """
+    turns = 0
+    for task in tasks:
+        message = task
+        for _ in range(max_turns):
+            for agent in (cto, user_proxy):
+                start = time.perf_counter()
+                message = await agent.respond(message)
+                latencies[agent.name].append(time.perf_counter() - start)
+                turns += 1
+
+            if message.rstrip().endswith("TERMINATE"):
+                return turns
+            if message.rstrip().endswith("CONTINUE"):
+                break
+    return turns
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+async def run_load_test(num_conversations=100, concurrency=50, cto_latency=1.0,
+                        proxy_latency=1.0, jitter=0.0, seed=42, tasks=None):
+    """
+    Run many independent conversations concurrently and collect statistics.
+
+    Args:
+        num_conversations (int): Number of conversations to run
+        concurrency (int): Maximum number of conversations in flight at once
+        cto_latency (float): Mean simulated latency of a CTO turn, in seconds
+        proxy_latency (float): Mean simulated latency of a user_proxy turn, in seconds
+        jitter (float): Maximum random deviation from the mean latencies, in seconds
+        seed (int): Seed for the latency jitter
+        tasks (list, optional): Task messages for each conversation
+
+    Returns:
+        dict: Throughput and latency statistics
+    """
+    tasks = tasks or TASKS
+    rng = random.Random(seed)
+    cto = SimulatedAgent("CTO", cto_reply, cto_latency, jitter, rng)
+    user_proxy = SimulatedAgent("user_proxy", user_proxy_reply, proxy_latency, jitter, rng)
+    latencies = {cto.name: [], user_proxy.name: []}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded_conversation():
+        async with semaphore:
+            return await run_conversation(cto, user_proxy, tasks, latencies)
+
+    start = time.perf_counter()
+    turn_counts = await asyncio.gather(*(bounded_conversation() for _ in range(num_conversations)))
+    elapsed = time.perf_counter() - start
+
+    total_turns = sum(turn_counts)
+    return {
+        "conversations": num_conversations,
+        "concurrency": concurrency,
+        "turns": total_turns,
+        "elapsed": elapsed,
+        "conversations_per_second": num_conversations / elapsed if elapsed else 0.0,
+        "turns_per_second": total_turns / elapsed if elapsed else 0.0,
+        "latency": {
+            name: {
+                "count": len(values),
+                "mean": sum(values) / len(values) if values else 0.0,
+                "p50": percentile(values, 50),
+                "p95": percentile(values, 95),
+                "p99": percentile(values, 99),
+                "max": max(values) if values else 0.0,
+            }
+            for name, values in latencies.items()
+        },
+    }
+
+
+def print_report(stats):
+    """Print a load-test report"""
+    print("\n" + "=" * 60)
+    print("ASYNC CONVERSATION LOAD TEST")
+    print("=" * 60)
+    print(f"Conversations: {stats['conversations']} (concurrency {stats['concurrency']})")
+    print(f"Agent turns:   {stats['turns']}")
+    print(f"Wall clock:    {stats['elapsed']:.2f}s")
+    print(f"Throughput:    {stats['conversations_per_second']:.1f} conversations/s, "
+          f"{stats['turns_per_second']:.1f} turns/s")
+    print("\nPer-turn latency (seconds):")
+    for name, lat in stats["latency"].items():
+        print(f"- {name}: n={lat['count']} mean={lat['mean']:.3f} p50={lat['p50']:.3f} "
+              f"p95={lat['p95']:.3f} p99={lat['p99']:.3f} max={lat['max']:.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run simulated agent conversations concurrently")
+    parser.add_argument("--conversations", type=int, default=100, help="Number of conversations to run")
+    parser.add_argument("--concurrency", type=int, default=50, help="Maximum conversations in flight")
+    parser.add_argument("--cto-latency", type=float, default=1.0, help="Mean CTO turn latency in seconds")
+    parser.add_argument("--proxy-latency", type=float, default=1.0, help="Mean user_proxy turn latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Maximum latency jitter in seconds")
+    parser.add_argument("--seed", type=int, default=42, help="Seed for the latency jitter")
+
+    args = parser.parse_args()
+
+    stats = asyncio.run(run_load_test(
+        num_conversations=args.conversations,
+        concurrency=args.concurrency,
+        cto_latency=args.cto_latency,
+        proxy_latency=args.proxy_latency,
+        jitter=args.jitter,
+        seed=args.seed,
+    ))
+    print_report(stats)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,31 @@
+import os
 import autogen
+from code_executor_pool import CodeExecutorPool
+from conversation_cache import ConversationCache, install_conversation_cache
+
+# Warm interpreters that run the code written by the CTO agent
+executor_pool = CodeExecutorPool(size=2, timeout=60)
+
+class PooledUserProxyAgent(autogen.UserProxyAgent):
+    """UserProxyAgent that runs Python code blocks in the warm executor pool"""
+
+    def run_code(self, code, **kwargs):
+        if kwargs.get("lang", "python") != "python":
+            return super().run_code(code, **kwargs)
+
+        work_dir = kwargs.get("work_dir") or "web"
+        filename = kwargs.get("filename")
+        if filename:
+            # Keep autogen's behaviour of saving "# filename: ..." blocks to disk
+            path = os.path.join(work_dir, filename)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(code)
+            result = executor_pool.run(filename=filename, work_dir=work_dir, timeout=kwargs.get("timeout"))
+        else:
+            result = executor_pool.run(code=code, work_dir=work_dir, timeout=kwargs.get("timeout"))
+
+        return result["exit_code"], result["stdout"] + result["stderr"], None
 
 config_list = [
     {
@@ -20,7 +47,7 @@ assistant = autogen.AssistantAgent(
     system_message="Chief technical officer of a tech company"
 )
 
-user_proxy = autogen.UserProxyAgent(
+user_proxy = PooledUserProxyAgent(
     name="user_proxy",
     human_input_mode="NEVER",
     max_consecutive_auto_reply=10,
@@ -31,6 +58,11 @@ user_proxy = autogen.UserProxyAgent(
 Otherwise, reply CONTINUE, or the reason why the task is not solved yet."""
 )
 
+# Record LLM turns to disk; set AUTOGEN_CACHE_MODE=replay to rerun offline from the recording
+conversation_cache = ConversationCache(mode=os.getenv("AUTOGEN_CACHE_MODE", "record"))
+install_conversation_cache(assistant, conversation_cache)
+install_conversation_cache(user_proxy, conversation_cache)
+
 task = """
 Write python code to output numbers 1 to 100, and then store the code in a file
 """
@@ -48,3 +80,6 @@ user_proxy.initiate_chat(
     assistant,
     message=task2
 )
+
+print(conversation_cache.summary())
+executor_pool.close()
@@ -0,0 +1,342 @@
+"""
+Code Executor Pool - Runs agent-generated Python code in warm worker interpreters
+
+Running generated code with os.system("cd web && python numbers.py > output.txt")
+starts a new shell and a new interpreter for every execution and only returns
+output through a file. This pool keeps a few Python worker processes started
+ahead of time. Each task is sent to an idle worker over a pipe and runs in its
+own working directory; stdout/stderr come back over the same pipe.
+
+Limits:
+- timeout: a task that runs too long gets its worker killed and replaced
+- memory_limit_mb: address-space limit applied to each worker (POSIX only)
+- max_tasks_per_worker: workers are recycled so state leaked by generated code
+  (imported modules, globals) does not accumulate forever
+
+This is process isolation, not a security sandbox: the code runs as the same
+user, like the use_docker=False configuration it replaces.
+
+Usage:
+    with CodeExecutorPool(size=2, timeout=30) as pool:
+        result = pool.run(filename="numbers.py", work_dir="web")
+        print(result["stdout"])
+"""
+
+import json
+import os
+import queue
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+# Exit code reported for tasks killed by the timeout (same as the `timeout` tool)
+TIMEOUT_EXIT_CODE = 124
+
+
+def _worker_main():
+    """Worker loop: read JSON tasks from stdin, run them, write JSON results to stdout"""
+    import traceback
+
+    # Keep private copies of the pipes to the pool; fds 0-2 are pointed elsewhere
+    # so the generated code can never read or corrupt the task protocol
+    tasks = os.fdopen(os.dup(0), "r", encoding="utf-8")
+    protocol = os.fdopen(os.dup(1), "w", encoding="utf-8")
+    devnull = os.open(os.devnull, os.O_RDWR)
+    os.dup2(devnull, 0)
+    os.dup2(devnull, 1)
+    sys.stdin = open(os.devnull, "r")
+
+    for module_name in json.loads(os.environ.get("EXECUTOR_PRELOAD", "[]")):
+        __import__(module_name)
+
+    protocol.write(json.dumps({"ready": True}) + "\n")
+    protocol.flush()
+
+    for line in tasks:
+        task = json.loads(line)
+        work_dir = os.path.abspath(task["work_dir"])
+        filename = task.get("filename") or "<generated>"
+
+        with tempfile.TemporaryFile() as out, tempfile.TemporaryFile() as err:
+            previous_cwd = os.getcwd()
+            start = time.perf_counter()
+            exit_code = 0
+            saved_stdout, saved_stderr = os.dup(1), os.dup(2)
+            os.dup2(out.fileno(), 1)
+            os.dup2(err.fileno(), 2)
+            try:
+                os.chdir(work_dir)
+                sys.path.insert(0, work_dir)
+                code = task.get("code")
+                if code is None:
+                    with open(filename, "r", encoding="utf-8") as f:
+                        code = f.read()
+                exec(compile(code, filename, "exec"), {"__name__": "__main__", "__file__": filename})
+            except SystemExit as e:
+                if isinstance(e.code, int):
+                    exit_code = e.code
+                elif e.code is not None:
+                    print(e.code, file=sys.stderr)
+                    exit_code = 1
+            except BaseException:
+                traceback.print_exc()
+                exit_code = 1
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os.dup2(saved_stdout, 1)
+                os.dup2(saved_stderr, 2)
+                os.close(saved_stdout)
+                os.close(saved_stderr)
+                if sys.path and sys.path[0] == work_dir:
+                    sys.path.pop(0)
+                os.chdir(previous_cwd)
+
+            duration = time.perf_counter() - start
+            out.seek(0)
+            err.seek(0)
+            result = {
+                "exit_code": exit_code,
+                "stdout": out.read().decode("utf-8", errors="replace"),
+                "stderr": err.read().decode("utf-8", errors="replace"),
+                "duration": duration,
+            }
+
+        protocol.write(json.dumps(result) + "\n")
+        protocol.flush()
+
+
+def _limit_memory(memory_limit_mb):
+    """Return a preexec_fn that caps the worker's address space, where supported"""
+    if not memory_limit_mb:
+        return None
+    try:
+        import resource
+    except ImportError:
+        # Windows has no resource module; run without a memory limit
+        return None
+
+    limit = memory_limit_mb * 1024 * 1024
+
+    def preexec():
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+    return preexec
+
+
+class _Worker:
+    """A single pre-started worker interpreter"""
+
+    def __init__(self, memory_limit_mb=None, preload_modules=None, startup_timeout=30):
+        env = dict(os.environ)
+        env["EXECUTOR_PRELOAD"] = json.dumps(preload_modules or [])
+        env["PYTHONUNBUFFERED"] = "1"
+
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--worker"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            env=env,
+            text=True,
+            encoding="utf-8",
+            preexec_fn=_limit_memory(memory_limit_mb),
+        )
+        self.tasks_run = 0
+        self._lines = queue.Queue()
+        self._reader = threading.Thread(target=self._read_lines, daemon=True)
+        self._reader.start()
+
+        if self._next_message(startup_timeout) is None:
+            self.kill()
+            raise RuntimeError("Code executor worker failed to start")
+
+    def _read_lines(self):
+        for line in self.process.stdout:
+            self._lines.put(line)
+        self._lines.put(None)
+
+    def _next_message(self, timeout):
+        try:
+            line = self._lines.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        return json.loads(line) if line else None
+
+    def is_alive(self):
+        return self.process.poll() is None
+
+    def execute(self, task, timeout):
+        """Send a task and wait for its result; returns None on timeout or worker death"""
+        try:
+            self.process.stdin.write(json.dumps(task) + "\n")
+            self.process.stdin.flush()
+        except OSError:
+            return None
+        self.tasks_run += 1
+        return self._next_message(timeout)
+
+    def kill(self):
+        if self.is_alive():
+            self.process.kill()
+        self.process.wait()
+
+    def close(self):
+        if self.is_alive():
+            self.process.stdin.close()
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+
+
+class CodeExecutorPool:
+    """
+    A pool of warm worker interpreters for running generated Python code.
+    """
+
+    def __init__(self, size=2, timeout=60, memory_limit_mb=512, base_work_dir=None,
+                 max_tasks_per_worker=100, preload_modules=None):
+        """
+        Start the worker interpreters.
+
+        Args:
+            size (int): Number of worker processes
+            timeout (float): Default per-task timeout in seconds
+            memory_limit_mb (int, optional): Address-space limit per worker; None disables it
+            base_work_dir (str, optional): Parent directory for per-task working
+                directories created when run() is not given one
+            max_tasks_per_worker (int): Recycle a worker after this many tasks
+            preload_modules (list, optional): Modules every worker imports at startup
+        """
+        self.size = size
+        self.timeout = timeout
+        self.memory_limit_mb = memory_limit_mb
+        self.base_work_dir = base_work_dir
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self.preload_modules = preload_modules or []
+        self.stats = {"tasks": 0, "timeouts": 0, "worker_restarts": 0}
+        self._stats_lock = threading.Lock()
+        self._idle = queue.Queue()
+        self._closed = False
+
+        for _ in range(size):
+            self._idle.put(self._spawn())
+
+    def _spawn(self):
+        return _Worker(self.memory_limit_mb, self.preload_modules)
+
+    def _replace(self, worker):
+        worker.kill()
+        with self._stats_lock:
+            self.stats["worker_restarts"] += 1
+        return self._spawn()
+
+    def run(self, code=None, filename=None, work_dir=None, timeout=None):
+        """
+        Run Python code in an idle worker.
+
+        Args:
+            code (str, optional): Source code to run; read from filename if omitted
+            filename (str, optional): Script name, relative to work_dir
+            work_dir (str, optional): Working directory for the task; a fresh
+                temporary directory is created if omitted, and removed with
+                everything the task wrote to it once the task is done
+            timeout (float, optional): Override the default timeout in seconds
+
+        Returns:
+            dict: exit_code, stdout, stderr, duration, timed_out and work_dir
+            (None for a temporary working directory)
+        """
+        if self._closed:
+            raise RuntimeError("Code executor pool is closed")
+        if code is None and filename is None:
+            raise ValueError("Either code or filename must be provided")
+
+        temporary = work_dir is None
+        if temporary:
+            if self.base_work_dir:
+                os.makedirs(self.base_work_dir, exist_ok=True)
+            work_dir = tempfile.mkdtemp(prefix="task_", dir=self.base_work_dir)
+        else:
+            os.makedirs(work_dir, exist_ok=True)
+
+        timeout = self.timeout if timeout is None else timeout
+        task = {"code": code, "filename": filename, "work_dir": os.path.abspath(work_dir)}
+
+        worker = self._idle.get()
+        try:
+            start = time.perf_counter()
+            result = worker.execute(task, timeout)
+            with self._stats_lock:
+                self.stats["tasks"] += 1
+
+            if result is None:
+                timed_out = worker.is_alive()
+                if timed_out:
+                    with self._stats_lock:
+                        self.stats["timeouts"] += 1
+                worker = self._replace(worker)
+                result = {
+                    "exit_code": TIMEOUT_EXIT_CODE if timed_out else 1,
+                    "stdout": "",
+                    "stderr": (f"Execution timed out after {timeout} seconds" if timed_out
+                               else "Worker process exited unexpectedly (out of memory?)"),
+                    "duration": time.perf_counter() - start,
+                }
+            else:
+                timed_out = False
+                if worker.tasks_run >= self.max_tasks_per_worker:
+                    worker.close()
+                    worker = self._spawn()
+        finally:
+            self._idle.put(worker)
+            if temporary:
+                shutil.rmtree(work_dir, ignore_errors=True)
+
+        result["timed_out"] = timed_out
+        result["work_dir"] = None if temporary else work_dir
+        return result
+
+    def close(self):
+        """Stop all worker processes"""
+        self._closed = True
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            worker.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+if __name__ == "__main__":
+    if "--worker" in sys.argv:
+        _worker_main()
+    else:
+        # Example usage: compare warm pool executions with fresh interpreters
+        code = "import sys\nprint('hello from', sys.executable)\n"
+
+        start = time.perf_counter()
+        for _ in range(10):
+            subprocess.run([sys.executable, "-c", code], capture_output=True)
+        cold = (time.perf_counter() - start) / 10
+
+        with CodeExecutorPool(size=2) as pool:
+            start = time.perf_counter()
+            for _ in range(10):
+                result = pool.run(code=code)
+            warm = (time.perf_counter() - start) / 10
+
+        print(result["stdout"].strip())
+        print(f"Fresh interpreter per run: {cold * 1000:.1f} ms")
+        print(f"Warm worker pool:          {warm * 1000:.1f} ms")
@@ -0,0 +1,192 @@
+"""
+Conversation Cache - Record and replay LLM turns of agent conversations
+
+The agents in basic_autogen_example.py use seed 42 and temperature 0, so a
+given (model, system message, message history) always asks the model for the
+same completion. This cache stores those completions on local disk:
+
+- record: serve recorded turns, call the model on a miss and record the result
+- replay: serve recorded turns only; a miss is flagged (CacheMissError) instead
+  of calling the model, so repeat runs are fast, free and fully offline
+- off:    always call the model
+
+Usage:
+    cache = ConversationCache(mode="replay")
+    install_conversation_cache(assistant, cache)
+    install_conversation_cache(user_proxy, cache)
+"""
+
+import hashlib
+import json
+import os
+
+# Where recorded completions are stored
+DEFAULT_CACHE_DIR = ".conversation_cache"
+
+MODES = ("record", "replay", "off")
+
+# Message fields that influence the completion
+_MESSAGE_FIELDS = ("role", "content", "name", "function_call")
+
+
+class CacheMissError(Exception):
+    """Raised in replay mode when a turn has not been recorded"""
+
+
+class ConversationCache:
+    """
+    Deterministic on-disk cache of LLM completions for agent conversations.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, mode="record", strict=True):
+        """
+        Args:
+            cache_dir (str): Directory where completions are stored
+            mode (str): 'record', 'replay' or 'off'
+            strict (bool): In replay mode, raise CacheMissError on a miss; if False
+                the miss is only recorded in self.misses and None is returned
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown cache mode: {mode} (expected one of {', '.join(MODES)})")
+
+        self.cache_dir = cache_dir
+        self.mode = mode
+        self.strict = strict
+        self.stats = {"hits": 0, "misses": 0, "recorded": 0}
+        self.misses = []
+
+    @staticmethod
+    def make_key(model, system_message, messages):
+        """
+        Build the cache key for a turn.
+
+        Args:
+            model (str): Model name
+            system_message (str): System message of the replying agent
+            messages (list): Conversation history sent to the model
+
+        Returns:
+            str: SHA-256 hex digest of the canonical request
+        """
+        history = [
+            {field: message[field] for field in _MESSAGE_FIELDS if message.get(field) is not None}
+            for message in messages
+        ]
+        request = json.dumps(
+            {"model": model, "system_message": system_message, "messages": history},
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(request.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, key):
+        """Return the recorded completion for a key, or None"""
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)["completion"]
+
+    def put(self, key, completion, model=None, system_message=None):
+        """Record a completion (written atomically)"""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"model": model, "system_message": system_message, "completion": completion},
+                f,
+                ensure_ascii=False,
+                indent=2,
+            )
+        os.replace(tmp_path, path)
+        self.stats["recorded"] += 1
+
+    def complete(self, model, system_message, messages, call_model):
+        """
+        Return the completion for a turn, from the cache or from the model.
+
+        Args:
+            model (str): Model name
+            system_message (str): System message of the replying agent
+            messages (list): Conversation history sent to the model
+            call_model (callable): Zero-argument function that calls the model
+
+        Returns:
+            The completion (None for an unflagged miss in non-strict replay mode)
+        """
+        if self.mode == "off":
+            return call_model()
+
+        key = self.make_key(model, system_message, messages)
+        completion = self.get(key)
+        if completion is not None:
+            self.stats["hits"] += 1
+            return completion
+
+        self.stats["misses"] += 1
+        if self.mode == "replay":
+            self.misses.append(key)
+            message = f"No recorded completion for this turn (model={model}, key={key[:12]})"
+            if self.strict:
+                raise CacheMissError(message)
+            print(f"Cache miss: {message}")
+            return None
+
+        completion = call_model()
+        if completion is not None:
+            self.put(key, completion, model, system_message)
+        return completion
+
+    def summary(self):
+        """One-line summary of cache activity"""
+        return (f"Conversation cache ({self.mode}): {self.stats['hits']} hits, "
+                f"{self.stats['misses']} misses, {self.stats['recorded']} recorded")
+
+
+def _model_name(llm_config):
+    """Model name from an autogen llm_config"""
+    config_list = llm_config.get("config_list") or [{}]
+    return config_list[0].get("model") or llm_config.get("model")
+
+
+def install_conversation_cache(agent, cache):
+    """
+    Serve an autogen agent's LLM replies through a conversation cache.
+
+    The cached reply function is registered just ahead of the agent's LLM reply,
+    so termination checks and code execution still run as before.
+
+    Args:
+        agent: autogen ConversableAgent (AssistantAgent or UserProxyAgent)
+        cache (ConversationCache): Cache to use
+    """
+    import autogen
+
+    def cached_oai_reply(recipient, messages=None, sender=None, config=None):
+        if not recipient.llm_config:
+            return False, None
+        if messages is None:
+            messages = recipient.chat_messages[sender]
+
+        def call_model():
+            final, reply = recipient.generate_oai_reply(messages, sender, config)
+            return reply if final else None
+
+        reply = cache.complete(
+            _model_name(recipient.llm_config),
+            recipient.system_message,
+            messages,
+            call_model,
+        )
+        return reply is not None, reply
+
+    # The built-in LLM reply is the last entry of the reply function list
+    agent.register_reply(
+        [autogen.Agent, None],
+        cached_oai_reply,
+        position=len(agent._reply_func_list) - 1,
+    )
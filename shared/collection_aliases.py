@@ -0,0 +1,247 @@
+"""
+Collection Aliases
+
+Rebuilding a collection by deleting it and adding everything again leaves a
+window in which queries find nothing. Instead, the new index is built into a
+staging collection with a versioned name, and a logical alias is switched over
+to it once it is complete. Readers always resolve the alias first, so they see
+either the old index or the new one, never an empty one.
+
+The alias table is a small JSON file kept next to the ChromaDB data and is
+replaced atomically (write to a temporary file, then os.replace). Changes are
+made under a file lock, so processes sharing the directory do not overwrite each
+other's swaps.
+
+A query that resolved the alias just before a swap may still be searching the
+previous collection, so a replaced collection is not dropped right away: it is
+recorded as retired (``collection_aliases.retired.json``) and dropped when the
+alias is swapped the next time.
+"""
+
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+from store_access import WriterLock
+
+ALIAS_FILE_NAME = "collection_aliases.json"
+RETIRED_FILE_NAME = "collection_aliases.retired.json"
+
+# Seconds a change waits for another process changing the aliases
+LOCK_TIMEOUT = 30.0
+
+# Chroma collection names are limited to 63 characters
+_MAX_BASE_LENGTH = 40
+
+
+class AliasTable:
+    """
+    Maps logical collection names to the physical collections that serve them.
+    """
+
+    def __init__(self, persist_directory: str):
+        """
+        Initialize the alias table stored in a ChromaDB persist directory.
+
+        Args:
+            persist_directory: Directory holding the ChromaDB data
+        """
+        self.path = os.path.join(persist_directory, ALIAS_FILE_NAME)
+        self.retired_path = os.path.join(persist_directory, RETIRED_FILE_NAME)
+        self._lock = threading.Lock()
+
+    def _locked(self) -> WriterLock:
+        # Serializes changes across processes (the thread lock covers this one)
+        return WriterLock(self.path, timeout=LOCK_TIMEOUT)
+
+    @staticmethod
+    def _read(path: str) -> dict:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    @staticmethod
+    def _write(path: str, data: dict) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, sort_keys=True)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def load(self) -> Dict[str, str]:
+        """
+        Read the current alias mapping.
+
+        Returns:
+            Dictionary of alias -> physical collection name
+        """
+        return self._read(self.path)
+
+    def _save(self, aliases: Dict[str, str]) -> None:
+        self._write(self.path, aliases)
+
+    def resolve(self, name: str) -> str:
+        """
+        Resolve a logical collection name.
+
+        Args:
+            name: Logical (or physical) collection name
+
+        Returns:
+            The physical collection name; the name itself if it has no alias
+        """
+        return self.load().get(name, name)
+
+    def swap(self, alias: str, target: str) -> Optional[str]:
+        """
+        Atomically point an alias at a new physical collection.
+
+        Args:
+            alias: Logical collection name
+            target: Physical collection name
+
+        Returns:
+            The physical collection the alias pointed to before, if any
+        """
+        with self._lock, self._locked():
+            aliases = self.load()
+            previous = aliases.get(alias)
+            aliases[alias] = target
+            self._save(aliases)
+        return previous
+
+    def retire(self, alias: str, names: Iterable[str]) -> List[str]:
+        """
+        Record the physical collections an alias was just swapped away from.
+
+        Args:
+            alias: Logical collection name
+            names: Physical collections that no longer back the alias
+
+        Returns:
+            The collections retired by the alias's previous swap, which no query
+            can still be using and which can now be dropped
+        """
+        with self._lock, self._locked():
+            retired = self._read(self.retired_path)
+            expired = retired.pop(alias, [])
+            current = sorted(set(names))
+            if current:
+                retired[alias] = current
+            self._write(self.retired_path, retired)
+        return expired
+
+    def retired_names(self) -> Set[str]:
+        """
+        List the physical collections retired by swaps and not yet dropped.
+
+        Returns:
+            Set of physical collection names
+        """
+        return {name for names in self._read(self.retired_path).values() for name in names}
+
+    def remove(self, alias: str) -> Optional[str]:
+        """
+        Remove an alias.
+
+        Args:
+            alias: Logical collection name
+
+        Returns:
+            The physical collection the alias pointed to, if any
+        """
+        with self._lock, self._locked():
+            aliases = self.load()
+            previous = aliases.pop(alias, None)
+            if previous is not None:
+                self._save(aliases)
+        return previous
+
+
+def staging_collection_name(alias: str) -> str:
+    """
+    Build a unique, versioned physical name for a new build of a collection.
+
+    Args:
+        alias: Logical collection name
+
+    Returns:
+        Physical collection name such as 'manual-v1715688000123'
+    """
+    return f"{alias[:_MAX_BASE_LENGTH]}-v{int(time.time() * 1000)}"
+
+
+def rebuild_with_alias_swap(client, aliases: AliasTable, alias: str,
+                            build: Callable[[object], None],
+                            embedding_function=None,
+                            metadata: Optional[Dict[str, object]] = None) -> str:
+    """
+    Build a collection into staging and swap the alias to it when complete.
+
+    The previous physical collection (and a legacy collection stored directly
+    under the alias name) is retired after the swap and deleted on the next
+    one (see promote_staging_collection). If the build fails, the
+    staging collection is dropped and the alias keeps serving the old data.
+
+    Args:
+        client: ChromaDB client
+        aliases: Alias table to update
+        alias: Logical collection name
+        build: Function that fills the given staging collection
+        embedding_function: Embedding function for the staging collection
+        metadata: Optional collection metadata (e.g. {"hnsw:space": "cosine"})
+
+    Returns:
+        Name of the new physical collection
+    """
+    staging_name = staging_collection_name(alias)
+    staging = client.create_collection(
+        name=staging_name,
+        embedding_function=embedding_function,
+        metadata=metadata
+    )
+
+    try:
+        build(staging)
+    except Exception:
+        client.delete_collection(staging_name)
+        raise
+
+    promote_staging_collection(client, aliases, alias, staging_name)
+    return staging_name
+
+
+def promote_staging_collection(client, aliases: AliasTable, alias: str, staging_name: str) -> None:
+    """
+    Swap an alias to a fully built staging collection.
+
+    The collection replaced is retired, and the one retired by the previous
+    swap is dropped.
+
+    Args:
+        client: ChromaDB client
+        aliases: Alias table to update
+        alias: Logical collection name
+        staging_name: Physical name of the completed staging collection
+    """
+    previous = aliases.swap(alias, staging_name)
+    print(f"Collection '{alias}' now served by '{staging_name}'")
+
+    # Queries that resolved the alias before the swap may still use the
+    # collection it replaced, so that one is only dropped on the next swap
+    # (before the first swap, a legacy collection may be stored under the alias name)
+    replaced = {previous or alias} - {staging_name}
+    for old_name in aliases.retire(alias, replaced):
+        if old_name == staging_name:
+            continue
+        try:
+            client.delete_collection(old_name)
+            print(f"Deleted previous collection: {old_name}")
+        except Exception:
+            pass
@@ -0,0 +1,170 @@
+"""
+Embedding Model Warmup
+
+Chroma's default embedding function (ONNX all-MiniLM-L6-v2) loads its model
+lazily: the first call downloads it if it is missing, reads the tokenizer,
+builds the ONNX inference session and runs a first, slower inference. Without
+warmup all of that lands on the first user query.
+
+warm_up_embedding_function moves that cost to startup. It points the embedding
+function at a local model directory, loads the model without ever downloading
+it, runs dummy inferences, and reports how long loading took and how much
+first-query latency was saved.
+
+A model directory holds the extracted ONNX files (config.json, model.onnx,
+special_tokens_map.json, tokenizer_config.json, tokenizer.json, vocab.txt),
+either directly or in an 'onnx' subdirectory, as in Chroma's own cache
+(~/.cache/chroma/onnx_models/all-MiniLM-L6-v2).
+"""
+
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+# Environment variable naming the local model directory
+MODEL_DIR_ENV = "EMBEDDING_MODEL_DIR"
+
+REQUIRED_MODEL_FILES = (
+    "config.json",
+    "model.onnx",
+    "special_tokens_map.json",
+    "tokenizer_config.json",
+    "tokenizer.json",
+    "vocab.txt",
+)
+
+_WARMUP_TEXT = "Warmup query used to initialize the embedding model."
+
+
+def model_files_dir(embedding_function) -> Optional[str]:
+    """
+    Get the directory the embedding function loads its model files from.
+
+    Args:
+        embedding_function: Chroma embedding function
+
+    Returns:
+        Directory path, or None if the function does not load local model files
+    """
+    download_path = getattr(embedding_function, "DOWNLOAD_PATH", None)
+    folder = getattr(embedding_function, "EXTRACTED_FOLDER_NAME", None)
+    if download_path is None or folder is None:
+        return None
+    return os.path.join(str(download_path), folder)
+
+
+def missing_model_files(files_dir: str) -> List[str]:
+    """
+    List the model files missing from a directory.
+
+    Args:
+        files_dir: Directory that should hold the extracted model files
+
+    Returns:
+        Names of the missing files
+    """
+    return [name for name in REQUIRED_MODEL_FILES
+            if not os.path.exists(os.path.join(files_dir, name))]
+
+
+def use_local_model(embedding_function, model_dir: str) -> str:
+    """
+    Point an ONNX embedding function at a local model directory.
+
+    Args:
+        embedding_function: Chroma ONNX embedding function
+        model_dir: Directory holding the model files, directly or in 'onnx/'
+
+    Returns:
+        Directory the model files will be loaded from
+    """
+    if not hasattr(embedding_function, "DOWNLOAD_PATH"):
+        raise ValueError(f"{type(embedding_function).__name__} does not load a local model")
+
+    model_dir = os.path.abspath(model_dir)
+    nested = os.path.join(model_dir, getattr(embedding_function, "EXTRACTED_FOLDER_NAME", "onnx"))
+    if os.path.isdir(nested):
+        embedding_function.DOWNLOAD_PATH = model_dir
+    else:
+        # Files sit directly in model_dir
+        embedding_function.DOWNLOAD_PATH = os.path.dirname(model_dir)
+        embedding_function.EXTRACTED_FOLDER_NAME = os.path.basename(model_dir)
+    return model_files_dir(embedding_function)
+
+
+def warm_up_embedding_function(embedding_function, model_dir: Optional[str] = None,
+                               offline: bool = True, rounds: int = 3) -> Dict[str, Any]:
+    """
+    Load the embedding model and run dummy inferences ahead of the first query.
+
+    Args:
+        embedding_function: Chroma embedding function to warm up (modified in place)
+        model_dir: Local model directory (default: $EMBEDDING_MODEL_DIR, else the
+            embedding function's own cache directory)
+        offline: Refuse to download the model; raise if its files are missing
+        rounds: Number of inferences run after loading, to measure warm latency
+
+    Returns:
+        Report with load_s, first_inference_s, warm_inference_s and
+        cold_start_saved_s (what the first query would otherwise have paid)
+    """
+    model_dir = model_dir or os.getenv(MODEL_DIR_ENV)
+    files_dir = (use_local_model(embedding_function, model_dir) if model_dir
+                 else model_files_dir(embedding_function))
+
+    if files_dir is not None and offline:
+        missing = missing_model_files(files_dir)
+        if missing:
+            raise FileNotFoundError(
+                f"Embedding model files missing from {files_dir}: {', '.join(missing)}. "
+                f"Copy the extracted model there or set {MODEL_DIR_ENV}."
+            )
+
+    # Load the tokenizer and inference session (ONNX embedding functions only;
+    # other functions initialize on their first call)
+    start = time.perf_counter()
+    if not offline and hasattr(embedding_function, "_download_model_if_not_exists"):
+        embedding_function._download_model_if_not_exists()
+    if hasattr(embedding_function, "_init_model_and_tokenizer"):
+        embedding_function._init_model_and_tokenizer()
+    load_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    embedding_function([_WARMUP_TEXT])
+    first_inference_s = time.perf_counter() - start
+
+    warm_times = []
+    for _ in range(max(1, rounds)):
+        start = time.perf_counter()
+        embedding_function([_WARMUP_TEXT])
+        warm_times.append(time.perf_counter() - start)
+    warm_inference_s = min(warm_times)
+
+    return {
+        "model": getattr(embedding_function, "MODEL_NAME", type(embedding_function).__name__),
+        "model_dir": files_dir,
+        "load_s": load_s,
+        "first_inference_s": first_inference_s,
+        "warm_inference_s": warm_inference_s,
+        "cold_start_saved_s": load_s + first_inference_s - warm_inference_s,
+    }
+
+
+def format_warmup_report(report: Dict[str, Any]) -> str:
+    """
+    Format a warmup report for display.
+
+    Args:
+        report: Report returned by warm_up_embedding_function
+
+    Returns:
+        Human-readable summary
+    """
+    return (
+        f"Embedding model '{report['model']}' warmed up"
+        f"{' from ' + report['model_dir'] if report['model_dir'] else ''}: "
+        f"load {report['load_s'] * 1000:.0f} ms, "
+        f"first inference {report['first_inference_s'] * 1000:.0f} ms, "
+        f"warm inference {report['warm_inference_s'] * 1000:.1f} ms; "
+        f"first-query latency saved {report['cold_start_saved_s'] * 1000:.0f} ms"
+    )
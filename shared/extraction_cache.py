@@ -0,0 +1,338 @@
+"""
+PDF Extraction Cache
+
+Parsing a PDF is the most expensive step of ingestion, and it is repeated every
+time the same document is re-chunked with different settings. This module keeps
+the per-page text of each parsed PDF on disk, keyed by the SHA-256 of the file
+contents and the extraction backend, so later runs can skip PyPDF2/PyMuPDF.
+
+Each cached document is a single ``.pages`` file:
+
+    magic (8 bytes) | page count (uint32) | page offsets ((count + 1) x uint64) | UTF-8 page texts
+
+The file is read back through ``mmap``, so only the pages that are asked for
+are decoded.
+
+While a document is being extracted, pages are appended to a ``.pages.partial``
+file (length-prefixed records, synced periodically). If the process dies part
+way through a large PDF, the next run resumes from the last synced page instead
+of starting again from page 1.
+"""
+
+import hashlib
+import mmap
+import os
+import struct
+from typing import Callable, Iterable, Iterator, List, Optional
+
+# Directory where cached page files are stored
+DEFAULT_CACHE_DIR = os.getenv("PDF_EXTRACTION_CACHE_DIR", ".extraction_cache")
+
+# Supported extraction backends
+BACKENDS = ("pypdf2", "pymupdf")
+
+_MAGIC = b"PDFPAGE1"
+_COUNT_FORMAT = "<I"
+_OFFSET_FORMAT = "<Q"
+_HEADER_SIZE = len(_MAGIC) + struct.calcsize(_COUNT_FORMAT)
+_OFFSET_SIZE = struct.calcsize(_OFFSET_FORMAT)
+_RECORD_FORMAT = "<I"
+_RECORD_HEADER_SIZE = struct.calcsize(_RECORD_FORMAT)
+
+
+def file_hash(path: str, block_size: int = 1 << 20) -> str:
+    """
+    Compute the SHA-256 hash of a file's contents.
+
+    Args:
+        path: Path to the file
+        block_size: Number of bytes to read at a time
+
+    Returns:
+        Hex digest of the file contents
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def extract_pages(pdf_path: str, backend: str = "pypdf2", start_page: int = 0) -> Iterator[str]:
+    """
+    Extract the text of each page of a PDF, one page at a time.
+
+    Args:
+        pdf_path: Path to the PDF file
+        backend: Extraction backend ('pypdf2' or 'pymupdf')
+        start_page: Zero-based page to start from
+
+    Yields:
+        Text of each page from start_page on, in page order
+    """
+    if backend == "pypdf2":
+        import PyPDF2
+
+        with open(pdf_path, 'rb') as file:
+            pdf_reader = PyPDF2.PdfReader(file)
+            for page_num in range(start_page, len(pdf_reader.pages)):
+                yield pdf_reader.pages[page_num].extract_text()
+    elif backend == "pymupdf":
+        import fitz  # PyMuPDF
+
+        doc = fitz.open(pdf_path)
+        try:
+            for page_num in range(start_page, len(doc)):
+                yield doc.load_page(page_num).get_text()
+        finally:
+            doc.close()
+    else:
+        raise ValueError(f"Unknown extraction backend: {backend}")
+
+
+def write_pages(cache_path: str, pages: Iterable[str]) -> None:
+    """
+    Write page texts to a cache file atomically.
+
+    Args:
+        cache_path: Destination path of the ``.pages`` file
+        pages: Page texts in page order
+    """
+    encoded = [page.encode("utf-8") for page in pages]
+
+    offsets = [0]
+    for data in encoded:
+        offsets.append(offsets[-1] + len(data))
+
+    os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+    tmp_path = f"{cache_path}.tmp"
+    with open(tmp_path, 'wb') as file:
+        file.write(_MAGIC)
+        file.write(struct.pack(_COUNT_FORMAT, len(encoded)))
+        file.write(struct.pack(f"<{len(offsets)}Q", *offsets))
+        for data in encoded:
+            file.write(data)
+    os.replace(tmp_path, cache_path)
+
+
+def _read_partial(partial_path: str) -> List[str]:
+    """
+    Read the pages already extracted into a partial file.
+
+    A record torn by a crash at the end of the file is cut off, so that new
+    pages are appended after the last complete one.
+
+    Args:
+        partial_path: Path to the ``.pages.partial`` file
+
+    Returns:
+        Page texts extracted so far
+    """
+    pages = []
+    if not os.path.exists(partial_path):
+        return pages
+
+    with open(partial_path, 'r+b') as file:
+        data = file.read()
+        position = 0
+        while position + _RECORD_HEADER_SIZE <= len(data):
+            (length,) = struct.unpack_from(_RECORD_FORMAT, data, position)
+            end = position + _RECORD_HEADER_SIZE + length
+            if end > len(data):
+                break
+            pages.append(data[position + _RECORD_HEADER_SIZE:end].decode("utf-8"))
+            position = end
+        if position != len(data):
+            file.truncate(position)
+
+    return pages
+
+
+def extract_pages_resumable(pdf_path: str, cache_path: str, backend: str = "pypdf2",
+                            sync_every: int = 25,
+                            progress: Optional[Callable[[int], None]] = None) -> None:
+    """
+    Extract a PDF into a cache file, resuming a previously interrupted extraction.
+
+    Args:
+        pdf_path: Path to the PDF file
+        cache_path: Destination path of the ``.pages`` file
+        backend: Extraction backend
+        sync_every: Number of pages between durable syncs of the partial file
+        progress: Optional callback receiving the number of pages durably extracted
+    """
+    partial_path = f"{cache_path}.partial"
+    os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+
+    pages = _read_partial(partial_path)
+    if pages:
+        print(f"Resuming extraction at page {len(pages) + 1}")
+
+    with open(partial_path, 'ab') as partial:
+        for text in extract_pages(pdf_path, backend, start_page=len(pages)):
+            data = text.encode("utf-8")
+            partial.write(struct.pack(_RECORD_FORMAT, len(data)))
+            partial.write(data)
+            pages.append(text)
+
+            if len(pages) % sync_every == 0:
+                partial.flush()
+                os.fsync(partial.fileno())
+                if progress:
+                    progress(len(pages))
+
+    write_pages(cache_path, pages)
+    os.remove(partial_path)
+    if progress:
+        progress(len(pages))
+
+
+class CachedPages:
+    """
+    Read-only, memory-mapped view of a cached ``.pages`` file.
+    """
+
+    def __init__(self, cache_path: str):
+        """
+        Open a cached page file.
+
+        Args:
+            cache_path: Path to the ``.pages`` file
+        """
+        self.cache_path = cache_path
+        self._file = open(cache_path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._map[:len(_MAGIC)] != _MAGIC:
+            self.close()
+            raise ValueError(f"Not a page cache file: {cache_path}")
+
+        self.num_pages = struct.unpack_from(_COUNT_FORMAT, self._map, len(_MAGIC))[0]
+        self._data_start = _HEADER_SIZE + (self.num_pages + 1) * _OFFSET_SIZE
+
+    def __len__(self) -> int:
+        return self.num_pages
+
+    def __enter__(self) -> "CachedPages":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Release the memory map and the underlying file."""
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def page(self, page_num: int) -> str:
+        """
+        Decode the text of a single page.
+
+        Args:
+            page_num: Zero-based page number
+
+        Returns:
+            Text of the page
+        """
+        if not 0 <= page_num < self.num_pages:
+            raise IndexError(f"Page {page_num} out of range (document has {self.num_pages} pages)")
+
+        start, end = struct.unpack_from("<2Q", self._map, _HEADER_SIZE + page_num * _OFFSET_SIZE)
+        return self._map[self._data_start + start:self._data_start + end].decode("utf-8")
+
+    def pages(self, page_numbers: Optional[Iterable[int]] = None) -> Iterator[str]:
+        """
+        Iterate over page texts.
+
+        Args:
+            page_numbers: Optional page numbers to read; all pages if omitted
+
+        Yields:
+            Text of each requested page
+        """
+        if page_numbers is None:
+            page_numbers = range(self.num_pages)
+        for page_num in page_numbers:
+            yield self.page(page_num)
+
+    def text(self, page_numbers: Optional[Iterable[int]] = None, separator: str = "\n\n") -> str:
+        """
+        Rebuild the document text, with each page followed by a separator.
+
+        Args:
+            page_numbers: Optional page numbers to include; all pages if omitted
+            separator: Text appended after every page
+
+        Returns:
+            Concatenated page texts
+        """
+        return "".join(page + separator for page in self.pages(page_numbers))
+
+
+def cache_path_for(pdf_path: str, backend: str = "pypdf2",
+                   cache_dir: str = DEFAULT_CACHE_DIR) -> str:
+    """
+    Get the cache file path for a PDF and backend.
+
+    Args:
+        pdf_path: Path to the PDF file
+        backend: Extraction backend
+        cache_dir: Directory holding the cache files
+
+    Returns:
+        Path of the ``.pages`` file for this document
+    """
+    return os.path.join(cache_dir, f"{file_hash(pdf_path)}.{backend}.pages")
+
+
+def get_cached_pages(pdf_path: str, backend: str = "pypdf2",
+                     cache_dir: str = DEFAULT_CACHE_DIR,
+                     pdf_hash: Optional[str] = None,
+                     progress: Optional[Callable[[int], None]] = None) -> CachedPages:
+    """
+    Open the cached pages of a PDF, extracting and caching them on a miss.
+
+    Args:
+        pdf_path: Path to the PDF file
+        backend: Extraction backend ('pypdf2' or 'pymupdf')
+        cache_dir: Directory holding the cache files
+        pdf_hash: Precomputed SHA-256 of the PDF, if already known
+        progress: Optional callback receiving the number of pages extracted so far
+
+    Returns:
+        CachedPages view of the document (close it when done)
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown extraction backend: {backend}")
+
+    pdf_hash = pdf_hash or file_hash(pdf_path)
+    cache_path = os.path.join(cache_dir, f"{pdf_hash}.{backend}.pages")
+    if not os.path.exists(cache_path):
+        extract_pages_resumable(pdf_path, cache_path, backend, progress=progress)
+
+    return CachedPages(cache_path)
+
+
+def clear_cache(cache_dir: str = DEFAULT_CACHE_DIR) -> List[str]:
+    """
+    Remove all cached page files.
+
+    Args:
+        cache_dir: Directory holding the cache files
+
+    Returns:
+        List of removed file paths
+    """
+    removed = []
+    if not os.path.isdir(cache_dir):
+        return removed
+    for name in os.listdir(cache_dir):
+        if name.endswith((".pages", ".pages.tmp", ".pages.partial")):
+            path = os.path.join(cache_dir, name)
+            os.remove(path)
+            removed.append(path)
+    return removed
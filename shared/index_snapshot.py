@@ -0,0 +1,323 @@
+"""
+Index Snapshots
+
+Exports a ChromaDB collection (ids, documents, metadata and the raw embedding
+vectors) to a portable directory of compact columnar files, and bulk-loads such
+a snapshot into another ChromaDB instance without calling the embedding model.
+Replicating an index becomes a file copy plus sequential reads instead of
+re-running extraction and embedding on the target node.
+
+Snapshot layout:
+
+    manifest.json         format version, row count, dimension, columns, checksums
+    embeddings.f32        float32 vectors, row-major (count x dimension)
+    <column>.offsets      uint64 offsets (count + 1) into <column>.data
+    <column>.data         UTF-8 values of a string column, concatenated
+    <column>.nulls        one byte per row (1 = null) for nullable columns
+
+String columns are 'ids', 'documents' and 'metadatas' (JSON-encoded).
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+
+SNAPSHOT_FORMAT = "chroma-snapshot"
+SNAPSHOT_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+EMBEDDINGS_FILE = "embeddings.f32"
+STRING_COLUMNS = ("ids", "documents", "metadatas")
+
+
+def _sha256(path: str, block_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class _StringColumnWriter:
+    """Streams a nullable string column to .offsets/.data/.nulls files."""
+
+    def __init__(self, directory: str, name: str):
+        self.paths = {
+            "offsets": os.path.join(directory, f"{name}.offsets"),
+            "data": os.path.join(directory, f"{name}.data"),
+            "nulls": os.path.join(directory, f"{name}.nulls"),
+        }
+        self._offsets = open(self.paths["offsets"], 'wb')
+        self._data = open(self.paths["data"], 'wb')
+        self._nulls = open(self.paths["nulls"], 'wb')
+        self._position = 0
+        self._offsets.write(np.uint64(0).tobytes())
+
+    def write(self, values: List[Optional[str]]) -> None:
+        offsets = np.empty(len(values), dtype=np.uint64)
+        nulls = np.zeros(len(values), dtype=np.uint8)
+        for i, value in enumerate(values):
+            if value is None:
+                nulls[i] = 1
+            else:
+                data = value.encode("utf-8")
+                self._data.write(data)
+                self._position += len(data)
+            offsets[i] = self._position
+        self._offsets.write(offsets.tobytes())
+        self._nulls.write(nulls.tobytes())
+
+    def close(self) -> None:
+        for f in (self._offsets, self._data, self._nulls):
+            f.close()
+
+
+class _StringColumnReader:
+    """Memory-mapped reader for a string column written by _StringColumnWriter."""
+
+    def __init__(self, directory: str, name: str):
+        self._files = []
+        self.offsets = np.memmap(os.path.join(directory, f"{name}.offsets"), dtype=np.uint64, mode='r')
+        self.nulls = np.memmap(os.path.join(directory, f"{name}.nulls"), dtype=np.uint8, mode='r') \
+            if os.path.getsize(os.path.join(directory, f"{name}.nulls")) else np.zeros(0, dtype=np.uint8)
+        data_path = os.path.join(directory, f"{name}.data")
+        self.data = b""
+        if os.path.getsize(data_path):
+            f = open(data_path, 'rb')
+            self._files.append(f)
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def read(self, start: int, end: int) -> List[Optional[str]]:
+        values = []
+        for i in range(start, end):
+            if self.nulls[i]:
+                values.append(None)
+            else:
+                values.append(self.data[int(self.offsets[i]):int(self.offsets[i + 1])].decode("utf-8"))
+        return values
+
+    def close(self) -> None:
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        for f in self._files:
+            f.close()
+
+
+def iter_collection_pages(collection, batch_size: int = 1000,
+                          include: Optional[List[str]] = None,
+                          where: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Page through a collection with bounded memory.
+
+    Pages are read with limit/offset, so records added or deleted while
+    iterating may be skipped or returned twice.
+
+    Args:
+        collection: ChromaDB collection
+        batch_size: Number of records per page
+        include: Fields to include (default: embeddings, documents, metadatas)
+        where: Optional metadata filter
+
+    Yields:
+        Result dictionaries of collection.get for each page
+    """
+    if include is None:
+        include = ["embeddings", "documents", "metadatas"]
+    offset = 0
+    while True:
+        page = collection.get(where=where, limit=batch_size, offset=offset, include=include)
+        if not page["ids"]:
+            break
+        yield page
+        offset += len(page["ids"])
+
+
+def iter_collection_records(collection, batch_size: int = 1000,
+                            include: Optional[List[str]] = None,
+                            where: Optional[Dict[str, Any]] = None,
+                            resolve=None) -> Iterator[Dict[str, Any]]:
+    """
+    Iterate over the records of a collection one at a time, with bounded memory.
+
+    Args:
+        collection: ChromaDB collection
+        batch_size: Number of records read per page
+        include: Fields to include (default: documents, metadatas)
+        where: Optional metadata filter
+        resolve: Optional function (documents, metadatas) -> documents filling in
+            texts that are not stored in ChromaDB (e.g. TextSideStore.resolve)
+
+    Yields:
+        Dictionaries with 'id' plus 'document', 'metadata' and 'embedding' for the
+        included fields
+    """
+    include = list(include) if include is not None else ["documents", "metadatas"]
+    fields = [field for field in ("documents", "metadatas", "embeddings") if field in include]
+
+    # Rebuilding documents needs the metadata locating them
+    page_include = list(fields)
+    if resolve is not None and "documents" in fields and "metadatas" not in fields:
+        page_include.append("metadatas")
+
+    for page in iter_collection_pages(collection, batch_size, include=page_include, where=where):
+        if resolve is not None and "documents" in fields:
+            page["documents"] = resolve(page["documents"], page["metadatas"])
+        for i, record_id in enumerate(page["ids"]):
+            record = {"id": record_id}
+            for field in fields:
+                record[field[:-1]] = page[field][i] if page[field] is not None else None
+            yield record
+
+
+def export_collection(collection, path: str, batch_size: int = 1000,
+                      collection_name: Optional[str] = None,
+                      embedding_model: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Export a collection to a snapshot directory.
+
+    Args:
+        collection: ChromaDB collection to export
+        path: Snapshot directory to create
+        batch_size: Number of records read from ChromaDB per page
+        collection_name: Logical name recorded in the manifest (default: collection.name)
+        embedding_model: Name of the model that produced the embeddings, recorded
+            so the importing side can check it queries with the same model
+
+    Returns:
+        The snapshot manifest
+    """
+    os.makedirs(path, exist_ok=True)
+    writers = {name: _StringColumnWriter(path, name) for name in STRING_COLUMNS}
+    count = 0
+    dimension = None
+
+    try:
+        with open(os.path.join(path, EMBEDDINGS_FILE), 'wb') as embeddings_file:
+            for page in iter_collection_pages(collection, batch_size):
+                embeddings = np.asarray(page["embeddings"], dtype=np.float32)
+                if dimension is None:
+                    dimension = int(embeddings.shape[1])
+                elif embeddings.shape[1] != dimension:
+                    raise ValueError("Collection contains embeddings of different dimensions")
+                embeddings_file.write(embeddings.tobytes())
+
+                writers["ids"].write(page["ids"])
+                writers["documents"].write(page["documents"] or [None] * len(page["ids"]))
+                writers["metadatas"].write([
+                    json.dumps(metadata, ensure_ascii=False, sort_keys=True) if metadata else None
+                    for metadata in (page["metadatas"] or [None] * len(page["ids"]))
+                ])
+                count += len(page["ids"])
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    files = [EMBEDDINGS_FILE] + [
+        f"{name}.{part}" for name in STRING_COLUMNS for part in ("offsets", "data", "nulls")
+    ]
+    manifest = {
+        "format": SNAPSHOT_FORMAT,
+        "version": SNAPSHOT_VERSION,
+        "collection_name": collection_name or collection.name,
+        "collection_metadata": collection.metadata,
+        "count": count,
+        "dimension": dimension,
+        "dtype": "float32",
+        "embedding_model": embedding_model,
+        "columns": list(STRING_COLUMNS),
+        "created_at": time.time(),
+        "checksums": {name: _sha256(os.path.join(path, name)) for name in files},
+    }
+    with open(os.path.join(path, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+
+    return manifest
+
+
+def read_manifest(path: str, verify: bool = True) -> Dict[str, Any]:
+    """
+    Read and validate a snapshot manifest.
+
+    Args:
+        path: Snapshot directory
+        verify: Check the SHA-256 of every snapshot file
+
+    Returns:
+        The snapshot manifest
+    """
+    with open(os.path.join(path, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+
+    if manifest.get("format") != SNAPSHOT_FORMAT or manifest.get("version") != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported snapshot format in {path}")
+
+    if verify:
+        for name, checksum in manifest["checksums"].items():
+            if _sha256(os.path.join(path, name)) != checksum:
+                raise ValueError(f"Snapshot file is corrupted: {name}")
+
+    return manifest
+
+
+def load_snapshot_into(collection, path: str, batch_size: int = 1000,
+                       manifest: Optional[Dict[str, Any]] = None) -> int:
+    """
+    Bulk-load a snapshot into a collection using its stored embeddings.
+
+    Args:
+        collection: ChromaDB collection to fill
+        path: Snapshot directory
+        batch_size: Number of records written per batch
+        manifest: Manifest already read with read_manifest, if any
+
+    Returns:
+        Number of records loaded
+    """
+    manifest = manifest or read_manifest(path)
+    count = manifest["count"]
+    if count == 0:
+        return 0
+
+    embeddings = np.memmap(
+        os.path.join(path, EMBEDDINGS_FILE),
+        dtype=np.float32,
+        mode='r',
+        shape=(count, manifest["dimension"])
+    )
+    readers = {name: _StringColumnReader(path, name) for name in STRING_COLUMNS}
+
+    try:
+        for start in range(0, count, batch_size):
+            end = min(start + batch_size, count)
+            ids = readers["ids"].read(start, end)
+            documents = readers["documents"].read(start, end)
+            metadatas = [
+                json.loads(metadata) if metadata is not None else None
+                for metadata in readers["metadatas"].read(start, end)
+            ]
+            vectors = embeddings[start:end].tolist()
+
+            # ChromaDB rejects None entries, so rows with and without documents
+            # or metadata are written in separate calls
+            groups = {}
+            for i in range(len(ids)):
+                key = (documents[i] is not None, metadatas[i] is not None)
+                groups.setdefault(key, []).append(i)
+
+            for (has_documents, has_metadata), rows in groups.items():
+                collection.add(
+                    ids=[ids[i] for i in rows],
+                    embeddings=[vectors[i] for i in rows],
+                    documents=[documents[i] for i in rows] if has_documents else None,
+                    metadatas=[metadatas[i] for i in rows] if has_metadata else None
+                )
+    finally:
+        for reader in readers.values():
+            reader.close()
+        del embeddings
+
+    return count
@@ -0,0 +1,302 @@
+"""
+Run Profiling
+
+Opt-in profiler behind the --profile option of the command-line tools. One
+session records, for a whole run:
+
+- profile.pstats / profile.txt: cProfile output of every thread started during
+  the session, merged (load the .pstats file with pstats, snakeviz, etc.; the
+  .txt file lists the top functions by cumulative time)
+- stacks.collapsed: sampled stacks in the collapsed format read by flamegraph.pl,
+  speedscope and inferno; each stack is rooted at the stage it was sampled in
+- stages.json / summary.txt: wall time, CPU time and peak memory per stage (the
+  highest traced memory seen while the stage ran, and how far it rose above the
+  memory in use when the stage started)
+
+Stages are labelled in the code with ``profile_stage("extract")``; outside of a
+profiling session the label costs nothing.
+
+Stages may run concurrently in several threads (e.g. batch answering). Each
+thread started during the session gets its own cProfile profiler; threads that
+already existed when the session started are only covered by the stack samples.
+The tracemalloc peak is never reset: a stage's peak is taken from the traced
+memory sampled with the stacks and at the stage's start and end, so spikes
+shorter than the sample interval are missed. Traced memory is process-wide, so
+the peak of a stage that overlaps with others includes what they allocated.
+"""
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+# Interval between stack samples for the collapsed-stack file, in seconds
+DEFAULT_SAMPLE_INTERVAL = 0.005
+
+# Deepest stack recorded per sample
+_MAX_STACK_DEPTH = 128
+
+_active_profiler: Optional["RunProfiler"] = None
+
+
+class RunProfiler:
+    """
+    CPU and memory profiler for one run, with per-stage attribution.
+    """
+
+    def __init__(self, report_dir: str, sample_interval: float = DEFAULT_SAMPLE_INTERVAL):
+        """
+        Initialize the profiler.
+
+        Args:
+            report_dir: Directory the report files are written to
+            sample_interval: Seconds between stack samples
+        """
+        self.report_dir = report_dir
+        self.sample_interval = sample_interval
+        self.stacks: Counter = Counter()
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self._profile = cProfile.Profile()
+        self._thread_profiles: List[cProfile.Profile] = []
+        self._lock = threading.Lock()
+        self._stage_stacks: Dict[int, List[Dict[str, float]]] = {}
+        self._stop_sampling = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+        self._started = 0.0
+        self._elapsed = 0.0
+        self._peak = 0
+
+    def start(self) -> None:
+        """Start CPU profiling, stack sampling and memory tracing."""
+        self._started = time.perf_counter()
+        tracemalloc.start()
+        self._stop_sampling.clear()
+        self._sampler = threading.Thread(target=self._sample, name="profile-sampler", daemon=True)
+        self._sampler.start()
+        threading.setprofile(self._profile_thread)
+        self._profile.enable()
+
+    def _profile_thread(self, frame, event, arg) -> None:
+        """Installed with threading.setprofile: gives each new thread its own profiler."""
+        profile = cProfile.Profile()
+        with self._lock:
+            self._thread_profiles.append(profile)
+        # Replaces this hook for the rest of the thread's life
+        profile.enable()
+
+    def stop(self) -> None:
+        """Stop profiling."""
+        self._profile.disable()
+        threading.setprofile(None)
+        self._stop_sampling.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        self._peak = max(self._peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        self._elapsed = time.perf_counter() - self._started
+
+    def _sample(self) -> None:
+        """
+        Periodically record the stack of every other thread, rooted at its stage,
+        and the traced memory for the peaks of the running stages.
+        """
+        own_id = threading.get_ident()
+        names = {}
+        while not self._stop_sampling.wait(self.sample_interval):
+            current = tracemalloc.get_traced_memory()[0]
+            with self._lock:
+                stage_names = {}
+                for thread_id, stack in self._stage_stacks.items():
+                    for entry in stack:
+                        entry["peak"] = max(entry["peak"], current)
+                    stage_names[thread_id] = [entry["name"] for entry in stack]
+
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                frames = []
+                while frame is not None and len(frames) < _MAX_STACK_DEPTH:
+                    code = frame.f_code
+                    frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:"
+                                  f"{code.co_firstlineno})")
+                    frame = frame.f_back
+                frames.reverse()
+
+                root = [f"stage:{'/'.join(stage_names.get(thread_id, [])) or 'other'}"]
+                if thread_id != threading.main_thread().ident:
+                    if thread_id not in names:
+                        names = {thread.ident: thread.name for thread in threading.enumerate()}
+                    root.insert(0, f"thread:{names.get(thread_id, thread_id)}")
+                self.stacks[";".join(root + frames)] += 1
+
+    def enter_stage(self, name: str) -> None:
+        """
+        Start attributing time and memory to a stage in the current thread.
+
+        Args:
+            name: Stage label
+        """
+        current = tracemalloc.get_traced_memory()[0]
+        with self._lock:
+            stack = self._stage_stacks.setdefault(threading.get_ident(), [])
+            if stack:
+                stack[-1]["peak"] = max(stack[-1]["peak"], current)
+            stack.append({
+                "name": name,
+                "wall": time.perf_counter(),
+                "cpu": time.thread_time(),
+                "peak": current,
+                "start_bytes": current,
+            })
+
+    def exit_stage(self) -> None:
+        """Finish the innermost stage of the current thread."""
+        wall, cpu = time.perf_counter(), time.thread_time()
+        current = tracemalloc.get_traced_memory()[0]
+        with self._lock:
+            stack = self._stage_stacks[threading.get_ident()]
+            entry = stack.pop()
+            peak = max(entry["peak"], current)
+            if stack:
+                stack[-1]["peak"] = max(stack[-1]["peak"], peak)
+
+            label = "/".join([outer["name"] for outer in stack] + [entry["name"]])
+            stats = self.stages.setdefault(label, {"calls": 0, "wall_s": 0.0, "cpu_s": 0.0,
+                                                   "peak_bytes": 0, "peak_increase_bytes": 0})
+            stats["calls"] += 1
+            stats["wall_s"] += wall - entry["wall"]
+            stats["cpu_s"] += cpu - entry["cpu"]
+            stats["peak_bytes"] = max(stats["peak_bytes"], peak)
+            stats["peak_increase_bytes"] = max(stats["peak_increase_bytes"],
+                                               peak - entry["start_bytes"])
+
+    def summary(self) -> str:
+        """
+        Format the per-stage report.
+
+        Returns:
+            Human-readable table of stage timings and peak memory
+        """
+        lines = [f"Total: {self._elapsed:.3f}s wall, peak traced memory "
+                 f"{self._peak / 1024 / 1024:.1f} MiB",
+                 f"{'Stage':<32} {'Calls':>6} {'Wall (s)':>10} {'CPU (s)':>10} "
+                 f"{'Peak (MiB)':>11} {'+Peak (MiB)':>12}"]
+        for label, stats in self.stages.items():
+            lines.append(f"{label:<32} {stats['calls']:>6} {stats['wall_s']:>10.3f} "
+                         f"{stats['cpu_s']:>10.3f} {stats['peak_bytes'] / 1024 / 1024:>11.1f} "
+                         f"{stats['peak_increase_bytes'] / 1024 / 1024:>12.1f}")
+        return "\n".join(lines)
+
+    def write_report(self) -> List[str]:
+        """
+        Write the report files.
+
+        Returns:
+            Paths of the written files
+        """
+        os.makedirs(self.report_dir, exist_ok=True)
+        paths = []
+
+        # Merge the profiles of all threads
+        text = io.StringIO()
+        stats = pstats.Stats(self._profile, stream=text)
+        with self._lock:
+            thread_profiles = list(self._thread_profiles)
+        for profile in thread_profiles:
+            profile.create_stats()
+            if profile.stats:
+                stats.add(profile)
+
+        pstats_path = os.path.join(self.report_dir, "profile.pstats")
+        stats.dump_stats(pstats_path)
+        paths.append(pstats_path)
+
+        stats.sort_stats("cumulative").print_stats(60)
+        text_path = os.path.join(self.report_dir, "profile.txt")
+        with open(text_path, 'w', encoding='utf-8') as f:
+            f.write(text.getvalue())
+        paths.append(text_path)
+
+        stacks_path = os.path.join(self.report_dir, "stacks.collapsed")
+        with open(stacks_path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        paths.append(stacks_path)
+
+        stages_path = os.path.join(self.report_dir, "stages.json")
+        with open(stages_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                "total_wall_s": self._elapsed,
+                "peak_bytes": self._peak,
+                "sample_interval_s": self.sample_interval,
+                "samples": sum(self.stacks.values()),
+                "stages": self.stages,
+            }, f, indent=2)
+        paths.append(stages_path)
+
+        summary_path = os.path.join(self.report_dir, "summary.txt")
+        with open(summary_path, 'w', encoding='utf-8') as f:
+            f.write(self.summary() + "\n")
+        paths.append(summary_path)
+
+        return paths
+
+
+@contextmanager
+def profile_stage(name: str) -> Iterator[None]:
+    """
+    Label a stage of the run; a no-op unless a profiling session is active.
+
+    Args:
+        name: Stage label (nested stages are reported as 'outer/inner')
+    """
+    profiler = _active_profiler
+    if profiler is None:
+        yield
+        return
+
+    profiler.enter_stage(name)
+    try:
+        yield
+    finally:
+        profiler.exit_stage()
+
+
+@contextmanager
+def profile_session(report_dir: Optional[str],
+                    sample_interval: float = DEFAULT_SAMPLE_INTERVAL) -> Iterator[Optional[RunProfiler]]:
+    """
+    Profile the enclosed code and write a report; a no-op if report_dir is None.
+
+    Args:
+        report_dir: Directory to write the report to, or None to disable profiling
+        sample_interval: Seconds between stack samples
+
+    Yields:
+        The active RunProfiler, or None
+    """
+    global _active_profiler
+
+    if not report_dir:
+        yield None
+        return
+
+    profiler = RunProfiler(report_dir, sample_interval)
+    _active_profiler = profiler
+    profiler.start()
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
+        _active_profiler = None
+        profiler.write_report()
+        print(f"\nProfile written to {report_dir}/")
+        print(profiler.summary())
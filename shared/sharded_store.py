@@ -0,0 +1,336 @@
+"""
+Sharded ChromaDB Store
+
+A single ChromaDB persist directory keeps one SQLite file and one HNSW index per
+collection, so ingestion and query latency grow with the corpus. This module
+spreads every logical collection over N shards and searches them in parallel:
+
+- Each chunk id is hashed to a shard, so writes, upserts and lookups by id go to
+  exactly one shard and re-ingesting a chunk always lands in the same place.
+- A query is embedded once, sent to all shards concurrently, and the per-shard
+  results are merged into a global top-k by distance.
+
+Shards are either separate persist directories (``<base>/shard-00``, ...), which
+also gives each shard its own SQLite file and writer, or separate collections
+(``<name>-s00``, ...) inside one persist directory.
+
+ShardedStore offers the subset of the chromadb client API used in this project
+(get_collection, get_or_create_collection, create_collection, delete_collection)
+and returns ShardedCollection objects that behave like a chromadb Collection, so
+code written against a plain client works on top of it unchanged.
+"""
+
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import chromadb
+
+SHARD_CONFIG_NAME = "shards.json"
+LAYOUTS = ("directories", "collections")
+
+_DEFAULT_GET_INCLUDE = ["metadatas", "documents"]
+_DEFAULT_QUERY_INCLUDE = ["metadatas", "documents", "distances"]
+
+
+def shard_for(chunk_id: str, num_shards: int) -> int:
+    """
+    Pick the shard of a chunk from a stable hash of its id.
+
+    Args:
+        chunk_id: Chunk id
+        num_shards: Number of shards
+
+    Returns:
+        Shard index in [0, num_shards)
+    """
+    digest = hashlib.blake2b(chunk_id.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little") % num_shards
+
+
+def _pick(values: Optional[List[Any]], rows: List[int]) -> Optional[List[Any]]:
+    return None if values is None else [values[i] for i in rows]
+
+
+class ShardedCollection:
+    """
+    A logical collection whose records are hash-partitioned over several shards.
+    """
+
+    def __init__(self, name: str, shards: List[Any], executor: ThreadPoolExecutor,
+                 embedding_function=None):
+        """
+        Initialize a sharded collection (use ShardedStore to open one).
+
+        Args:
+            name: Logical collection name
+            shards: One chromadb collection per shard
+            executor: Thread pool used to fan out to the shards
+            embedding_function: Embedding function used to embed queries once
+        """
+        self.name = name
+        self.shards = shards
+        self.executor = executor
+        self.embedding_function = embedding_function
+
+    @property
+    def metadata(self) -> Optional[Dict[str, Any]]:
+        return self.shards[0].metadata
+
+    def _map(self, func, items) -> List[Any]:
+        """Run func over items on the shard thread pool, preserving order."""
+        return list(self.executor.map(func, items))
+
+    def _partition(self, ids: List[str]) -> Dict[int, List[int]]:
+        """Group row positions by the shard their id hashes to."""
+        groups: Dict[int, List[int]] = {}
+        for row, chunk_id in enumerate(ids):
+            groups.setdefault(shard_for(chunk_id, len(self.shards)), []).append(row)
+        return groups
+
+    def _write(self, method: str, ids: List[str], embeddings=None, metadatas=None,
+               documents=None) -> None:
+        def write(item):
+            shard, rows = item
+            getattr(self.shards[shard], method)(
+                ids=_pick(ids, rows),
+                embeddings=_pick(embeddings, rows),
+                metadatas=_pick(metadatas, rows),
+                documents=_pick(documents, rows)
+            )
+
+        self._map(write, self._partition(ids).items())
+
+    def add(self, ids: List[str], embeddings=None, metadatas=None, documents=None) -> None:
+        """Add records, each to the shard its id hashes to (shards are written in parallel)."""
+        self._write("add", ids, embeddings, metadatas, documents)
+
+    def upsert(self, ids: List[str], embeddings=None, metadatas=None, documents=None) -> None:
+        """Upsert records, each in the shard its id hashes to."""
+        self._write("upsert", ids, embeddings, metadatas, documents)
+
+    def count(self) -> int:
+        """Total number of records over all shards."""
+        return sum(self._map(lambda shard: shard.count(), self.shards))
+
+    def delete(self, ids: Optional[List[str]] = None, where=None, where_document=None) -> None:
+        """Delete records by id (routed to their shards) or by filter (sent to all shards)."""
+        if ids is not None:
+            self._map(
+                lambda item: self.shards[item[0]].delete(
+                    ids=_pick(ids, item[1]), where=where, where_document=where_document),
+                self._partition(ids).items()
+            )
+        else:
+            self._map(lambda shard: shard.delete(where=where, where_document=where_document),
+                      self.shards)
+
+    def get(self, ids: Optional[List[str]] = None, where=None, limit: Optional[int] = None,
+            offset: Optional[int] = None, where_document=None,
+            include: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Get records like Collection.get.
+
+        Lookups by id are routed to the owning shards. Otherwise limit/offset page
+        through the shards one after another, in shard order.
+
+        Returns:
+            Result dictionary in the chromadb format
+        """
+        include = include or _DEFAULT_GET_INCLUDE
+        fields = ["ids"] + [field for field in ("embeddings", "metadatas", "documents")
+                            if field in include]
+        merged: Dict[str, Any] = {field: [] for field in fields}
+
+        def extend(result):
+            for field in fields:
+                merged[field].extend(result[field])
+
+        if ids is not None:
+            results = self._map(
+                lambda item: self.shards[item[0]].get(
+                    ids=_pick(ids, item[1]), where=where, where_document=where_document,
+                    include=include),
+                self._partition(ids).items()
+            )
+            for result in results:
+                extend(result)
+        else:
+            skip = offset or 0
+            remaining = limit
+            for shard in self.shards:
+                if remaining is not None and remaining <= 0:
+                    break
+                if skip:
+                    # Skip whole shards that lie entirely before the offset
+                    if where is None and where_document is None:
+                        size = shard.count()
+                    else:
+                        size = len(shard.get(where=where, where_document=where_document,
+                                             include=[])["ids"])
+                    if size <= skip:
+                        skip -= size
+                        continue
+                result = shard.get(where=where, where_document=where_document,
+                                   limit=remaining, offset=skip or None, include=include)
+                skip = 0
+                extend(result)
+                if remaining is not None:
+                    remaining -= len(result["ids"])
+
+        for field in ("embeddings", "metadatas", "documents"):
+            merged.setdefault(field, None)
+        merged["uris"] = None
+        merged["data"] = None
+        return merged
+
+    def query(self, query_embeddings=None, query_texts=None, n_results: int = 10, where=None,
+              where_document=None, include: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Search all shards in parallel and merge the top-k by distance.
+
+        The query texts are embedded once here, not once per shard.
+
+        Returns:
+            Result dictionary in the chromadb format
+        """
+        include = include or _DEFAULT_QUERY_INCLUDE
+        if query_embeddings is None and self.embedding_function is not None:
+            query_embeddings = self.embedding_function(query_texts)
+            query_texts = None
+        num_queries = len(query_embeddings if query_embeddings is not None else query_texts)
+
+        # Distances are needed to merge, even if the caller did not ask for them
+        shard_include = list(include) if "distances" in include else list(include) + ["distances"]
+
+        def search(shard):
+            return shard.query(
+                query_embeddings=query_embeddings,
+                query_texts=query_texts,
+                n_results=n_results,
+                where=where,
+                where_document=where_document,
+                include=shard_include
+            )
+
+        shard_results = self._map(search, self.shards)
+
+        fields = ["ids"] + [field for field in ("distances", "embeddings", "metadatas", "documents")
+                            if field in include]
+        merged: Dict[str, Any] = {field: [] for field in fields}
+        for query_index in range(num_queries):
+            candidates = []
+            for result in shard_results:
+                for position in range(len(result["ids"][query_index])):
+                    candidates.append((result["distances"][query_index][position], result, position))
+            candidates.sort(key=lambda candidate: candidate[0])
+
+            top = candidates[:n_results]
+            for field in fields:
+                merged[field].append([result[field][query_index][position]
+                                      for _, result, position in top])
+
+        for field in ("distances", "embeddings", "metadatas", "documents"):
+            merged.setdefault(field, None)
+        merged["uris"] = None
+        merged["data"] = None
+        return merged
+
+
+class ShardedStore:
+    """
+    Client-like entry point to collections sharded over N directories or collections.
+    """
+
+    def __init__(self, persist_directory: str, num_shards: int, layout: str = "directories"):
+        """
+        Open (or create) a sharded store.
+
+        The shard count and layout are recorded in ``shards.json`` in the persist
+        directory; reopening it with different settings is refused, since records
+        would no longer hash to the shard that holds them.
+
+        Args:
+            persist_directory: Base directory of the store
+            num_shards: Number of shards
+            layout: 'directories' (one persist directory per shard) or
+                'collections' (one collection per shard in a single directory)
+        """
+        if layout not in LAYOUTS:
+            raise ValueError(f"Unknown shard layout: {layout}")
+        if num_shards < 1:
+            raise ValueError("num_shards must be at least 1")
+
+        os.makedirs(persist_directory, exist_ok=True)
+        config_path = os.path.join(persist_directory, SHARD_CONFIG_NAME)
+        config = {"num_shards": num_shards, "layout": layout}
+        if os.path.exists(config_path):
+            with open(config_path, 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+            if stored != config:
+                raise ValueError(
+                    f"{persist_directory} is sharded as {stored}, cannot open it as {config}"
+                )
+        else:
+            with open(config_path, 'w', encoding='utf-8') as f:
+                json.dump(config, f, indent=2)
+
+        self.persist_directory = persist_directory
+        self.num_shards = num_shards
+        self.layout = layout
+        if layout == "directories":
+            self.clients = [
+                chromadb.PersistentClient(os.path.join(persist_directory, f"shard-{i:02d}"))
+                for i in range(num_shards)
+            ]
+        else:
+            self.clients = [chromadb.PersistentClient(persist_directory)] * num_shards
+        self.executor = ThreadPoolExecutor(max_workers=num_shards, thread_name_prefix="shard")
+
+    def _shard_names(self, name: str) -> List[str]:
+        if self.layout == "directories":
+            return [name] * self.num_shards
+        return [f"{name}-s{i:02d}" for i in range(self.num_shards)]
+
+    def _open(self, method: str, name: str, embedding_function=None,
+              **kwargs) -> ShardedCollection:
+        shards = [
+            getattr(client, method)(name=shard_name, embedding_function=embedding_function, **kwargs)
+            for client, shard_name in zip(self.clients, self._shard_names(name))
+        ]
+        return ShardedCollection(name, shards, self.executor, embedding_function)
+
+    def get_collection(self, name: str, embedding_function=None) -> ShardedCollection:
+        """Open an existing sharded collection (raises ValueError if it does not exist)."""
+        return self._open("get_collection", name, embedding_function)
+
+    def get_or_create_collection(self, name: str, embedding_function=None,
+                                 metadata: Optional[Dict[str, Any]] = None) -> ShardedCollection:
+        """Open a sharded collection, creating any missing shards."""
+        return self._open("get_or_create_collection", name, embedding_function, metadata=metadata)
+
+    def create_collection(self, name: str, embedding_function=None,
+                          metadata: Optional[Dict[str, Any]] = None) -> ShardedCollection:
+        """Create a new sharded collection."""
+        return self._open("create_collection", name, embedding_function, metadata=metadata)
+
+    def list_collections(self) -> List[ShardedCollection]:
+        """List the sharded collections in the store."""
+        names = [collection.name for collection in self.clients[0].list_collections()]
+        if self.layout == "collections":
+            suffix = "-s00"
+            names = [name[:-len(suffix)] for name in names if name.endswith(suffix)]
+        return [self.get_collection(name) for name in names]
+
+    def delete_collection(self, name: str) -> None:
+        """Delete every shard of a collection (raises ValueError if none existed)."""
+        missing = 0
+        for client, shard_name in zip(self.clients, self._shard_names(name)):
+            try:
+                client.delete_collection(shard_name)
+            except ValueError:
+                missing += 1
+        if missing == self.num_shards:
+            raise ValueError(f"Collection {name} does not exist.")
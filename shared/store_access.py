@@ -0,0 +1,481 @@
+"""
+Coordinated Multi-Process Store Access
+
+A ChromaDB persist directory must not be written by two processes at once, and
+readers that open it while an ingest is writing compete with the writer for
+SQLite locks. This module splits access into two roles:
+
+- One writer owns the persist directory. It holds an exclusive lock file
+  (``<directory>.writer.lock``) for as long as it runs, so a second writer fails
+  fast instead of corrupting the store. After writes it publishes a snapshot.
+- Readers never open the persist directory. They query the latest published
+  snapshot, and move to a newer one between queries when one appears.
+
+A snapshot is a consistent copy of the store under ``<directory>_snapshots/<generation>``.
+SQLite files are copied with SQLite's online backup API. Index and metadata files
+are copied and re-checked until they did not change during the copy. Text
+side-store files never change once written, so they are hard-linked. The
+``CURRENT`` file names the latest generation and is replaced atomically.
+
+A publish copies the whole store, so its cost grows with the store and not
+with the size of the write. Publishing after every write makes a series of
+one-document ingests quadratic. The writer therefore publishes at most once per
+``min_interval`` seconds: a write made sooner after the last publish is
+published when the interval ends, together with all writes made until then, and
+``flush`` publishes what is still pending (e.g. at exit). Readers see a write
+at most ``min_interval`` seconds (plus the copy time) late.
+
+Readers hold a shared lock on the snapshot they use. The writer deletes old
+snapshots only when it can take that lock exclusively, so a snapshot is never
+removed under a reader. On Windows, where only exclusive locks are available,
+the newest snapshots are kept and older ones are removed once no process has
+them open.
+"""
+
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+# Environment variable selecting how a process opens the store
+ACCESS_MODE_ENV = "CHROMA_ACCESS_MODE"
+ACCESS_MODES = ("direct", "writer", "reader")
+
+# Environment variable with the minimum seconds between two snapshot publishes
+# of a writer; writes made in between are published together
+SNAPSHOT_INTERVAL_ENV = "CHROMA_SNAPSHOT_INTERVAL"
+DEFAULT_SNAPSHOT_INTERVAL = 10.0
+
+CURRENT_FILE = "CURRENT"
+READER_LOCK_FILE = ".readers.lock"
+
+_SQLITE_SUFFIX = ".sqlite3"
+_SQLITE_SIDE_FILES = ("-wal", "-shm", "-journal")
+_LINKED_SUFFIX = ".blocks"
+_COPY_ATTEMPTS = 5
+
+
+class StoreLockedError(RuntimeError):
+    """Raised when another process already holds the writer lock."""
+
+
+def _lock_file(f, exclusive: bool = True, blocking: bool = True) -> bool:
+    """Lock an open file; returns False if a non-blocking lock is unavailable."""
+    if os.name == "nt":
+        if not exclusive:
+            # Windows has no shared locks; open files are protected from deletion
+            return True
+        f.seek(0)
+        try:
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            return False
+
+    flags = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+    try:
+        fcntl.flock(f.fileno(), flags if blocking else flags | fcntl.LOCK_NB)
+        return True
+    except BlockingIOError:
+        return False
+
+
+def _unlock_file(f) -> None:
+    if os.name == "nt":
+        f.seek(0)
+        try:
+            msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        except OSError:
+            pass
+    else:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def snapshot_root(persist_directory: str) -> str:
+    """
+    Get the directory snapshots of a persist directory are published to.
+
+    Args:
+        persist_directory: ChromaDB persist directory
+
+    Returns:
+        Path of the sibling '<directory>_snapshots' directory
+    """
+    return os.path.abspath(persist_directory).rstrip(os.sep) + "_snapshots"
+
+
+class WriterLock:
+    """
+    Exclusive, process-wide lock on a persist directory.
+    """
+
+    def __init__(self, persist_directory: str, timeout: float = 0.0):
+        """
+        Initialize the lock (not yet acquired).
+
+        Args:
+            persist_directory: ChromaDB persist directory
+            timeout: Seconds to wait for another writer to finish
+        """
+        self.path = os.path.abspath(persist_directory).rstrip(os.sep) + ".writer.lock"
+        self.timeout = timeout
+        self._file = None
+
+    def acquire(self) -> None:
+        """Take the lock, raising StoreLockedError if another process holds it."""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        f = open(self.path, 'a+')
+        deadline = time.monotonic() + self.timeout
+        while not _lock_file(f, blocking=False):
+            if time.monotonic() >= deadline:
+                f.seek(0)
+                holder = f.read().strip() or "unknown"
+                f.close()
+                raise StoreLockedError(f"Store is locked by another writer (pid {holder}): {self.path}")
+            time.sleep(0.1)
+
+        f.seek(0)
+        f.truncate()
+        f.write(str(os.getpid()))
+        f.flush()
+        self._file = f
+
+    def release(self) -> None:
+        """Release the lock."""
+        if self._file is not None:
+            _unlock_file(self._file)
+            self._file.close()
+            self._file = None
+
+    def __enter__(self) -> "WriterLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.release()
+
+
+def _backup_sqlite(source: str, target: str) -> None:
+    """Copy a SQLite database consistently, even while it is being written."""
+    source_db = sqlite3.connect(source)
+    target_db = sqlite3.connect(target)
+    try:
+        source_db.backup(target_db)
+    finally:
+        target_db.close()
+        source_db.close()
+
+
+def _copy_stable(source: str, target: str) -> None:
+    """Copy a file, retrying until it did not change during the copy."""
+    for _ in range(_COPY_ATTEMPTS):
+        before = os.stat(source)
+        shutil.copy2(source, target)
+        after = os.stat(source)
+        if (before.st_size, before.st_mtime_ns) == (after.st_size, after.st_mtime_ns):
+            return
+        time.sleep(0.05)
+    raise RuntimeError(f"File kept changing while it was copied: {source}")
+
+
+def copy_store(source: str, target: str) -> None:
+    """
+    Copy a persist directory into a consistent snapshot.
+
+    Index files are copied before the SQLite databases, so a snapshot's index is
+    never newer than its database; ChromaDB replays the missing tail of the index
+    from the database's embeddings queue when the snapshot is opened.
+
+    Args:
+        source: Persist directory
+        target: New snapshot directory
+    """
+    databases = []
+    for directory, _, files in os.walk(source):
+        target_directory = os.path.join(target, os.path.relpath(directory, source))
+        os.makedirs(target_directory, exist_ok=True)
+        for name in files:
+            source_path = os.path.join(directory, name)
+            target_path = os.path.join(target_directory, name)
+            if name.endswith(_SQLITE_SUFFIX):
+                databases.append((source_path, target_path))
+            elif name.endswith(_SQLITE_SIDE_FILES) or name.endswith(".tmp"):
+                continue
+            elif not os.path.exists(source_path):
+                # Removed since the directory was listed (e.g. a dropped collection)
+                continue
+            elif name.endswith(_LINKED_SUFFIX):
+                try:
+                    os.link(source_path, target_path)
+                except OSError:
+                    shutil.copy2(source_path, target_path)
+            else:
+                try:
+                    _copy_stable(source_path, target_path)
+                except FileNotFoundError:
+                    continue
+
+    for source_path, target_path in databases:
+        _backup_sqlite(source_path, target_path)
+
+
+class SnapshotPublisher:
+    """
+    Publishes consistent snapshots of a persist directory for readers (writer side).
+    """
+
+    def __init__(self, persist_directory: str, keep: int = 2, min_interval: float = 0.0):
+        """
+        Initialize the publisher.
+
+        Args:
+            persist_directory: ChromaDB persist directory owned by this process
+            keep: Number of newest snapshots always kept
+            min_interval: Minimum number of seconds between publishes requested
+                with request (0: publish on every request)
+        """
+        self.persist_directory = os.path.abspath(persist_directory)
+        self.root = snapshot_root(persist_directory)
+        self.keep = max(1, keep)
+        self.min_interval = min_interval
+        self.published = 0
+        self._lock = threading.RLock()
+        self._pending = False
+        self._timer: Optional[threading.Timer] = None
+        self._last_publish = float("-inf")
+
+    def current(self) -> Optional[str]:
+        """
+        Get the latest published snapshot.
+
+        Returns:
+            Snapshot directory, or None if nothing was published yet
+        """
+        return current_snapshot(self.root)
+
+    def request(self) -> Optional[str]:
+        """
+        Ask for the latest writes to be published.
+
+        Publishes at once if the last publish is at least min_interval seconds
+        old; otherwise publishes when the interval ends, covering every write
+        requested until then.
+
+        Returns:
+            Directory of the new snapshot, or None if the publish was deferred
+        """
+        with self._lock:
+            delay = self._last_publish + self.min_interval - time.monotonic()
+            if delay <= 0:
+                return self.publish()
+            self._pending = True
+            if self._timer is None:
+                self._timer = threading.Timer(delay, self._publish_pending)
+                self._timer.daemon = True
+                self._timer.start()
+            return None
+
+    def _publish_pending(self) -> None:
+        with self._lock:
+            self._timer = None
+            if self._pending:
+                self.publish()
+
+    def flush(self) -> Optional[str]:
+        """
+        Publish deferred writes now.
+
+        Returns:
+            Directory of the new snapshot, or None if nothing was pending
+        """
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            return self.publish() if self._pending else None
+
+    def publish(self) -> str:
+        """
+        Copy the persist directory to a new snapshot and make it current.
+
+        Returns:
+            Directory of the new snapshot
+        """
+        with self._lock:
+            self._pending = False
+            os.makedirs(self.root, exist_ok=True)
+            generation = f"{time.time_ns():020d}"
+            tmp_path = os.path.join(self.root, f".tmp-{generation}")
+            path = os.path.join(self.root, generation)
+
+            copy_store(self.persist_directory, tmp_path)
+            with open(os.path.join(tmp_path, READER_LOCK_FILE), 'w'):
+                pass
+            os.rename(tmp_path, path)
+
+            current_tmp = os.path.join(self.root, f"{CURRENT_FILE}.{os.getpid()}.tmp")
+            with open(current_tmp, 'w', encoding='utf-8') as f:
+                f.write(generation)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(current_tmp, os.path.join(self.root, CURRENT_FILE))
+
+            self.prune()
+            self.published += 1
+            self._last_publish = time.monotonic()
+            return path
+
+    def prune(self) -> int:
+        """
+        Delete old snapshots that no reader is using.
+
+        Returns:
+            Number of snapshots deleted
+        """
+        generations = sorted(name for name in os.listdir(self.root)
+                             if name.isdigit() and os.path.isdir(os.path.join(self.root, name)))
+        current = os.path.basename(self.current() or "")
+        deleted = 0
+        for generation in generations[:-self.keep]:
+            if generation == current:
+                continue
+            path = os.path.join(self.root, generation)
+            lock = open(os.path.join(path, READER_LOCK_FILE), 'a')
+            try:
+                if not _lock_file(lock, blocking=False):
+                    continue
+                if os.name == "nt":
+                    # Open files cannot be deleted on Windows
+                    lock.close()
+                shutil.rmtree(path)
+                deleted += 1
+            except OSError:
+                # Still open somewhere (Windows); try again after the next publish
+                continue
+            finally:
+                lock.close()
+
+        # Left behind by a publish that crashed (publishes never overlap)
+        for name in os.listdir(self.root):
+            if name.startswith(".tmp-"):
+                shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+        return deleted
+
+
+def current_snapshot(root: str) -> Optional[str]:
+    """
+    Read which snapshot is current.
+
+    Args:
+        root: Snapshot directory of a store
+
+    Returns:
+        Directory of the current snapshot, or None
+    """
+    try:
+        with open(os.path.join(root, CURRENT_FILE), 'r', encoding='utf-8') as f:
+            generation = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return os.path.join(root, generation) if generation else None
+
+
+class SnapshotReader:
+    """
+    Tracks the current snapshot of a store and keeps it locked while in use (reader side).
+    """
+
+    def __init__(self, persist_directory: str):
+        """
+        Open the current snapshot.
+
+        Args:
+            persist_directory: ChromaDB persist directory the snapshots were taken of
+        """
+        self.root = snapshot_root(persist_directory)
+        self.path: Optional[str] = None
+        self._lock_file = None
+        if not self.refresh():
+            raise FileNotFoundError(f"No snapshot has been published in {self.root}; "
+                                    f"start a writer (CHROMA_ACCESS_MODE=writer) first")
+
+    def refresh(self) -> bool:
+        """
+        Move to the latest snapshot if a newer one was published.
+
+        Returns:
+            True if the reader moved to a different snapshot
+        """
+        for _ in range(_COPY_ATTEMPTS):
+            path = current_snapshot(self.root)
+            if path is None or path == self.path:
+                return False
+            try:
+                lock = open(os.path.join(path, READER_LOCK_FILE), 'r')
+            except FileNotFoundError:
+                continue
+            _lock_file(lock, exclusive=False)
+            if not os.path.exists(os.path.join(path, READER_LOCK_FILE)):
+                # Deleted between reading CURRENT and locking it
+                lock.close()
+                continue
+
+            previous, self.path = self._lock_file, path
+            self._lock_file = lock
+            if previous is not None:
+                _unlock_file(previous)
+                previous.close()
+            return True
+        return False
+
+    def close(self) -> None:
+        """Release the current snapshot."""
+        if self._lock_file is not None:
+            _unlock_file(self._lock_file)
+            self._lock_file.close()
+            self._lock_file = None
+
+
+def release_chroma_clients(directory: str) -> None:
+    """
+    Stop the ChromaDB clients this process opened on a directory or below it.
+
+    ChromaDB caches one client system per persist directory for the life of the
+    process; readers call this for snapshots they no longer query.
+
+    Args:
+        directory: Snapshot directory that is no longer used
+    """
+    try:
+        from chromadb.api.client import SharedSystemClient
+    except ImportError:
+        return
+
+    systems = getattr(SharedSystemClient, "_identifer_to_system", {})
+    prefix = os.path.abspath(directory)
+    for identifier in list(systems):
+        path = os.path.abspath(identifier)
+        if path == prefix or path.startswith(prefix + os.sep):
+            try:
+                systems.pop(identifier).stop()
+            except Exception:
+                pass
+
+
+def require_writable(access_mode: str) -> None:
+    """
+    Refuse to write through a read-only (reader) store.
+
+    Args:
+        access_mode: Access mode of the current process
+    """
+    if access_mode == "reader":
+        raise RuntimeError(f"This process reads published snapshots ({ACCESS_MODE_ENV}=reader) "
+                           f"and cannot write; run the write in the writer process")
@@ -0,0 +1,372 @@
+"""
+Compressed Document-Text Side Store
+
+Chroma keeps a full copy of every chunk's text in its SQLite store, and with
+overlapping chunks most of that text is stored two or more times. With the side
+store enabled, Chroma keeps only ids, embeddings and metadata; the source text of
+each document is written once, compressed, to a block-indexed file, and every
+chunk records where its text lies in it:
+
+    text_doc    id of the side file (SHA-256 prefix of the source text)
+    text_start  byte offset of the chunk in the UTF-8 source text
+    text_end    byte offset just past the chunk
+
+Side file layout (``<text_doc>.blocks``):
+
+    magic (8 bytes) | block size (uint32) | block count (uint32) | text bytes (uint64)
+    | compressed block offsets ((count + 1) x uint64) | zlib-compressed blocks
+
+At retrieval time only the blocks a chunk spans are decompressed; recently used
+blocks are kept in a small LRU cache, since neighbouring chunks share blocks.
+
+A chunk that does not occur verbatim in the source text (text splitters may
+normalize whitespace) is stored as a side file of its own, so every chunk is
+located the same way.
+
+Side files are shared by every chunk (and collection) cut from the same text,
+so they are not deleted with the chunks. The owner of the store removes the
+files no chunk refers to any more with remove(); put() refreshes the
+modification time of a file it reuses, so a file that is about to be referenced
+again can be protected with remove's min_age.
+"""
+
+import hashlib
+import mmap
+import os
+import shutil
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Metadata keys locating a chunk's text in the side store
+DOC_KEY = "text_doc"
+START_KEY = "text_start"
+END_KEY = "text_end"
+
+DEFAULT_BLOCK_SIZE = 64 * 1024
+DEFAULT_CACHE_BLOCKS = 64
+
+_MAGIC = b"TXTBLK01"
+_HEADER_FORMAT = "<IIQ"
+_HEADER_SIZE = len(_MAGIC) + struct.calcsize(_HEADER_FORMAT)
+_OFFSET_SIZE = struct.calcsize("<Q")
+
+
+class _SideFile:
+    """Memory-mapped side file with its decoded block index."""
+
+    def __init__(self, path: str):
+        self._file = open(path, 'rb')
+        self.map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(_MAGIC)] != _MAGIC:
+            self.close()
+            raise ValueError(f"Not a text side-store file: {path}")
+        self.block_size, self.num_blocks, self.length = struct.unpack_from(
+            _HEADER_FORMAT, self.map, len(_MAGIC))
+        self.offsets = struct.unpack_from(f"<{self.num_blocks + 1}Q", self.map, _HEADER_SIZE)
+        self.data_start = _HEADER_SIZE + (self.num_blocks + 1) * _OFFSET_SIZE
+
+    def compressed_block(self, index: int) -> bytes:
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return self.map[self.data_start + start:self.data_start + end]
+
+    def close(self) -> None:
+        self.map.close()
+        self._file.close()
+
+
+def locate_chunks(text: str, chunks: List[str]) -> List[Optional[Tuple[int, int]]]:
+    """
+    Find the UTF-8 byte span of each chunk in the source text.
+
+    Chunks are searched for in order, starting from the previous chunk's start
+    (overlapping chunks begin before the previous one ends).
+
+    Args:
+        text: Source text
+        chunks: Chunks cut from the source text
+
+    Returns:
+        (start, end) byte offsets of each chunk, or None for a chunk that does
+        not occur verbatim in the source text
+    """
+    spans = []
+    char_pos, byte_pos = 0, 0
+    search_from = 0
+    for chunk in chunks:
+        start = text.find(chunk, search_from)
+        if start < 0:
+            start = text.find(chunk)
+        if start < 0:
+            spans.append(None)
+            continue
+
+        # Convert the character offset to a byte offset incrementally
+        if start < char_pos:
+            char_pos, byte_pos = 0, 0
+        byte_pos += len(text[char_pos:start].encode("utf-8"))
+        char_pos = start
+
+        spans.append((byte_pos, byte_pos + len(chunk.encode("utf-8"))))
+        search_from = start
+    return spans
+
+
+class TextSideStore:
+    """
+    Directory of compressed, block-indexed source texts with a decompressed-block cache.
+    """
+
+    def __init__(self, directory: str, block_size: int = DEFAULT_BLOCK_SIZE,
+                 cache_blocks: int = DEFAULT_CACHE_BLOCKS, compression_level: int = 6):
+        """
+        Initialize the side store.
+
+        Args:
+            directory: Directory holding the side files
+            block_size: Uncompressed bytes per block (for new files)
+            cache_blocks: Number of decompressed blocks kept in memory
+            compression_level: zlib compression level (for new files)
+        """
+        self.directory = directory
+        self.block_size = block_size
+        self.cache_blocks = cache_blocks
+        self.compression_level = compression_level
+        self._files: Dict[str, _SideFile] = {}
+        self._cache: "OrderedDict[Tuple[str, int], bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def _path(self, doc_id: str) -> str:
+        return os.path.join(self.directory, f"{doc_id}.blocks")
+
+    def put(self, text: str) -> str:
+        """
+        Store a source text (once; identical texts share one file).
+
+        Args:
+            text: Source text
+
+        Returns:
+            Document id of the stored text
+        """
+        data = text.encode("utf-8")
+        doc_id = hashlib.sha256(data).hexdigest()[:32]
+        path = self._path(doc_id)
+        if os.path.exists(path):
+            # Mark the file as in use again (see remove's min_age)
+            try:
+                os.utime(path)
+                return doc_id
+            except FileNotFoundError:
+                pass
+
+        blocks = [zlib.compress(data[i:i + self.block_size], self.compression_level)
+                  for i in range(0, len(data), self.block_size)]
+        offsets = [0]
+        for block in blocks:
+            offsets.append(offsets[-1] + len(block))
+
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(_MAGIC)
+            f.write(struct.pack(_HEADER_FORMAT, self.block_size, len(blocks), len(data)))
+            f.write(struct.pack(f"<{len(offsets)}Q", *offsets))
+            for block in blocks:
+                f.write(block)
+        os.replace(tmp_path, path)
+        return doc_id
+
+    def put_chunks(self, text: str, chunks: List[str]) -> List[Dict[str, Any]]:
+        """
+        Store a source text and build the metadata locating each of its chunks.
+
+        A chunk that does not occur verbatim in the text is stored as a side
+        file of its own.
+
+        Args:
+            text: Source text
+            chunks: Chunks cut from the source text
+
+        Returns:
+            One metadata dictionary (text_doc, text_start, text_end) per chunk
+        """
+        doc_id = self.put(text)
+        locations = []
+        for chunk, span in zip(chunks, locate_chunks(text, chunks)):
+            if span is None:
+                locations.append({DOC_KEY: self.put(chunk), START_KEY: 0,
+                                  END_KEY: len(chunk.encode("utf-8"))})
+            else:
+                locations.append({DOC_KEY: doc_id, START_KEY: span[0], END_KEY: span[1]})
+        return locations
+
+    def put_documents(self, documents: List[str], separator: str = "\n\n") -> List[Dict[str, Any]]:
+        """
+        Store independent documents together as one source text.
+
+        Args:
+            documents: Document texts
+            separator: Text placed between documents in the source text
+
+        Returns:
+            One metadata dictionary (text_doc, text_start, text_end) per document
+        """
+        spans = []
+        position = 0
+        separator_size = len(separator.encode("utf-8"))
+        for document in documents:
+            size = len(document.encode("utf-8"))
+            spans.append((position, position + size))
+            position += size + separator_size
+
+        doc_id = self.put(separator.join(documents))
+        return [{DOC_KEY: doc_id, START_KEY: start, END_KEY: end} for start, end in spans]
+
+    def _open(self, doc_id: str) -> _SideFile:
+        side_file = self._files.get(doc_id)
+        if side_file is None:
+            side_file = _SideFile(self._path(doc_id))
+            self._files[doc_id] = side_file
+        return side_file
+
+    def _block(self, doc_id: str, side_file: _SideFile, index: int) -> bytes:
+        key = (doc_id, index)
+        block = self._cache.get(key)
+        if block is not None:
+            self._cache.move_to_end(key)
+            self.cache_hits += 1
+            return block
+
+        self.cache_misses += 1
+        block = zlib.decompress(side_file.compressed_block(index))
+        self._cache[key] = block
+        if len(self._cache) > self.cache_blocks:
+            self._cache.popitem(last=False)
+        return block
+
+    def get(self, doc_id: str, start: int, end: int) -> str:
+        """
+        Rebuild the text between two byte offsets of a stored document.
+
+        Args:
+            doc_id: Document id
+            start: Start byte offset
+            end: End byte offset
+
+        Returns:
+            The text of the span
+        """
+        with self._lock:
+            side_file = self._open(doc_id)
+            if not 0 <= start <= end <= side_file.length:
+                raise IndexError(f"Span {start}:{end} out of range for document {doc_id}")
+
+            if start == end:
+                return ""
+
+            first, last = start // side_file.block_size, (end - 1) // side_file.block_size
+            data = b"".join(self._block(doc_id, side_file, index)
+                            for index in range(first, last + 1))
+
+        offset = first * side_file.block_size
+        return data[start - offset:end - offset].decode("utf-8")
+
+    def resolve(self, documents: Optional[List[Optional[str]]],
+                metadatas: Optional[List[Optional[Dict[str, Any]]]]) -> List[Optional[str]]:
+        """
+        Fill in the text of results whose documents are kept in the side store.
+
+        Args:
+            documents: Documents returned by Chroma (None where not stored)
+            metadatas: Matching metadata
+
+        Returns:
+            Documents with the missing texts rebuilt from the side store
+        """
+        metadatas = metadatas or []
+        documents = list(documents) if documents is not None else [None] * len(metadatas)
+        for i, metadata in enumerate(metadatas):
+            if documents[i] is None and metadata and DOC_KEY in metadata:
+                documents[i] = self.get(metadata[DOC_KEY], metadata[START_KEY], metadata[END_KEY])
+        return documents
+
+    def doc_ids(self) -> List[str]:
+        """
+        List the stored documents.
+
+        Returns:
+            Ids of the documents with a side file
+        """
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name[:-len(".blocks")] for name in os.listdir(self.directory)
+                      if name.endswith(".blocks"))
+
+    def remove(self, doc_ids: Iterable[str], min_age: float = 0.0) -> List[str]:
+        """
+        Delete the side files of documents no chunk refers to any more.
+
+        Args:
+            doc_ids: Ids of the documents to delete
+            min_age: Keep files written or reused by put() less than this many
+                seconds ago (they may be referenced by a write still in progress)
+
+        Returns:
+            Ids of the deleted documents
+        """
+        removed = []
+        now = time.time()
+        with self._lock:
+            for doc_id in sorted(set(doc_ids)):
+                path = self._path(doc_id)
+                try:
+                    if now - os.stat(path).st_mtime < min_age:
+                        continue
+                except FileNotFoundError:
+                    continue
+
+                side_file = self._files.pop(doc_id, None)
+                if side_file is not None:
+                    side_file.close()
+                for key in [key for key in self._cache if key[0] == doc_id]:
+                    del self._cache[key]
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+                removed.append(doc_id)
+        return removed
+
+    def copy_documents(self, doc_ids, target_directory: str) -> List[str]:
+        """
+        Copy stored documents to another side-store directory.
+
+        Args:
+            doc_ids: Ids of the documents to copy
+            target_directory: Side-store directory to copy them into
+
+        Returns:
+            Ids of the copied documents
+        """
+        os.makedirs(target_directory, exist_ok=True)
+        copied = []
+        for doc_id in sorted(set(doc_ids)):
+            target = os.path.join(target_directory, f"{doc_id}.blocks")
+            if not os.path.exists(target):
+                shutil.copyfile(self._path(doc_id), target)
+            copied.append(doc_id)
+        return copied
+
+    def close(self) -> None:
+        """Close all open side files and drop the block cache."""
+        with self._lock:
+            for side_file in self._files.values():
+                side_file.close()
+            self._files = {}
+            self._cache.clear()
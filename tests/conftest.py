@@ -0,0 +1,99 @@
+"""
+Shared test setup: puts the shared modules and the May 14 application on the
+import path, the same way the entry scripts do, and provides an offline
+pdf_rag_chat for behavioural tests.
+"""
+
+import hashlib
+import importlib
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+for directory in (os.path.join(ROOT, "shared"), os.path.join(ROOT, "May 14")):
+    if directory not in sys.path:
+        sys.path.insert(0, directory)
+
+# The ChromaDB manager of the May 12 folder and the agent tooling of the May 16 folder
+for directory in (os.path.join(ROOT, "May 12"), os.path.join(ROOT, "may 16")):
+    if directory not in sys.path:
+        sys.path.append(directory)
+
+
+class HashingEmbeddingFunction:
+    """Deterministic bag-of-words embedder, so tests need no model download."""
+
+    dimension = 16
+
+    def __call__(self, input):
+        embeddings = []
+        for text in input:
+            vector = [0.0] * self.dimension
+            for word in text.lower().split():
+                vector[int(hashlib.md5(word.encode("utf-8")).hexdigest(), 16) % self.dimension] += 1.0
+            norm = sum(x * x for x in vector) ** 0.5 or 1.0
+            embeddings.append([x / norm for x in vector])
+        return embeddings
+
+
+@pytest.fixture(scope="session")
+def rag(tmp_path_factory):
+    """
+    Import pdf_rag_chat with the local generation backend and a store in a
+    temporary directory.
+    """
+    from chromadb.utils import embedding_functions
+
+    patch = pytest.MonkeyPatch()
+    patch.chdir(tmp_path_factory.mktemp("rag"))
+    patch.setenv("GENERATION_BACKEND", "local")
+    patch.setenv("LOCAL_GENERATION_LATENCY_MS", "0")
+    patch.setenv("LOCAL_GENERATION_JITTER_MS", "0")
+    patch.setattr(embedding_functions, "DefaultEmbeddingFunction", HashingEmbeddingFunction)
+    try:
+        yield importlib.import_module("pdf_rag_chat")
+    finally:
+        patch.undo()
+
+
+@pytest.fixture
+def add_collection(rag):
+    """Create a live collection holding some texts, and drop it afterwards."""
+    names = []
+
+    def add(name, texts, metadatas=None):
+        collection = rag.client.get_or_create_collection(name=name,
+                                                          embedding_function=rag.embedding_function)
+        collection.add(ids=[f"{name}-{i}" for i in range(len(texts))], documents=list(texts),
+                       metadatas=metadatas or [{"source": f"{name}.pdf", "chunk": i}
+                                               for i in range(len(texts))])
+        names.append(name)
+        return collection
+
+    yield add
+    for name in names:
+        try:
+            rag.client.delete_collection(name)
+        except ValueError:
+            pass
+
+
+@pytest.fixture
+def make_pdf(tmp_path):
+    """Write a PDF with one page per given text."""
+    fitz = pytest.importorskip("fitz")
+
+    def make(name, pages):
+        path = tmp_path / name
+        doc = fitz.open()
+        for text in pages:
+            page = doc.new_page()
+            page.insert_textbox(fitz.Rect(40, 40, 560, 800), text, fontsize=9)
+        doc.save(str(path))
+        doc.close()
+        return str(path)
+
+    return make
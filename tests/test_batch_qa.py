@@ -0,0 +1,89 @@
+"""
+Tests for resumable batch question answering.
+"""
+
+import json
+
+import pytest
+
+import batch_qa
+from batch_qa import completed_ids, run_batch
+
+
+def _questions(count):
+    return [{"id": str(i), "query": f"question {i}"} for i in range(count)]
+
+
+def _records(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_failed_retrieval_is_recorded_as_error_and_retried(tmp_path):
+    output = str(tmp_path / "answers.jsonl")
+
+    def failing_retrieve(batch):
+        raise RuntimeError("store unavailable")
+
+    stats = run_batch(_questions(3), output, failing_retrieve, lambda query, context: "answer",
+                      requests_per_minute=6000, burst=10)
+    assert stats["error"] == 3 and stats["ok"] == 0
+    assert {record["status"] for record in _records(output)} == {"error"}
+    assert completed_ids(output) == set()
+
+    stats = run_batch(_questions(3), output, lambda batch: [["chunk"]] * len(batch),
+                      lambda query, context: f"answer to {query}",
+                      requests_per_minute=6000, burst=10)
+    assert stats["ok"] == 3 and stats["skipped"] == 0
+    assert completed_ids(output) == {"0", "1", "2"}
+
+
+def test_only_failing_batch_is_marked(tmp_path):
+    output = str(tmp_path / "answers.jsonl")
+
+    def retrieve(batch):
+        if "question 2" in batch:
+            raise RuntimeError("timeout")
+        return [["chunk"]] * len(batch)
+
+    stats = run_batch(_questions(4), output, retrieve, lambda query, context: "answer",
+                      batch_size=2, requests_per_minute=6000, burst=10)
+    assert (stats["ok"], stats["error"]) == (2, 2)
+    assert completed_ids(output) == {"0", "1"}
+
+
+def test_batch_retrieval_raises_when_asked(rag):
+    with pytest.raises(Exception):
+        rag.retrieve_relevant_chunks_batch(["anything"], "no_such_collection", raise_errors=True)
+    assert rag.retrieve_relevant_chunks_batch(["anything"], "no_such_collection") == [[]]
+
+
+def test_direct_answers_do_not_use_the_rate_limit(tmp_path, monkeypatch):
+    output = str(tmp_path / "answers.jsonl")
+    acquired = []
+    monkeypatch.setattr(batch_qa.TokenBucket, "acquire", lambda self: acquired.append(1) or 0.0)
+
+    def retrieve(batch):
+        return [["chunk"] if query.endswith("0") else [] for query in batch]
+
+    def generate(query, context):
+        assert context, "the model was called for a question answered directly"
+        return "answer"
+
+    stats = run_batch(_questions(3), output, retrieve, generate,
+                      answer_directly=lambda query, context: None if context else "no information")
+    assert stats["ok"] == 3 and len(acquired) == 1
+    answers = {record["id"]: record for record in _records(output)}
+    assert answers["1"]["answer"] == "no information" and answers["1"]["attempts"] == 0
+
+
+def test_gated_batch_questions_skip_the_rate_limit(rag, add_collection, tmp_path, monkeypatch):
+    add_collection("batch_gate", ["Vector databases store embeddings."])
+    queries = tmp_path / "questions.txt"
+    queries.write_text("What is a vector database?\nWho won the match?\n", encoding="utf-8")
+    acquired = []
+    monkeypatch.setattr(batch_qa.TokenBucket, "acquire", lambda self: acquired.append(1) or 0.0)
+    monkeypatch.setattr(rag, "MAX_DISTANCE", -1.0)
+
+    stats = rag.answer_queries_file(str(queries), "batch_gate", str(tmp_path / "answers.jsonl"))
+    assert stats["ok"] == 2 and acquired == []
@@ -0,0 +1,42 @@
+"""
+Tests for ChromaDBManager's writer mode.
+"""
+
+import pytest
+
+from store_access import WriterLock
+
+
+def test_writes_are_published_once_per_interval(rag, tmp_path):
+    from chroma_db import ChromaDBManager
+
+    directory = str(tmp_path / "chroma_db")
+    manager = ChromaDBManager("docs", directory, access_mode="writer", snapshot_interval=60)
+    publisher = manager.snapshot_publisher
+    assert publisher.published == 1
+
+    for i in range(3):
+        manager.add_documents([f"document number {i}"], ids=[f"doc{i}"],
+                              metadatas=[{"source": "test", "chunk_id": i}])
+    assert publisher.published == 1
+
+    # Closing publishes the pending writes and releases the store
+    manager.close()
+    assert publisher.published == 2
+    with WriterLock(directory):
+        pass
+    manager.close()
+
+
+def test_failed_initialization_releases_the_lock(rag, tmp_path, monkeypatch):
+    from chroma_db import ChromaDBManager
+
+    def fail(self, directory):
+        raise RuntimeError("cannot open the store")
+
+    monkeypatch.setattr(ChromaDBManager, "_open_store", fail)
+    directory = str(tmp_path / "chroma_db")
+    with pytest.raises(RuntimeError):
+        ChromaDBManager("docs", directory, access_mode="writer")
+    with WriterLock(directory):
+        pass
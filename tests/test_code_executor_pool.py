@@ -0,0 +1,41 @@
+"""
+Tests for the warm code executor pool.
+"""
+
+import os
+
+import pytest
+
+from code_executor_pool import CodeExecutorPool
+
+
+@pytest.fixture(scope="module")
+def pool(tmp_path_factory):
+    base = tmp_path_factory.mktemp("tasks")
+    with CodeExecutorPool(size=1, timeout=30, base_work_dir=str(base)) as pool:
+        yield pool
+
+
+def test_temporary_work_dirs_are_removed(pool):
+    for _ in range(3):
+        result = pool.run(code="open('out.txt', 'w').write('x' * 1000)\nprint('done')")
+        assert result["exit_code"] == 0
+        assert result["stdout"].strip() == "done"
+        assert result["work_dir"] is None
+    assert os.listdir(pool.base_work_dir) == []
+
+
+def test_given_work_dir_is_kept(pool, tmp_path):
+    (tmp_path / "script.py").write_text("print(open('data.txt').read())")
+    (tmp_path / "data.txt").write_text("kept")
+    result = pool.run(filename="script.py", work_dir=str(tmp_path))
+    assert result["stdout"].strip() == "kept"
+    assert result["work_dir"] == str(tmp_path)
+    assert (tmp_path / "script.py").exists()
+
+
+def test_timeout_replaces_the_worker(pool):
+    result = pool.run(code="import time\ntime.sleep(10)", timeout=0.5)
+    assert result["timed_out"]
+    assert os.listdir(pool.base_work_dir) == []
+    assert pool.run(code="print(1)")["stdout"].strip() == "1"
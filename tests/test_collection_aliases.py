@@ -0,0 +1,74 @@
+"""
+Tests for swapping collection aliases.
+"""
+
+import json
+import multiprocessing
+import os
+
+from collection_aliases import AliasTable, promote_staging_collection
+from ingest_checkpoint import DEFAULT_CHECKPOINT_DIR
+
+
+class _Client:
+    def __init__(self):
+        self.deleted = []
+
+    def delete_collection(self, name):
+        self.deleted.append(name)
+
+
+def test_replaced_collection_is_dropped_on_the_next_swap(tmp_path):
+    aliases = AliasTable(str(tmp_path))
+    client = _Client()
+
+    promote_staging_collection(client, aliases, "docs", "docs-v1")
+    assert client.deleted == []
+
+    promote_staging_collection(client, aliases, "docs", "docs-v2")
+    # The legacy collection stored under the alias name, retired by the first swap
+    assert client.deleted == ["docs"]
+
+    promote_staging_collection(client, aliases, "docs", "docs-v3")
+    assert client.deleted == ["docs", "docs-v1"]
+    assert aliases.resolve("docs") == "docs-v3"
+
+
+def _swap_many(directory, alias):
+    aliases = AliasTable(directory)
+    for i in range(20):
+        aliases.swap(alias, f"{alias}-v{i}")
+
+
+def test_concurrent_processes_keep_each_others_swaps(tmp_path):
+    context = multiprocessing.get_context("fork")
+    names = [f"alias{i}" for i in range(4)]
+    processes = [context.Process(target=_swap_many, args=(str(tmp_path), name)) for name in names]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    assert AliasTable(str(tmp_path)).load() == {name: f"{name}-v19" for name in names}
+
+
+def test_builds_are_told_apart_from_user_collections_by_the_alias_table(rag, add_collection):
+    for name in ("manual-v2", "guide-v0", "guide-v1", "notes-v5"):
+        add_collection(name, [f"{name} text"])
+    rag.aliases.swap("guide", "guide-v1")
+    rag.aliases.retire("guide", ["guide-v0"])
+    os.makedirs(DEFAULT_CHECKPOINT_DIR, exist_ok=True)
+    checkpoint_path = os.path.join(DEFAULT_CHECKPOINT_DIR, "notes.json")
+    with open(checkpoint_path, 'w', encoding='utf-8') as f:
+        json.dump({"collection_name": "notes", "staging_collection": "notes-v5"}, f)
+    try:
+        names = rag.logical_collection_names()
+    finally:
+        os.remove(checkpoint_path)
+        rag.aliases.retire("guide", [])
+        rag.aliases.remove("guide")
+
+    # A user collection whose name merely looks like a build stays listed
+    assert "manual-v2" in names
+    assert "guide" in names
+    assert not {"guide-v0", "guide-v1", "notes-v5"} & set(names)
@@ -0,0 +1,101 @@
+"""
+Tests for the collection routing index and its incremental profile updates.
+"""
+
+import json
+import os
+
+import numpy as np
+import pytest
+
+from collection_router import CollectionRouter
+from conftest import HashingEmbeddingFunction
+
+EMBED = HashingEmbeddingFunction()
+
+
+def _chunks(texts):
+    return list(zip(texts, EMBED(texts)))
+
+
+FIRST = _chunks(["vector databases store embeddings", "hnsw graphs answer nearest neighbour queries"])
+SECOND = _chunks(["gemini generates answers from context", "prompts include retrieved chunks"])
+
+
+def _assert_same_profile(actual, expected):
+    assert actual["count"] == expected["count"]
+    assert np.allclose(actual["centroid"], expected["centroid"])
+    assert actual["keywords"] == pytest.approx(expected["keywords"])
+
+
+def test_added_chunks_match_a_full_build(tmp_path):
+    router = CollectionRouter(str(tmp_path))
+    incremental = router.update_profile(router.build_profile(FIRST, EMBED), SECOND, [], EMBED)
+    _assert_same_profile(incremental, router.build_profile(FIRST + SECOND, EMBED))
+
+
+def test_removed_chunks_match_a_full_build(tmp_path):
+    router = CollectionRouter(str(tmp_path))
+    both = router.build_profile(FIRST + SECOND, EMBED)
+    remaining = router.update_profile(both, [], SECOND, EMBED)
+    _assert_same_profile(remaining, router.build_profile(FIRST, EMBED))
+    assert "gemini" not in remaining["term_counts"]
+    assert router.update_profile(remaining, [], FIRST, EMBED) is None
+
+
+def test_apply_changes_stores_the_profile(tmp_path):
+    router = CollectionRouter(str(tmp_path))
+    router.apply_changes("docs", FIRST, [], EMBED)
+    router.apply_changes("docs", SECOND, [], EMBED)
+    reopened = CollectionRouter(str(tmp_path))
+    assert reopened.load()["docs"]["count"] == 4
+    assert reopened.route(EMBED(["gemini answers"])[0], "gemini answers")[0][0] == "docs"
+
+    reopened.apply_changes("docs", [], FIRST + SECOND, EMBED)
+    assert "docs" not in reopened.load()
+
+
+def test_running_sums_stay_out_of_the_routing_file(tmp_path):
+    router = CollectionRouter(str(tmp_path))
+    router.apply_changes("docs", FIRST + SECOND, [], EMBED)
+    with open(router.path, 'r', encoding='utf-8') as f:
+        stored = json.load(f)["docs"]
+    assert not {"embedding_sum", "term_counts", "opening"} & set(stored)
+    assert len(os.listdir(router.state_dir)) == 1
+
+    # The sums in the state file still allow incremental updates
+    remaining = router.apply_changes("docs", [], SECOND, EMBED)
+    _assert_same_profile(remaining, router.build_profile(FIRST, EMBED))
+    router.remove("docs")
+    assert os.listdir(router.state_dir) == []
+
+
+def test_profile_without_sums_needs_a_rebuild(tmp_path):
+    router = CollectionRouter(str(tmp_path))
+    legacy = router.build_profile(FIRST, EMBED)
+    del legacy["embedding_sum"], legacy["term_counts"]
+    router.update("docs", legacy)
+    with pytest.raises(ValueError):
+        router.apply_changes("docs", SECOND, [], EMBED)
+
+
+def test_document_updates_do_not_rescan_the_collection(rag, make_pdf, monkeypatch):
+    name = "route_incremental"
+    first = make_pdf("first.pdf", ["Vector databases store embeddings for similarity search. " * 30])
+    second = make_pdf("second.pdf", ["Gemini generates answers from the retrieved context. " * 30])
+    rag.upsert_document(first, name, use_cache=False)
+
+    def full_scan(*args, **kwargs):
+        raise AssertionError("the whole collection was read")
+
+    monkeypatch.setattr(rag.router, "build_profile", full_scan)
+    rag.upsert_document(second, name, use_cache=False)
+    rag.upsert_document(second, name, use_cache=False)
+    rag.delete_document(first, name)
+
+    profile = rag.router.load()[name]
+    collection = rag.client.get_collection(rag.aliases.resolve(name))
+    assert profile["count"] == collection.count()
+    assert "gemini" in profile["keywords"] and "vector" not in profile["keywords"]
+    rag.client.delete_collection(collection.name)
+    rag.router.remove(name)
@@ -0,0 +1,64 @@
+"""
+Tests for follow-up detection and the bounded conversation history.
+"""
+
+import pytest
+
+from conversation_memory import ConversationMemory
+
+
+@pytest.fixture
+def memory():
+    memory = ConversationMemory()
+    memory.add_turn("How does HNSW indexing work in ChromaDB?", "It builds a layered graph.")
+    return memory
+
+
+@pytest.mark.parametrize("query", [
+    "What about the second one?",
+    "and the memory cost?",
+    "How does it scale?",
+    "What are its limits?",
+    "It supports deletes?",
+    "They are stored on disk?",
+    "Tell me more",
+    "Why?",
+])
+def test_follow_ups(memory, query):
+    assert memory.is_follow_up(query)
+
+
+@pytest.mark.parametrize("query", [
+    "What is a vector database?",
+    "Explain BM25",
+    "Summarize the paper",
+    "Which embedding model does this project use?",
+    "How do I know if the index supports more than one metric?",
+    "Why does the ingestion fail for scanned PDFs?",
+])
+def test_standalone_questions(memory, query):
+    assert not memory.is_follow_up(query)
+
+
+def test_no_follow_up_without_history():
+    assert not ConversationMemory().is_follow_up("What about it?")
+
+
+def test_chained_follow_ups_keep_the_original_subject(memory):
+    first = memory.rewrite_query("What about its memory use?")
+    assert "HNSW" in first
+    memory.add_turn("What about its memory use?", "About 1.5x the vectors.", first)
+
+    second = memory.rewrite_query("And how does it compare to IVF?")
+    assert "HNSW" in second
+    assert "memory use" in second
+
+
+def test_history_stays_within_budget():
+    memory = ConversationMemory(max_history_tokens=100, max_summary_tokens=30)
+    for i in range(20):
+        memory.add_turn(f"question {i} " * 10, f"answer {i}. " * 20)
+    assert len(memory.turns) <= 2
+    assert len(memory.history_text()) <= 100 * 4
+    memory.reset()
+    assert memory.history_text() == "" and not memory.is_follow_up("and then?")
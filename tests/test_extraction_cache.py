@@ -0,0 +1,71 @@
+"""
+On-disk format tests for the PDF extraction cache.
+"""
+
+import struct
+
+import extraction_cache
+from extraction_cache import CachedPages, _read_partial, write_pages
+
+
+def test_pages_round_trip(tmp_path):
+    cache_path = str(tmp_path / "doc.pages")
+    pages = ["first page", "", "dritte Seite – ünïcode", "x" * 10000]
+    write_pages(cache_path, pages)
+
+    with CachedPages(cache_path) as cached:
+        assert len(cached) == len(pages)
+        assert [cached.page(i) for i in range(len(cached))] == pages
+
+
+def test_pages_file_layout(tmp_path):
+    cache_path = tmp_path / "doc.pages"
+    write_pages(str(cache_path), ["ab", "cde"])
+
+    data = cache_path.read_bytes()
+    assert data[:8] == b"PDFPAGE1"
+    assert struct.unpack_from("<I", data, 8) == (2,)
+    assert struct.unpack_from("<3Q", data, 12) == (0, 2, 5)
+    assert data[12 + 3 * 8:] == b"abcde"
+
+
+def test_rejects_foreign_file(tmp_path):
+    path = tmp_path / "doc.pages"
+    path.write_bytes(b"NOTPAGES" + b"\0" * 16)
+    try:
+        CachedPages(str(path))
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("expected ValueError")
+
+
+def test_partial_file_drops_torn_record(tmp_path):
+    partial_path = tmp_path / "doc.pages.partial"
+    records = b"".join(struct.pack("<I", len(text)) + text for text in (b"one", b"two"))
+    # A third record whose body was cut off by a crash
+    partial_path.write_bytes(records + struct.pack("<I", 100) + b"thr")
+
+    assert _read_partial(str(partial_path)) == ["one", "two"]
+    assert partial_path.read_bytes() == records
+
+
+def test_resumable_extraction_continues_after_last_page(tmp_path, monkeypatch):
+    pages = [f"page {i}" for i in range(7)]
+    calls = []
+
+    def fake_extract(pdf_path, backend="pypdf2", start_page=0):
+        calls.append(start_page)
+        return iter(pages[start_page:])
+
+    monkeypatch.setattr(extraction_cache, "extract_pages", fake_extract)
+    cache_path = str(tmp_path / "doc.pages")
+    partial = b"".join(struct.pack("<I", len(p)) + p.encode() for p in pages[:3])
+    (tmp_path / "doc.pages.partial").write_bytes(partial + b"\x05")
+
+    extraction_cache.extract_pages_resumable("doc.pdf", cache_path, sync_every=2)
+
+    assert calls == [3]
+    assert not (tmp_path / "doc.pages.partial").exists()
+    with CachedPages(cache_path) as cached:
+        assert [cached.page(i) for i in range(len(cached))] == pages
@@ -0,0 +1,73 @@
+"""
+On-disk format tests for collection snapshots.
+"""
+
+import json
+import sys
+
+import chromadb
+import pytest
+
+from index_snapshot import export_collection, load_snapshot_into, read_manifest
+
+
+def _collection(client, name):
+    return client.create_collection(name, embedding_function=None, metadata={"hnsw:space": "l2"})
+
+
+def test_export_and_load_round_trip(tmp_path):
+    client = chromadb.EphemeralClient()
+    source = _collection(client, "snapshot_source")
+    source.add(ids=["a", "b", "c"],
+               embeddings=[[1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0]],
+               documents=["first", "second ü", "third"],
+               metadatas=[{"page": 1}, {"page": 2, "source": "x.pdf"}, {"page": 3}])
+    source.add(ids=["d"], embeddings=[[0.5, 0.5, 0.0]])
+
+    path = tmp_path / "snapshot"
+    manifest = export_collection(source, str(path), batch_size=2, embedding_model="test")
+    assert manifest["count"] == 4
+    assert manifest["dimension"] == 3
+    assert (path / "embeddings.f32").stat().st_size == 4 * 3 * 4
+    assert read_manifest(str(path))["checksums"] == manifest["checksums"]
+
+    target = _collection(client, "snapshot_target")
+    assert load_snapshot_into(target, str(path), batch_size=3) == 4
+
+    expected = source.get(include=["embeddings", "documents", "metadatas"])
+    loaded = target.get(ids=expected["ids"], include=["embeddings", "documents", "metadatas"])
+    assert loaded["ids"] == expected["ids"]
+    assert loaded["documents"] == expected["documents"]
+    assert loaded["metadatas"] == expected["metadatas"]
+    assert loaded["embeddings"] == expected["embeddings"]
+
+
+def test_corrupted_snapshot_is_rejected(tmp_path):
+    client = chromadb.EphemeralClient()
+    source = _collection(client, "snapshot_corrupt")
+    source.add(ids=["a"], embeddings=[[1.0, 2.0]], documents=["text"])
+    path = tmp_path / "snapshot"
+    export_collection(source, str(path))
+
+    with open(path / "documents.data", 'r+b') as f:
+        f.write(b"T")
+    with pytest.raises(ValueError):
+        read_manifest(str(path))
+
+    manifest = json.loads((path / "manifest.json").read_text())
+    manifest["version"] = 99
+    (path / "manifest.json").write_text(json.dumps(manifest))
+    with pytest.raises(ValueError):
+        read_manifest(str(path), verify=False)
+
+
+def test_dump_to_stdout_writes_only_records(rag, add_collection, monkeypatch, capsys):
+    add_collection("dump_stdout", ["first chunk", "second chunk"])
+    monkeypatch.setattr(sys, "argv", ["pdf_rag_chat.py", "--collection_name", "dump_stdout",
+                                      "--dump-jsonl", "-"])
+    rag.main()
+
+    captured = capsys.readouterr()
+    records = [json.loads(line) for line in captured.out.splitlines()]
+    assert sorted(record["document"] for record in records) == ["first chunk", "second chunk"]
+    assert captured.err
@@ -0,0 +1,149 @@
+"""
+Tests for the persistent ingestion queue.
+"""
+
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import ingest_daemon
+from ingest_daemon import DELETE, UPSERT, IngestDaemon, IngestQueue
+
+
+def test_jobs_survive_reopen_and_running_jobs_are_recovered(tmp_path):
+    path = str(tmp_path / "queue.sqlite3")
+    queue = IngestQueue(path, retry_delay=0)
+    queue.enqueue("a.pdf", UPSERT, "1:1")
+    queue.enqueue("b.pdf", UPSERT, "2:2")
+    job = queue.claim()
+    assert job["path"] == "a.pdf"
+    queue.close()
+
+    # The daemon died while a.pdf was running
+    queue = IngestQueue(path, retry_delay=0)
+    assert queue.stats() == {"pending": 1, "running": 1}
+    assert queue.recover() == 1
+    assert [queue.claim()["path"], queue.claim()["path"]] == ["a.pdf", "b.pdf"]
+    assert queue.known_files() == {"a.pdf": "1:1", "b.pdf": "2:2"}
+    queue.close()
+
+
+def test_newer_change_replaces_pending_job(tmp_path):
+    queue = IngestQueue(str(tmp_path / "queue.sqlite3"))
+    queue.enqueue("a.pdf", UPSERT, "1:1")
+    queue.enqueue("a.pdf", DELETE)
+    job = queue.claim()
+    assert job["action"] == DELETE
+    assert queue.claim() is None
+    assert queue.known_files() == {}
+    queue.close()
+
+
+def test_same_file_is_not_claimed_twice(tmp_path):
+    queue = IngestQueue(str(tmp_path / "queue.sqlite3"))
+    queue.enqueue("a.pdf", UPSERT, "1:1")
+    first = queue.claim()
+    queue.enqueue("a.pdf", UPSERT, "2:2")
+    assert queue.claim() is None
+    queue.complete(first["id"])
+    assert queue.claim()["fingerprint"] == "2:2"
+    queue.close()
+
+
+def test_failed_jobs_are_retried_then_given_up(tmp_path):
+    queue = IngestQueue(str(tmp_path / "queue.sqlite3"), max_attempts=2, retry_delay=0)
+    queue.enqueue("a.pdf", UPSERT, "1:1")
+    job = queue.claim()
+    assert queue.fail(job["id"], "boom") is True
+    job = queue.claim()
+    assert job["attempts"] == 1
+    assert queue.fail(job["id"], "boom") is False
+    assert queue.claim() is None
+    assert queue.stats() == {"failed": 1}
+    queue.close()
+
+
+class _FakePipeline:
+    def __init__(self, error=None):
+        self.error = error
+        self.calls = []
+
+    def upsert_document(self, path, collection_name, compress_text=False):
+        if self.error:
+            raise self.error
+        self.calls.append(("upsert", os.path.basename(path)))
+
+    def delete_document(self, path, collection_name):
+        self.calls.append(("delete", os.path.basename(path)))
+
+
+def _daemon(tmp_path):
+    watched = tmp_path / "pdfs"
+    watched.mkdir(exist_ok=True)
+    (watched / "a.pdf").write_bytes(b"%PDF-1.4")
+    return IngestDaemon([str(watched)], "library", workers=1,
+                        queue_path=str(tmp_path / "queue.sqlite3"))
+
+
+def test_daemon_refuses_to_start_without_a_pipeline(tmp_path, monkeypatch):
+    def broken():
+        raise RuntimeError("Could not load the ingestion pipeline (exit status 1)")
+
+    monkeypatch.setattr(ingest_daemon, "load_pipeline", broken)
+    daemon = _daemon(tmp_path)
+    with pytest.raises(RuntimeError):
+        daemon.run(once=True)
+
+    queue = IngestQueue(str(tmp_path / "queue.sqlite3"))
+    assert queue.stats() == {}
+    queue.close()
+
+
+def test_job_failing_with_system_exit_is_failed_not_left_running(tmp_path):
+    daemon = _daemon(tmp_path)
+    daemon.pipeline = _FakePipeline(error=SystemExit(1))
+    daemon.queue.enqueue(str(tmp_path / "pdfs" / "a.pdf"), UPSERT, "1:1")
+    job = daemon.queue.claim()
+    daemon._in_flight = 1
+
+    daemon.process_job(job)
+
+    assert daemon._in_flight == 0
+    assert daemon.queue.stats() == {"pending": 1}
+    daemon.queue.close()
+
+
+def test_daemon_applies_changes_once(tmp_path, monkeypatch):
+    pipeline = _FakePipeline()
+    monkeypatch.setattr(ingest_daemon, "load_pipeline", lambda: pipeline)
+    _daemon(tmp_path).run(once=True)
+    assert pipeline.calls == [("upsert", "a.pdf")]
+
+    os.remove(tmp_path / "pdfs" / "a.pdf")
+    daemon = IngestDaemon([str(tmp_path / "pdfs")], "library", workers=1,
+                          queue_path=str(tmp_path / "queue.sqlite3"))
+    daemon.run(once=True)
+    assert pipeline.calls[-1] == ("delete", "a.pdf")
+
+
+def test_concurrent_jobs_are_all_counted(tmp_path):
+    daemon = _daemon(tmp_path)
+    daemon.pipeline = _FakePipeline()
+    for i in range(40):
+        daemon.queue.enqueue(str(tmp_path / "pdfs" / f"doc{i}.pdf"), DELETE, f"{i}:1")
+    jobs = [daemon.queue.claim() for _ in range(40)]
+    daemon._in_flight = len(jobs)
+
+    # Switch threads as often as possible to expose unsynchronized updates
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(daemon.process_job, jobs))
+    finally:
+        sys.setswitchinterval(interval)
+
+    assert (daemon.processed, daemon.failed, daemon._in_flight) == (40, 0, 0)
+    daemon.queue.close()
@@ -0,0 +1,45 @@
+"""
+Tests for the decoupled extract and chunk pipeline stages.
+"""
+
+import shutil
+
+from pipeline_stages import PAGE_SEPARATOR, run_chunk, run_extract
+from stage_files import PAGE_COLUMNS, PAGES, StageFile, StageWriter
+
+PAGE_TEXTS = ["Alpha page about vector search.", "Beta page about answer generation."]
+
+
+def test_copies_of_a_document_are_extracted_once(tmp_path, make_pdf):
+    pdf = make_pdf("a.pdf", PAGE_TEXTS)
+    copy = str(tmp_path / "copy_of_a.pdf")
+    shutil.copy(pdf, copy)
+    pages_path, chunks_path = str(tmp_path / "pages.stage"), str(tmp_path / "chunks.stage")
+
+    stats = run_extract([pdf, copy, pdf], pages_path)
+    assert (stats["documents"], stats["skipped"], stats["pages"]) == (1, 2, 2)
+    with StageFile(pages_path) as pages:
+        assert pages.column("page").tolist() == [0, 1]
+
+    assert run_chunk(pages_path, chunks_path)["chunks"] == 1
+    with StageFile(chunks_path) as chunks:
+        text = chunks.column("text")[0]
+    assert text.count("Alpha") == 1 and text.count("Beta") == 1
+    assert text.index("Alpha") < text.index("Beta")
+
+
+def test_chunking_uses_each_page_once(tmp_path):
+    pages_path, chunks_path = str(tmp_path / "pages.stage"), str(tmp_path / "chunks.stage")
+    rows = [(1, 1), (0, 0), (0, 0), (1, 1)]
+    with StageWriter(pages_path, PAGES, PAGE_COLUMNS, meta={"backend": "pypdf2"}) as writer:
+        writer.append({
+            "doc": ["doc"] * len(rows),
+            "source": ["doc.pdf"] * len(rows),
+            "page": [page for page, _ in rows],
+            "last": [last for _, last in rows],
+            "text": [PAGE_TEXTS[page] for page, _ in rows],
+        })
+
+    run_chunk(pages_path, chunks_path, deduplicate=False)
+    with StageFile(chunks_path) as chunks:
+        assert chunks.column("text") == [PAGE_SEPARATOR.join(PAGE_TEXTS)]
@@ -0,0 +1,60 @@
+"""
+Tests for the run profiler with stages running in several threads.
+"""
+
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from profiling import profile_session, profile_stage
+
+
+def _worker_hotspot(n):
+    return sum(i * i for i in range(n))
+
+
+def test_concurrent_stages(tmp_path):
+    report_dir = tmp_path / "report"
+    allocated = threading.Event()
+
+    def allocate():
+        with profile_stage("allocate"):
+            block = bytearray(20 * 1024 * 1024)
+            allocated.set()
+            time.sleep(0.1)
+            del block
+
+    def small(i):
+        allocated.wait()
+        with profile_stage("small"):
+            _worker_hotspot(20000)
+
+    with profile_session(str(report_dir), sample_interval=0.002):
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            futures = [executor.submit(allocate)] + [executor.submit(small, i) for i in range(6)]
+            for future in futures:
+                future.result()
+
+    stages = json.loads((report_dir / "stages.json").read_text())["stages"]
+    assert stages["small"]["calls"] == 6
+    # Other threads entering stages must not hide the allocating stage's peak
+    assert stages["allocate"]["peak_increase_bytes"] >= 19 * 1024 * 1024
+    # Worker threads are CPU-profiled too
+    assert "_worker_hotspot" in (report_dir / "profile.txt").read_text()
+    assert threading.getprofile() is None
+
+
+def test_nested_stage_labels(tmp_path):
+    with profile_session(str(tmp_path)) as profiler:
+        with profile_stage("outer"):
+            with profile_stage("inner"):
+                pass
+    assert set(profiler.stages) == {"outer", "outer/inner"}
+
+
+def test_no_session_is_a_no_op():
+    with profile_session(None) as profiler:
+        with profile_stage("anything"):
+            pass
+    assert profiler is None
@@ -0,0 +1,51 @@
+"""
+Tests for splitting complex questions and merging the sub-query results.
+"""
+
+from query_decomposition import heuristic_subqueries, merge_results
+
+
+def test_merge_is_round_robin_by_rank():
+    merged = merge_results([["a1", "a2", "a3"], ["b1"], ["c1", "c2"]], max_chunks=5)
+    assert merged == ["a1", "b1", "c1", "a2", "c2"]
+
+
+def test_duplicates_keep_their_smallest_distance():
+    results = [
+        [("shared", 0.9), ("only a", 1.0)],
+        [("only b", 0.2), ("shared", 0.3)],
+    ]
+    merged = merge_results(results, max_chunks=10, key=lambda hit: hit[0],
+                           score=lambda hit: hit[1])
+    assert merged == [("shared", 0.3), ("only b", 0.2), ("only a", 1.0)]
+
+
+def test_duplicates_beyond_the_limit_still_lower_the_distance():
+    results = [[("x", 0.8), ("y", 0.9)], [("z", 0.1), ("q", 0.2), ("x", 0.05)]]
+    merged = merge_results(results, max_chunks=2, key=lambda hit: hit[0],
+                           score=lambda hit: hit[1])
+    assert merged == [("x", 0.05), ("z", 0.1)]
+
+
+def test_later_clauses_carry_the_subject():
+    assert heuristic_subqueries("How is the cache configured, and what are its limits?") == \
+        ["How is the cache configured", "what are cache's limits?"]
+    assert heuristic_subqueries("What is HNSW? How is it tuned?") == \
+        ["What is HNSW?", "How is HNSW tuned?"]
+    assert heuristic_subqueries("How does chunk overlap affect retrieval and what are the defaults?") == \
+        ["How does chunk overlap affect retrieval", "what are the defaults of chunk overlap"]
+    # A clause with a subject of its own is left alone
+    assert heuristic_subqueries("How does HNSW work and what is IVF?") == \
+        ["How does HNSW work", "what is IVF"]
+
+
+def test_comparison_sides_keep_the_rest_of_the_question():
+    assert heuristic_subqueries("What is the difference between HNSW and IVF for small collections?") == \
+        ["HNSW for small collections", "IVF for small collections"]
+    assert heuristic_subqueries("Compare PyPDF2 with PyMuPDF") == ["PyPDF2", "PyMuPDF"]
+
+
+def test_dropped_clauses_are_reported(capsys):
+    question = "What is A; what is B; what is C; what is D; what is E?"
+    assert heuristic_subqueries(question, max_subqueries=3) == ["What is A", "what is B", "what is C"]
+    assert "what is D | what is E" in capsys.readouterr().out
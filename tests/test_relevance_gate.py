@@ -0,0 +1,21 @@
+"""
+Tests for the relevance gate's threshold calibration.
+"""
+
+import math
+
+import pytest
+
+from relevance_gate import calibrate_threshold, percentile
+
+
+def test_percentile_interpolates_between_ranks():
+    assert percentile([4.0, 1.0, 3.0, 2.0], 50) == 2.5
+    assert percentile([1.0, 2.0], 100) == 2.0
+    assert math.isnan(percentile([], 95))
+
+
+def test_calibration_adds_the_margin():
+    assert calibrate_threshold([0.5, 1.0], quantile=100, margin=0.1) == pytest.approx(1.1)
+    with pytest.raises(ValueError):
+        calibrate_threshold([])
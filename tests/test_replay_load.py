@@ -0,0 +1,40 @@
+"""
+Tests for recording and replaying query traffic.
+"""
+
+import pytest
+
+from query_log import read_query_log, record_query, start_recording, stop_recording
+from replay_load import replay
+
+
+def test_recorded_queries_read_back_in_order(tmp_path):
+    path = str(tmp_path / "queries.jsonl")
+    start_recording(path)
+    try:
+        record_query("first question", "report")
+        record_query("second question", "report")
+    finally:
+        stop_recording()
+
+    entries = read_query_log(path)
+    assert [entry["query"] for entry in entries] == ["first question", "second question"]
+    assert set(entries[0]) == {"ts", "collection", "query"}
+
+
+def test_retrieval_failures_count_as_errors():
+    entries = [{"ts": 0.0, "collection": "report", "query": f"q{i}"} for i in range(3)]
+
+    def retrieve(query, collection_name):
+        if query == "q1":
+            raise RuntimeError("collection is gone")
+        return [] if query == "q2" else ["context"]
+
+    report = replay(entries, retrieve, None, mode="qps", qps=1000, concurrency=1)
+    assert report["counts"] == {"sent": 3, "ok": 1, "errors": 1, "no_context": 1}
+
+
+def test_retrieval_can_raise_instead_of_returning_nothing(rag):
+    assert rag.retrieve_relevant_chunks("anything", "no_such_collection") == []
+    with pytest.raises(Exception):
+        rag.retrieve_relevant_chunks("anything", "no_such_collection", raise_errors=True)
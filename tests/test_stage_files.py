@@ -0,0 +1,107 @@
+"""
+On-disk format tests for the appendable stage files.
+"""
+
+import numpy as np
+import pytest
+
+from stage_files import (CHUNK_COLUMNS, CHUNKS, EMBEDDING_COLUMNS, EMBEDDINGS, StageFile,
+                         StageWriter, open_stage_file)
+
+
+def _chunk_rows(first, count):
+    rows = range(first, first + count)
+    return {
+        "doc": [f"doc{i // 5}" for i in rows],
+        "id": [f"chunk-{i}" for i in rows],
+        "start": [i * 10 for i in rows],
+        "end": [i * 10 + 5 for i in rows],
+        "text": [f"text of chunk {i} – ü" for i in rows],
+        "metadata": ['{"page": %d}' % i for i in rows],
+    }
+
+
+def _write_chunks(path, blocks, first=0, meta=None):
+    with StageWriter(str(path), CHUNKS, CHUNK_COLUMNS, meta or {"chunk_size": 100}) as writer:
+        for count in blocks:
+            writer.append(_chunk_rows(first, count))
+            first += count
+        return writer.num_rows
+
+
+def test_append_reopen_and_read_ranges(tmp_path):
+    path = tmp_path / "chunks.stage"
+    assert _write_chunks(path, [4, 3]) == 7
+    assert _write_chunks(path, [5], first=7) == 12
+
+    with StageFile(str(path)) as stage:
+        assert stage.kind == CHUNKS
+        assert len(stage) == 12
+        assert stage.meta == {"chunk_size": 100}
+        expected = _chunk_rows(0, 12)
+        assert stage.column("id") == expected["id"]
+        assert stage.column("metadata") == expected["metadata"]
+        # Ranges crossing block boundaries
+        assert stage.column("start", 2, 9).tolist() == expected["start"][2:9]
+        assert stage.column("text", 6, 8) == expected["text"][6:8]
+        assert [row["id"] for row in stage.rows(["id"], start=10, batch_size=1)] == \
+            ["chunk-10", "chunk-11"]
+
+
+def test_every_range_reads_the_right_blocks(tmp_path):
+    path = tmp_path / "chunks.stage"
+    _write_chunks(path, [1, 3, 2, 1, 4])
+    expected = _chunk_rows(0, 11)["id"]
+
+    with StageFile(str(path)) as stage:
+        for start in range(12):
+            for end in range(start, 13):
+                assert stage.column("id", start, end) == expected[start:end]
+
+
+def test_row_ranges_group_consecutive_rows():
+    from pipeline_stages import _row_ranges
+
+    assert _row_ranges([7, 2, 3, 4, 8, 10]) == [(2, 5), (7, 9), (10, 11)]
+    assert _row_ranges([]) == []
+
+
+def test_torn_tail_is_discarded_on_reopen(tmp_path):
+    path = tmp_path / "chunks.stage"
+    _write_chunks(path, [4, 4])
+    # A crash in the middle of the last block
+    with open(path, 'r+b') as f:
+        f.truncate(path.stat().st_size - 7)
+
+    with StageFile(str(path)) as stage:
+        assert len(stage) == 4
+
+    assert _write_chunks(path, [4], first=4) == 8
+    with StageFile(str(path)) as stage:
+        assert stage.column("id") == _chunk_rows(0, 8)["id"]
+
+
+def test_different_settings_are_refused(tmp_path):
+    path = tmp_path / "chunks.stage"
+    _write_chunks(path, [2])
+    with pytest.raises(ValueError):
+        _write_chunks(path, [2], meta={"chunk_size": 200})
+
+
+def test_float32_vectors_round_trip(tmp_path):
+    path = tmp_path / "embeddings.stage"
+    vectors = np.arange(24, dtype=np.float32).reshape(6, 4)
+    with StageWriter(str(path), EMBEDDINGS, EMBEDDING_COLUMNS, {"model": "test"}) as writer:
+        for start in (0, 3):
+            writer.append({"id": [f"c{i}" for i in range(start, start + 3)],
+                           "chunk_row": list(range(start, start + 3)),
+                           "embedding": vectors[start:start + 3]})
+        with pytest.raises(ValueError):
+            writer.append({"id": ["x"], "chunk_row": [6], "embedding": [[1.0, 2.0]]})
+
+    stage = open_stage_file(str(path), EMBEDDINGS)
+    assert np.array_equal(stage.column("embedding"), vectors)
+    assert stage.column("embedding", 2, 4).shape == (2, 4)
+    assert stage.column("chunk_row", 5).tolist() == [5]
+    stage.close()
+    assert open_stage_file(str(tmp_path / "missing.stage"), EMBEDDINGS) is None
@@ -0,0 +1,90 @@
+"""
+Tests for single-writer snapshot publishing.
+"""
+
+import os
+import sqlite3
+import time
+
+import pytest
+
+from store_access import (SnapshotPublisher, SnapshotReader, StoreLockedError, WriterLock,
+                          current_snapshot)
+
+
+def _store(tmp_path):
+    store = tmp_path / "chroma_db"
+    (store / "segment").mkdir(parents=True)
+    db = sqlite3.connect(str(store / "chroma.sqlite3"))
+    db.execute("CREATE TABLE t (x)")
+    db.commit()
+    db.close()
+    (store / "segment" / "data_level0.bin").write_bytes(b"\0" * 64)
+    return store
+
+
+def _generations(publisher):
+    return sorted(name for name in os.listdir(publisher.root) if name.isdigit())
+
+
+def test_snapshot_is_a_consistent_copy(tmp_path):
+    store = _store(tmp_path)
+    publisher = SnapshotPublisher(str(store))
+    path = publisher.publish()
+
+    assert current_snapshot(publisher.root) == path
+    assert (open(os.path.join(path, "segment", "data_level0.bin"), 'rb').read() == b"\0" * 64)
+    db = sqlite3.connect(os.path.join(path, "chroma.sqlite3"))
+    assert db.execute("SELECT name FROM sqlite_master").fetchall() == [("t",)]
+    db.close()
+
+
+def test_requests_within_the_interval_are_published_together(tmp_path):
+    store = _store(tmp_path)
+    publisher = SnapshotPublisher(str(store), keep=10, min_interval=60)
+
+    assert publisher.request() is not None
+    assert publisher.request() is None
+    assert publisher.request() is None
+    assert publisher.published == 1
+
+    assert publisher.flush() is not None
+    assert publisher.published == 2
+    assert publisher.flush() is None
+
+
+def test_deferred_publish_happens_when_the_interval_ends(tmp_path):
+    store = _store(tmp_path)
+    publisher = SnapshotPublisher(str(store), keep=10, min_interval=0.2)
+    publisher.request()
+    for _ in range(5):
+        publisher.request()
+    deadline = time.monotonic() + 5
+    while publisher.published < 2 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert publisher.published == 2
+    assert len(_generations(publisher)) == 2
+
+
+def test_old_snapshots_are_pruned_unless_a_reader_holds_them(tmp_path):
+    store = _store(tmp_path)
+    publisher = SnapshotPublisher(str(store), keep=1)
+    publisher.publish()
+    reader = SnapshotReader(str(store))
+    held = reader.path
+
+    publisher.publish()
+    publisher.publish()
+    assert os.path.basename(held) in _generations(publisher)
+
+    reader.close()
+    publisher.publish()
+    assert os.path.basename(held) not in _generations(publisher)
+    assert len(_generations(publisher)) == 1
+
+
+def test_second_writer_is_refused(tmp_path):
+    store = _store(tmp_path)
+    with WriterLock(str(store)):
+        with pytest.raises(StoreLockedError):
+            WriterLock(str(store)).acquire()
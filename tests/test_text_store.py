@@ -0,0 +1,118 @@
+"""
+On-disk format tests for the compressed text side store.
+"""
+
+import os
+import struct
+import time
+
+from text_store import DOC_KEY, END_KEY, START_KEY, TextSideStore, locate_chunks
+
+
+def test_put_and_get_spans_across_blocks(tmp_path):
+    store = TextSideStore(str(tmp_path), block_size=16)
+    text = "The quick brown fox jumps over the lazy dog. " * 5 + "Ünïcödé ends here."
+    doc_id = store.put(text)
+    data = text.encode("utf-8")
+
+    for start, end in [(0, 0), (0, 10), (10, 40), (15, 17), (0, len(data)), (len(data) - 20, len(data))]:
+        assert store.get(doc_id, start, end) == data[start:end].decode("utf-8")
+    store.close()
+
+    # A fresh store reads the same file
+    reopened = TextSideStore(str(tmp_path))
+    assert reopened.get(doc_id, 0, len(data)) == text
+    reopened.close()
+
+
+def test_file_header(tmp_path):
+    store = TextSideStore(str(tmp_path), block_size=8)
+    doc_id = store.put("0123456789abcdefXYZ")
+    store.close()
+
+    data = (tmp_path / f"{doc_id}.blocks").read_bytes()
+    assert data[:8] == b"TXTBLK01"
+    assert struct.unpack_from("<IIQ", data, 8) == (8, 3, 19)
+
+
+def test_identical_texts_share_one_file(tmp_path):
+    store = TextSideStore(str(tmp_path))
+    assert store.put("same text") == store.put("same text")
+    assert len(list(tmp_path.glob("*.blocks"))) == 1
+    store.close()
+
+
+def test_put_chunks_and_resolve(tmp_path):
+    store = TextSideStore(str(tmp_path), block_size=32)
+    text = "alpha beta gamma delta epsilon zeta eta theta iota kappa"
+    chunks = ["alpha beta gamma", "gamma delta epsilon", "iota kappa"]
+    metadatas = store.put_chunks(text, chunks)
+
+    assert all({DOC_KEY, START_KEY, END_KEY} <= set(m) for m in metadatas)
+    assert store.resolve([None, "kept", None], metadatas) == [chunks[0], "kept", chunks[2]]
+    store.close()
+
+
+def test_locate_chunks_spans_are_byte_offsets():
+    text = "héllo wörld, héllo again"
+    chunks = ["héllo wörld", "wörld, héllo", "again"]
+    data = text.encode("utf-8")
+    spans = locate_chunks(text, chunks)
+    assert [data[start:end].decode("utf-8") for start, end in spans] == chunks
+
+
+def test_unlocated_chunk_is_stored_on_its_own(tmp_path):
+    store = TextSideStore(str(tmp_path))
+    text = "alpha beta\n\ngamma delta"
+    chunks = ["alpha beta", "beta gamma"]
+    assert locate_chunks(text, chunks)[1] is None
+
+    metadatas = store.put_chunks(text, chunks)
+    assert metadatas[1][DOC_KEY] != metadatas[0][DOC_KEY]
+    assert store.resolve([None, None], metadatas) == chunks
+    store.close()
+
+
+def test_remove_deletes_side_files(tmp_path):
+    store = TextSideStore(str(tmp_path))
+    kept, removed = store.put("kept text"), store.put("removed text")
+    assert store.get(removed, 0, 7) == "removed"
+
+    assert store.remove([removed, "missing"]) == [removed]
+    assert store.doc_ids() == [kept]
+    store.close()
+
+
+def test_remove_keeps_recently_used_files(tmp_path):
+    store = TextSideStore(str(tmp_path))
+    doc_id = store.put("fresh text")
+    assert store.remove([doc_id], min_age=60) == []
+
+    # put() of an existing text marks it as used again
+    old = time.time() - 120
+    os.utime(tmp_path / f"{doc_id}.blocks", (old, old))
+    store.put("fresh text")
+    assert store.remove([doc_id], min_age=60) == []
+    store.close()
+
+
+def test_deleting_a_document_removes_its_side_file(rag, make_pdf):
+    name = "text_store_cleanup"
+    kept = make_pdf("kept.pdf", ["Embeddings are stored in the vector database. " * 20])
+    dropped = make_pdf("dropped.pdf", ["Gemini writes the final answer from the context. " * 20])
+    rag.upsert_document(kept, name, use_cache=False, compress_text=True)
+    rag.upsert_document(dropped, name, use_cache=False, compress_text=True)
+    collection = rag.client.get_collection(rag.aliases.resolve(name))
+    doc_ids = {metadata[DOC_KEY] for metadata in collection.get(include=["metadatas"])["metadatas"]}
+    assert len(doc_ids) == 2 and set(rag.text_store.doc_ids()) >= doc_ids
+
+    # Only files older than the grace period are removed
+    rag.delete_document(dropped, name)
+    assert set(rag.text_store.doc_ids()) >= doc_ids
+
+    assert rag.collect_text_garbage(doc_ids, min_age=0) != []
+    remaining = {metadata[DOC_KEY] for metadata in collection.get(include=["metadatas"])["metadatas"]}
+    assert set(rag.text_store.doc_ids()) & doc_ids == remaining
+    assert len(remaining) == 1
+    rag.client.delete_collection(collection.name)
+    rag.router.remove(name)